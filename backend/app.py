@@ -1,5 +1,11 @@
+if __name__ == '__main__':
+    # Before any other import, so sockets and locks created below are green.
+    from database import cooperative
+    cooperative.patch()
+
 from flask import Flask, send_from_directory, request, make_response, jsonify
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from routes.auth import auth_routes
 from routes.events import events_routes
 from routes.blog import blog_routes
@@ -11,9 +17,23 @@ from routes.learning import learning_routes
 from routes.forum import forum_routes
 from routes.users import users_routes
 from routes.achievements import achievements_routes
+from routes.batch import batch_routes
 from models.websockets import create_socketio
+from models.jobs import Jobs
+from models.reference_data import ReferenceData
+from models import json_provider
+from database import instrumentation
+from database import replicas
+from models import metrics
+from models.rate_limit import TRUSTED_PROXY_HOPS
+from routes.metrics import metrics_routes
+from routes.profiler import profiler_routes
+from routes.health import health_routes
+from models import profiler
+from models import hub_watchdog
 from dotenv import load_dotenv
 import os
+import sys
 import logging
 
 logging.basicConfig(level=logging.WARNING)
@@ -22,8 +42,18 @@ logging.getLogger("engineio.server").setLevel(logging.WARNING)
 
 load_dotenv()
 
-def create_app():
+def create_app(with_socketio=True):
+    # with_socketio=False leaves Socket.IO to the caller (asgi.py) and returns None for it.
     app = Flask(__name__)
+    if TRUSTED_PROXY_HOPS:
+        # request.remote_addr becomes the caller's address as the trusted proxies saw it.
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+    json_provider.init_app(app)
+    instrumentation.init_app(app)
+    replicas.init_app(app)
+    metrics.init_app(app)
+    profiler.init_app(app)
+    hub_watchdog.init_app(app)
     
     app.config['SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key')
     app.config['ENV'] = os.getenv('FLASK_ENV', 'production')
@@ -36,13 +66,13 @@ def create_app():
         resources={r"/*": {
             "origins": allowed_origins.split(','),
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization", "Accept"],
+            "allow_headers": ["Content-Type", "Authorization", "Accept", "If-None-Match", "If-Modified-Since", "X-Profile"],
             "supports_credentials": True
         }},
         supports_credentials=True
     )
 
-    socketio = create_socketio(app)
+    socketio = create_socketio(app) if with_socketio else None
     
     app.register_blueprint(auth_routes, url_prefix='/auth')
     app.register_blueprint(events_routes, url_prefix='/events')
@@ -55,13 +85,23 @@ def create_app():
     app.register_blueprint(forum_routes, url_prefix='/forum')
     app.register_blueprint(users_routes, url_prefix='/users')
     app.register_blueprint(achievements_routes, url_prefix='/achievements')
+    app.register_blueprint(batch_routes, url_prefix='/batch')
+    app.register_blueprint(metrics_routes, url_prefix='/metrics')
+    app.register_blueprint(profiler_routes, url_prefix='/admin/profiler')
+    app.register_blueprint(health_routes, url_prefix='/health')
+
+    try:
+        ReferenceData.load()
+    except Exception as e:
+        logger.error(f"Error preloading reference data: {str(e)}")
 
     @app.after_request
     def after_request(response):
         response.headers.update({
             'Access-Control-Allow-Origin': '*',
             'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type, Authorization, Accept'
+            'Access-Control-Allow-Headers': 'Content-Type, Authorization, Accept, If-None-Match, If-Modified-Since, X-Profile',
+            'Access-Control-Expose-Headers': 'ETag, Last-Modified, X-Next-Cursor, Server-Timing, X-Profile-Id, Retry-After'
         })
         return response
 
@@ -103,20 +143,27 @@ def create_app():
     return app, socketio
 
 if __name__ == '__main__':
-    app, socketio = create_app()
-    
-    
-    print("Starting server with eventlet...")
-    logger.info("Binding to 127.0.0.1:5000")
-    
     host = os.getenv('FLASK_HOST', '127.0.0.1')
     port = int(os.getenv('FLASK_PORT', 5000))
-    debug = os.getenv('FLASK_DEBUG', 'False').lower() in ('true', '1', 't')
+    workers = int(os.getenv('WEB_WORKERS', 1))
     
-    socketio.run(
-        app,
-        host=host,
-        port=port,
-        debug=False
-    )
-
+    if os.getenv('SERVER_RUNTIME', 'eventlet').lower() == 'asgi':
+        asgi = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'asgi.py')
+        os.execv(sys.executable, [sys.executable, asgi])
+    elif workers > 1:
+        # The launcher sets per-worker defaults before anything is imported, so start it fresh.
+        launcher = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'launcher.py')
+        os.execv(sys.executable, [sys.executable, launcher])
+    else:
+        app, socketio = create_app()
+        Jobs.start_scheduler()
+        
+        print("Starting server with eventlet...")
+        logger.info(f"Binding to {host}:{port}")
+        
+        socketio.run(
+            app,
+            host=host,
+            port=port,
+            debug=False
+        )
@@ -0,0 +1,284 @@
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Defaults for this runtime, set before the app's modules read them: no eventlet
+# patching or hub watchdog, and the C connector for the Flask views, which run on
+# plain threads here.
+os.environ.setdefault('DB_IO_MODE', 'blocking')
+os.environ.setdefault('HUB_WATCHDOG', '0')
+os.environ.setdefault('SOCKETIO_LOGGER', '0')
+
+import asyncio
+import json
+import logging
+import re
+import resource
+import secrets
+import subprocess
+import tempfile
+import threading
+import time
+
+import socketio
+
+from app import create_app
+from database import instrumentation
+from database.async_connection import AsyncDatabase
+from models import json_provider, metrics, socket_broker
+from models.async_websockets import bind_loop, create_async_socketio
+from models.auth import AsyncAuth
+from models.chat import AsyncChat
+from models.jobs import Jobs
+from models.notification import AsyncNotification
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    WSGIMiddleware = None
+
+logger = logging.getLogger('asgi')
+
+# asyncio runtime: one event loop per process serving Socket.IO and the hottest HTTP
+# endpoints as native coroutines on an aiomysql pool, with every other route handled
+# by the Flask app on a thread pool. Both sides share the query plans in the models
+# (database/query_layer.py), so either runtime gives the same answers.
+#
+#   SERVER_RUNTIME=asgi python app.py      or      python asgi.py
+#   uvicorn --factory asgi:create_asgi_app --host 0.0.0.0 --port 5000
+#
+# With ASGI_WORKERS > 1 the processes share Socket.IO rooms through
+# SOCKETIO_MESSAGE_QUEUE and their rate limits (and read-your-writes pins) through
+# RATE_LIMIT_STORE; a broker and a store are started for whichever is unset.
+
+ASGI_WORKERS = int(os.getenv('ASGI_WORKERS', 1))
+# Threads running the Flask views that have no coroutine version.
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 32))
+# Whether this process runs the scheduled jobs; with several workers, only the parent does.
+ASGI_RUN_SCHEDULER = os.getenv('ASGI_RUN_SCHEDULER', '1').lower() in ('1', 'true', 't')
+DEFAULT_BROKER = 'broker://127.0.0.1:7071'
+DEFAULT_STORE = '127.0.0.1:7070'
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-methods', b'GET, POST, PUT, DELETE, OPTIONS'),
+    (b'access-control-allow-headers', b'Content-Type, Authorization, Accept, If-None-Match, If-Modified-Since, X-Profile'),
+    (b'access-control-expose-headers', b'ETag, Last-Modified, X-Next-Cursor, Server-Timing, X-Profile-Id, Retry-After')
+]
+
+
+# Coroutine versions of Flask routes, answering in the same shape. Each gets the
+# authenticated user, the decoded JSON body and the path's captured ids.
+
+async def notifications_unread(user, body):
+    result = await AsyncNotification.get_unread_count(user['id'])
+    return 200, {'success': True, **result}
+
+
+async def chat_all_unread(user, body):
+    unread_counts = await AsyncChat.get_all_unread_counts(user['id'])
+    return 200, {'success': True, 'unread_counts': unread_counts}
+
+
+async def chat_room_unread(user, body, room_id):
+    unread_count = await AsyncChat.get_unread_count(room_id, user['id'])
+    return 200, {'success': True, 'unread_count': unread_count}
+
+
+async def chat_join_room(user, body, room_id):
+    if await AsyncChat.join_room(room_id, user['id']):
+        return 200, {'message': 'Successfully joined room', 'room_id': room_id}
+    return 500, {'error': 'Failed to join room'}
+
+
+async def chat_send_message(user, body, room_id):
+    if not isinstance(body, dict) or not isinstance(body.get('content'), str):
+        return 400, {'error': 'Message content is required'}
+    content = body['content'].strip()
+    if not content:
+        return 400, {'error': 'Message content cannot be empty'}
+
+    result = await AsyncChat.send_message(room_id, user['id'], content)
+    if result is None:
+        return 403, {'error': 'Not a participant of this room'}
+    if not result['message']:
+        return 500, {'error': 'Failed to create message'}
+    return 201, {'success': True, 'message': result['message']}
+
+
+NATIVE_ROUTES = [
+    ('GET', re.compile(r'^/notifications/unread$'), 'notifications.get_unread_count', notifications_unread),
+    ('GET', re.compile(r'^/chat/rooms/unread$'), 'chat.get_all_unread_counts', chat_all_unread),
+    ('GET', re.compile(r'^/chat/rooms/(\d+)/unread$'), 'chat.get_unread_count', chat_room_unread),
+    ('POST', re.compile(r'^/chat/rooms/(\d+)/join$'), 'chat.join_room', chat_join_room),
+    ('POST', re.compile(r'^/chat/rooms/(\d+)/messages$'), 'chat.send_message', chat_send_message),
+]
+
+
+class NativeRoutes:
+    # ASGI app answering NATIVE_ROUTES itself and passing everything else (including
+    # CORS preflights) to fallback, the Flask app.
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self.metrics = {}
+
+    def _match(self, scope):
+        for method, pattern, endpoint, handler in NATIVE_ROUTES:
+            if scope['method'] == method:
+                match = pattern.match(scope['path'])
+                if match:
+                    return endpoint, handler, [int(value) for value in match.groups()]
+        return None
+
+    async def __call__(self, scope, receive, send):
+        route = self._match(scope) if scope['type'] == 'http' else None
+        if route is None:
+            return await self.fallback(scope, receive, send)
+
+        started = time.perf_counter()
+        endpoint, handler, args = route
+        with instrumentation.track(f"{scope['method']} {scope['path']}") as stats:
+            status, payload = await self._dispatch(scope, receive, handler, args)
+            server_timing = stats.server_timing()
+
+        headers = [(b'content-type', b'application/json'), (b'server-timing', server_timing.encode()),
+                   (b'timing-allow-origin', b'*')] + CORS_HEADERS
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': json_provider.dumps(payload).encode()})
+        self._record(endpoint, scope['method'], status, time.perf_counter() - started)
+
+    async def _dispatch(self, scope, receive, handler, args):
+        headers = dict(scope['headers'])
+        authorization = headers.get(b'authorization', b'').decode('latin-1') or None
+        user = await AsyncAuth.current_user(authorization)
+        if not user:
+            return 401, {'error': 'Authentication required'}
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = None
+
+        try:
+            return await handler(user, data, *args)
+        except Exception as e:
+            logger.error(f"Error in {handler.__name__}: {str(e)}", exc_info=True)
+            return 500, {'error': str(e)}
+
+    def _record(self, endpoint: str, method: str, status: int, duration: float):
+        # Same labels as the Flask route, so dashboards do not depend on the runtime.
+        key = (endpoint.split('.')[0], endpoint, method)
+        children = self.metrics.get(key)
+        if children is None:
+            children = self.metrics[key] = (metrics.HTTP_REQUEST_SECONDS.labels(*key), {})
+        histogram, statuses = children
+        histogram.observe(duration)
+        counter = statuses.get(status)
+        if counter is None:
+            counter = statuses[status] = metrics.HTTP_REQUESTS.labels(*key, status)
+        counter.inc()
+
+
+def create_asgi_app():
+    if WSGIMiddleware is None:
+        raise RuntimeError("The ASGI runtime needs a2wsgi: pip install a2wsgi")
+    flask_app, _ = create_app(with_socketio=False)
+    sio = create_async_socketio()
+    Jobs.use_threads()
+
+    async def startup():
+        bind_loop(asyncio.get_running_loop())
+        if ASGI_RUN_SCHEDULER:
+            Jobs.start_scheduler()
+        metrics.start_snapshots()
+
+    async def shutdown():
+        metrics.write_snapshot()
+        await AsyncDatabase.close()
+
+    http = NativeRoutes(WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS))
+    return socketio.ASGIApp(sio, other_asgi_app=http, on_startup=startup, on_shutdown=shutdown)
+
+
+def _raise_open_file_limit():
+    # Every websocket holds a file descriptor; allow as many as the hard limit permits.
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError) as e:
+            logger.warning(f"Cannot raise the open file limit: {str(e)}")
+
+
+def main():
+    import uvicorn
+
+    host = os.getenv('FLASK_HOST', '127.0.0.1')
+    port = int(os.getenv('FLASK_PORT', 5000))
+    _raise_open_file_limit()
+
+    services = []
+    aggregator = None
+    if ASGI_WORKERS > 1:
+        # One release id for every worker, so their HTTP cache ETags agree.
+        os.environ.setdefault('RELEASE_ID', secrets.token_hex(8))
+        # The workers import the app afresh and publish metric snapshots for this
+        # process to sum (see models/metrics.py).
+        metrics_base = os.path.join(tempfile.gettempdir(), f"green-buddy-metrics-{os.getpid()}")
+        os.environ['METRICS_SNAPSHOT_DIR'] = metrics_base
+        os.environ['METRICS_FILE'] = f"{metrics_base}.prom"
+        aggregator = metrics.MetricsAggregator(metrics_base, f"{metrics_base}.prom")
+
+        def collect_metrics():
+            while True:
+                time.sleep(metrics.METRICS_SNAPSHOT_INTERVAL)
+                aggregator.collect()
+
+        threading.Thread(target=collect_metrics, name='metrics-aggregator', daemon=True).start()
+        backend_dir = os.path.dirname(os.path.abspath(__file__))
+        if not os.getenv('SOCKETIO_MESSAGE_QUEUE'):
+            os.environ['SOCKETIO_MESSAGE_QUEUE'] = DEFAULT_BROKER
+            socket_broker.generate_token()
+            services.append(subprocess.Popen([sys.executable, '-m', 'models.socket_broker', 'serve', DEFAULT_BROKER],
+                                             cwd=backend_dir))
+        if not os.getenv('RATE_LIMIT_STORE'):
+            # The workers import the app afresh and pick these up.
+            os.environ['RATE_LIMIT_STORE'] = DEFAULT_STORE
+            os.environ.setdefault('RATE_LIMIT_AUTHKEY', secrets.token_hex(32))
+            services.append(subprocess.Popen([sys.executable, '-m', 'models.rate_limit', 'serve', DEFAULT_STORE],
+                                             cwd=backend_dir))
+        # Scheduled jobs run here in the parent, once, not in every worker.
+        os.environ['ASGI_RUN_SCHEDULER'] = '0'
+        Jobs.use_threads()
+        Jobs.start_scheduler()
+
+    logger.info(f"Serving ASGI on {host}:{port} with {ASGI_WORKERS} workers")
+    try:
+        uvicorn.run(
+            'asgi:create_asgi_app',
+            factory=True,
+            host=host,
+            port=port,
+            workers=ASGI_WORKERS,
+            backlog=2048,
+            log_level='warning'
+        )
+    finally:
+        for service in services:
+            service.terminate()
+        if aggregator is not None:
+            aggregator.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+# Per-call cost of the hot query plans under each part of the database fast path,
+# switched on one at a time: the connector's C extension, the connection pool,
+# tuple rows with the row mapper, and server-side prepared statements. Runs the plans
+# sequentially in this process against the database from .env; writes are rolled back.
+#
+#   python benchmarks/db_fast_path.py --iterations 2000
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_ROOT)
+os.environ.setdefault('DB_IO_MODE', 'blocking')
+
+from database import connection, cooperative, query_layer
+from database.query_layer import Statement, run_plan
+from models.auth import AuthQueries
+from models.chat import ChatQueries
+from models.notification import NotificationQueries
+
+# name -> (DB_C_EXTENSION, DB_POOL_SIZE, DB_TUPLE_ROWS, DB_PREPARED_STATEMENTS)
+CONFIGS = {
+    'baseline': (False, 0, False, False),
+    'cext': (True, 0, False, False),
+    'pool': (True, 4, False, False),
+    'tuples': (True, 4, True, False),
+    'prepared': (True, 4, True, True),
+}
+
+
+def recent_messages(limit: int):
+    # A wider result, where building the row dicts shows.
+    rows = yield Statement(
+        "SELECT id, room_id, sender_id, content, created_at FROM chat_messages ORDER BY id DESC LIMIT %s",
+        (limit,)
+    )
+    return rows
+
+
+def iter_one(statement: Statement):
+    return (yield statement)
+
+
+def fixtures():
+    row = run_plan(iter_one(Statement(
+        "SELECT room_id, user_id FROM chat_room_participants LIMIT 1", fetch='one'
+    )))
+    if row is None:
+        user = run_plan(iter_one(Statement("SELECT id FROM users LIMIT 1", fetch='one')))
+        if user is None:
+            raise SystemExit("The benchmark needs at least one user in the database")
+        return None, user['id']
+    return row['room_id'], row['user_id']
+
+
+def workload(room_id, user_id, rows: int):
+    plans = [
+        ('auth', lambda: run_plan(AuthQueries.current_user(user_id))),
+        ('notification_count', lambda: run_plan(NotificationQueries.unread_count(user_id))),
+        ('chat_unread', lambda: run_plan(ChatQueries.all_unread_counts(user_id))),
+        ('messages', lambda: run_plan(recent_messages(rows))),
+    ]
+    if room_id is not None:
+        # Not committed: the pool, or the connection's close, rolls it back.
+        plans.append(('chat_insert', lambda: run_plan(ChatQueries.create_message(room_id, user_id, 'benchmark'))))
+    return plans
+
+
+def configure(name: str):
+    c_extension, pool_size, tuple_rows, prepared = CONFIGS[name]
+    drain_pool()
+    cooperative.DB_C_EXTENSION = c_extension
+    connection.DB_POOL_SIZE = pool_size
+    query_layer.DB_TUPLE_ROWS = tuple_rows
+    query_layer.DB_PREPARED_STATEMENTS = prepared
+
+
+def drain_pool():
+    for idle in connection._idle_connections.values():
+        while idle:
+            idle.pop()[0].close()
+
+
+def measure(plans, iterations: int) -> dict:
+    results = {}
+    for name, call in plans:
+        for _ in range(min(50, iterations)):
+            call()
+        durations = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            call()
+            durations.append(time.perf_counter() - started)
+        durations.sort()
+        results[name] = (statistics.mean(durations) * 1e6, durations[int(len(durations) * 0.95) - 1] * 1e6)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Database fast path benchmark')
+    parser.add_argument('--iterations', type=int, default=1000, help='calls per plan and configuration')
+    parser.add_argument('--rows', type=int, default=200, help='rows fetched by the messages plan')
+    parser.add_argument('--configs', default=','.join(CONFIGS))
+    args = parser.parse_args()
+
+    room_id, user_id = fixtures()
+    plans = workload(room_id, user_id, args.rows)
+    names = [name for name, _ in plans]
+    print(f"{args.iterations} calls per plan; mean / p95 in microseconds")
+    print(f"{'config':<10}" + ''.join(f"{name:>22}" for name in names))
+    for config in args.configs.split(','):
+        configure(config)
+        results = measure(plans, args.iterations)
+        print(f"{config:<10}" + ''.join(f"{results[name][0]:>12.0f} /{results[name][1]:>8.0f}" for name in names))
+    drain_pool()
+
+
+if __name__ == '__main__':
+    main()
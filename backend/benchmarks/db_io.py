@@ -0,0 +1,118 @@
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Concurrent request throughput of an eventlet WSGI server whose requests each wait on
+# MySQL, for every DB_IO_MODE. Latency is simulated with SELECT SLEEP, so the numbers
+# show how much of that wait the server overlaps across requests. Uses the database
+# from .env:
+#
+#   python benchmarks/db_io.py --latency 0.05 --concurrency 50 --requests 500
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('blocking', 'tpool', 'green')
+
+
+def serve(mode: str, port: int, latency: float):
+    # Server side, run in a subprocess per mode since patching is process-wide.
+    os.environ['DB_IO_MODE'] = mode
+    sys.path.insert(0, BACKEND_ROOT)
+    from database import cooperative
+    cooperative.patch()
+
+    import eventlet
+    from eventlet import wsgi
+    from database.connection import Database
+
+    def app(environ, start_response):
+        conn = Database().get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT SLEEP(%s)", (latency,))
+            cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+        start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '2')])
+        return [b'ok']
+
+    wsgi.server(eventlet.listen(('127.0.0.1', port)), app, log_output=False)
+
+
+def _wait_for_port(port: int, timeout: float = 15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Benchmark server did not start on port {port}")
+
+
+def _request(port: int) -> float:
+    started = time.perf_counter()
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        connection.request('GET', '/')
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}")
+    finally:
+        connection.close()
+    return time.perf_counter() - started
+
+
+def run(mode: str, port: int, latency: float, concurrency: int, requests: int) -> dict:
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'serve', mode, str(port), str(latency)])
+    try:
+        _wait_for_port(port)
+        _request(port)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            durations = sorted(executor.map(lambda _: _request(port), range(requests)))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        'mode': mode,
+        'requests_per_s': requests / elapsed,
+        'p50_ms': statistics.median(durations) * 1000,
+        'p95_ms': durations[int(len(durations) * 0.95) - 1] * 1000,
+        # Throughput if every request overlapped its database wait perfectly.
+        'ideal_requests_per_s': concurrency / latency
+    }
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve(sys.argv[2], int(sys.argv[3]), float(sys.argv[4]))
+        return
+
+    parser = argparse.ArgumentParser(description='Database I/O mode throughput benchmark')
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated query time in seconds')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--modes', default=','.join(MODES))
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent, {args.latency * 1000:.0f} ms per query")
+    print(f"{'mode':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'ideal req/s':>14}")
+    for mode in args.modes.split(','):
+        result = run(mode, args.port, args.latency, args.concurrency, args.requests)
+        print(f"{result['mode']:<10}{result['requests_per_s']:>10.1f}{result['p50_ms']:>10.1f}"
+              f"{result['p95_ms']:>10.1f}{result['ideal_requests_per_s']:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
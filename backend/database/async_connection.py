@@ -0,0 +1,79 @@
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from database import query_layer
+from database.instrumentation import connection_opened
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+load_dotenv()
+
+# Connection pool of the ASGI runtime (asgi.py), per process. Coroutines wait for a free
+# connection instead of each opening one, so thousands of idle websockets cost no
+# database connections at all.
+ASYNC_DB_POOL_MIN = int(os.getenv('ASYNC_DB_POOL_MIN', 1))
+ASYNC_DB_POOL_MAX = int(os.getenv('ASYNC_DB_POOL_MAX', 20))
+# Seconds before a pooled connection is replaced, below MariaDB's wait_timeout.
+ASYNC_DB_POOL_RECYCLE = int(os.getenv('ASYNC_DB_POOL_RECYCLE', 3600))
+
+
+class AsyncDatabase:
+    # The pool is created on first use, inside the running event loop, from the same
+    # settings as Database.
+
+    _pool = None
+    _lock = None
+
+    @staticmethod
+    async def pool():
+        if AsyncDatabase._pool is None:
+            if aiomysql is None:
+                raise RuntimeError("The ASGI runtime needs aiomysql: pip install aiomysql")
+            if AsyncDatabase._lock is None:
+                AsyncDatabase._lock = asyncio.Lock()
+            async with AsyncDatabase._lock:
+                if AsyncDatabase._pool is None:
+                    AsyncDatabase._pool = await aiomysql.create_pool(
+                        host=os.getenv('DB_HOST', 'localhost'),
+                        user=os.getenv('DB_USER', 'root'),
+                        password=os.getenv('DB_PASSWORD', ''),
+                        db=os.getenv('DB_NAME', 'green_buddy'),
+                        port=int(os.getenv('DB_PORT', 3306)),
+                        connect_timeout=10,
+                        minsize=ASYNC_DB_POOL_MIN,
+                        maxsize=ASYNC_DB_POOL_MAX,
+                        pool_recycle=ASYNC_DB_POOL_RECYCLE,
+                        # Reads run outside a transaction, so a pooled connection
+                        # never serves a stale snapshot; run_plan begins one for writes.
+                        autocommit=True
+                    )
+                    connection_opened()
+        return AsyncDatabase._pool
+
+    @staticmethod
+    async def run_plan(plan, commit: bool = False):
+        # query_layer.run_plan for coroutines: commit=True runs the plan in a transaction.
+        pool = await AsyncDatabase.pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                if not commit:
+                    return await query_layer.run_async(plan, cursor)
+                await conn.begin()
+                try:
+                    result = await query_layer.run_async(plan, cursor)
+                    await conn.commit()
+                    return result
+                except BaseException:
+                    await conn.rollback()
+                    raise
+
+    @staticmethod
+    async def close():
+        pool, AsyncDatabase._pool = AsyncDatabase._pool, None
+        if pool is not None:
+            pool.close()
+            await pool.wait_closed()
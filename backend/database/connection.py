@@ -1,25 +1,210 @@
 import os
-import mysql.connector
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from mysql.connector import Error
 from dotenv import load_dotenv
+from database import cooperative, replicas
+from database.instrumentation import InstrumentedConnection, connection_opened
 
 load_dotenv()
 
+# Connection shared by every Database().get_connection() call inside connection_scope().
+_scoped_connection = ContextVar('scoped_connection', default=None)
+
+# InnoDB deadlock and lock wait timeout: the transaction was rolled back and can be rerun.
+RETRYABLE_ERRORS = (1213, 1205)
+TRANSACTION_ATTEMPTS = 3
+
+# Connections one process may hold open at once (0 for no limit), and how long a
+# caller waits for one before giving up. Set per worker by the launcher.
+DB_MAX_CONNECTIONS = int(os.getenv('DB_MAX_CONNECTIONS', 0))
+DB_CONNECTION_WAIT = float(os.getenv('DB_CONNECTION_WAIT', 10))
+_connection_slots = cooperative.Semaphore(DB_MAX_CONNECTIONS) if DB_MAX_CONNECTIONS > 0 else None
+
+# Idle connections each process keeps per server for reuse (0 to open one per call),
+# and the age in seconds after which one is closed rather than reused; keep it below
+# MariaDB's wait_timeout. Pooled connections keep their prepared statements
+# (database/query_layer.py) from one caller to the next.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 0))
+DB_POOL_RECYCLE = float(os.getenv('DB_POOL_RECYCLE', 3600))
+# (host, port) -> [(connection, opened_at)], most recently parked last.
+_idle_connections = {}
+_idle_pid = os.getpid()
+
+
+class LimitedConnection(InstrumentedConnection):
+    # Returns its slot under DB_MAX_CONNECTIONS when closed, or when collected unclosed.
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._released = False
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            _connection_slots.release()
+
+    def close(self):
+        try:
+            return self._connection.close()
+        finally:
+            self._release()
+
+    def __del__(self):
+        self._release()
+
+
+class PooledConnection:
+    # Proxy for a connection from the pool: close() ends any open transaction and parks
+    # the connection for the next caller instead of closing it.
+
+    def __init__(self, connection, key, opened_at: float):
+        self._connection = connection
+        self._key = key
+        self._opened_at = opened_at
+        self._parked = False
+
+    def close(self):
+        if not self._parked:
+            self._parked = True
+            _park(self._connection, self._key, self._opened_at)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def _idle(key):
+    global _idle_pid
+    if _idle_pid != os.getpid():
+        # In a forked worker the parent's connections are not ours to use or close.
+        _idle_connections.clear()
+        _idle_pid = os.getpid()
+    return _idle_connections.setdefault(key, [])
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Error as e:
+        print(f"Error closing pooled connection: {e}")
+
+
+def _checkout(key):
+    # list.pop is atomic, so Flask's worker threads may share the pool without a lock.
+    idle = _idle(key)
+    while True:
+        try:
+            connection, opened_at = idle.pop()
+        except IndexError:
+            return None
+        if time.time() - opened_at < DB_POOL_RECYCLE:
+            return PooledConnection(connection, key, opened_at)
+        _close_quietly(connection)
+
+
+def _park(connection, key, opened_at: float):
+    # Roll back so the next caller starts without this one's transaction or snapshot.
+    try:
+        if connection.in_transaction:
+            connection.rollback()
+        idle = _idle(key)
+        if len(idle) < DB_POOL_SIZE:
+            idle.append((connection, opened_at))
+            return
+    except Error as e:
+        print(f"Discarding pooled connection: {e}")
+    _close_quietly(connection)
+
+
+def _evict_idle():
+    # Close the oldest idle connection to free its DB_MAX_CONNECTIONS slot.
+    for key in list(_idle_connections):
+        try:
+            connection, _ = _idle(key).pop(0)
+        except IndexError:
+            continue
+        _close_quietly(connection)
+        return
+
+
+class ScopedConnection:
+    # Proxy handed out while a connection scope is active. close() is a no-op so
+    # model code written for per-call connections can share one connection; the
+    # scope closes the real connection when it exits.
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+@contextmanager
+def connection_scope():
+    # Share a single lazily opened connection for the duration of the block.
+    # The connection is not safe for concurrent use, so each green thread needs its own scope.
+    holder = {'connection': None}
+    token = _scoped_connection.set(holder)
+    try:
+        yield
+    finally:
+        _scoped_connection.reset(token)
+        connection = holder['connection']
+        if connection is not None:
+            try:
+                connection.rollback()
+                connection.close()
+            except Error as e:
+                print(f"Error closing scoped connection: {e}")
+
+
 class Database:
     def __init__(self):
         self.host = os.getenv('DB_HOST', 'localhost')
         self.user = os.getenv('DB_USER', 'root')
         self.password = os.getenv('DB_PASSWORD', '')
         self.database = os.getenv('DB_NAME', 'green_buddy')
+        self.port = int(os.getenv('DB_PORT', 3306))
 
     def get_connection(self):
+        holder = _scoped_connection.get()
+        if holder is not None:
+            if holder['connection'] is None:
+                holder['connection'] = self._open()
+            return ScopedConnection(holder['connection']) if holder['connection'] else None
+        return self._open()
+
+    def _open(self):
+        # With replicas configured, a connection that routes each statement (see
+        # database/replicas.py) and connects lazily; otherwise one to DB_HOST.
+        if replicas.replica_set.enabled:
+            return replicas.RoutedConnection(self)
+        return self._connect()
+
+    def _connect(self, host: str = None, port: int = None):
+        key = (host or self.host, port or self.port)
+        if DB_POOL_SIZE > 0:
+            pooled = _checkout(key)
+            if pooled is not None:
+                return pooled
+        if _connection_slots is not None and not _connection_slots.acquire(blocking=False):
+            # Idle pooled connections hold slots too; give one up before waiting.
+            _evict_idle()
+            if not _connection_slots.acquire(timeout=DB_CONNECTION_WAIT):
+                print(f"Error: no database connection slot free after {DB_CONNECTION_WAIT}s")
+                return None
         try:
-            connection = mysql.connector.connect(
-                host=self.host,
+            connection = cooperative.connect(
+                host=key[0],
                 user=self.user,
                 password=self.password,
                 database=self.database,
-                port=3306,  
+                port=key[1],  
                 connect_timeout=10  
             )
             if connection.is_connected():
@@ -28,9 +213,18 @@ class Database:
                 cursor.execute("select database();")
                 db_name = cursor.fetchone()[0]
                 cursor.close()
+                connection_opened()
+                if _connection_slots is not None:
+                    connection = LimitedConnection(connection)
+                else:
+                    connection = InstrumentedConnection(connection)
+                if DB_POOL_SIZE > 0:
+                    return PooledConnection(connection, key, time.time())
                 return connection
             else:
                 print("Connection object created but not connected")
+                if _connection_slots is not None:
+                    _connection_slots.release()
                 return None
         except Error as e:
             print("\n=== ERROR: Database Connection Failed ===")
@@ -39,4 +233,38 @@ class Database:
             print(f"Error code: {getattr(e, 'errno', 'N/A')}")
             print(f"SQL State: {getattr(e, 'sqlstate', 'N/A')}")
             print(f"Error details: {e}")
-            return None 
\ No newline at end of file
+            if _connection_slots is not None:
+                _connection_slots.release()
+            return None 
+
+
+def run_in_transaction(work, attempts: int = TRANSACTION_ATTEMPTS, isolation_level: str = 'READ COMMITTED'):
+    # Run work(cursor) in one transaction on one connection and commit, rerunning it
+    # after a deadlock or lock wait timeout. work must not commit or have side effects
+    # outside the database, since it may run more than once. It always runs on a
+    # connection of its own: inside connection_scope() the shared connection is
+    # usually mid-transaction already, and committing or rolling it back here would
+    # act on the rest of the scope's work too.
+    db = Database()
+    for attempt in range(1, attempts + 1):
+        conn = db._open()
+        if not conn:
+            raise Exception("Database connection failed")
+        cursor = conn.cursor(dictionary=True)
+        try:
+            conn.start_transaction(isolation_level=isolation_level)
+            result = work(cursor)
+            conn.commit()
+            return result
+        except Error as e:
+            conn.rollback()
+            if getattr(e, 'errno', None) not in RETRYABLE_ERRORS or attempt == attempts:
+                raise e
+            print(f"Retrying transaction after error {e.errno} (attempt {attempt})")
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            cursor.close()
+            conn.close()
+        time.sleep(random.uniform(0.01, 0.05) * attempt)
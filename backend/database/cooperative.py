@@ -0,0 +1,130 @@
+import os
+import threading
+
+import mysql.connector
+
+try:
+    import eventlet
+    import greenlet
+    from eventlet import patcher, tpool
+    from eventlet.semaphore import BoundedSemaphore as GreenSemaphore
+    _native_threading = patcher.original('threading')
+except ImportError:
+    eventlet = None
+    _native_threading = threading
+
+# How database I/O shares the eventlet hub:
+#   green     monkey-patch the standard library and use the pure-Python connector,
+#             whose sockets then yield to the hub while waiting on MySQL
+#   tpool     run connects and every connection/cursor call on eventlet's native
+#             thread pool (EVENTLET_THREADPOOL_SIZE threads) behind a proxy
+#   blocking  plain connector calls; each query stalls every green thread
+# An eventlet server with SOCKETIO_MESSAGE_QUEUE set is patched in every mode, since
+# the queue's client does socket I/O on the hub; the C extension's I/O stays native.
+DB_IO_MODE = os.getenv('DB_IO_MODE', 'green').lower()
+if eventlet is None:
+    DB_IO_MODE = 'blocking'
+
+# Use the connector's C extension (row decoding and protocol in C) when it is installed;
+# DB_C_EXTENSION=0 forces the pure-Python protocol. Green mode always uses the pure one.
+DB_C_EXTENSION = os.getenv('DB_C_EXTENSION', '1').lower() in ('1', 'true', 't')
+
+
+def patch():
+    # Monkey-patch an eventlet server process. Call it before anything creates sockets,
+    # threads or locks: first thing in app.py, or in a launcher worker right after it
+    # is forked (locks from before the fork should be a Lock below).
+    if eventlet is None or patcher.is_monkey_patched('socket'):
+        return
+    if DB_IO_MODE == 'green' or os.getenv('SOCKETIO_MESSAGE_QUEUE'):
+        eventlet.monkey_patch()
+
+
+class Lock:
+    # A lock created on first use in each process. One built at import time in the
+    # launcher's master would otherwise stay a real lock in a worker patched after the
+    # fork, and a green thread yielding on I/O while holding it would block the
+    # worker's only OS thread for every other green thread that wants it.
+
+    _creating = threading.Lock()
+
+    def __init__(self):
+        self._pid = None
+        self._lock = None
+
+    def _current(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with Lock._creating:
+                if self._pid != pid:
+                    self._lock = threading.Lock()
+                    self._pid = pid
+        return self._lock
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        return self._current().acquire(blocking, timeout)
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self._current().acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+def on_hub() -> bool:
+    # Whether the caller is a green thread of an eventlet hub (a request or job of an
+    # eventlet server), rather than a plain OS thread like the ASGI runtime's.
+    return eventlet is not None and greenlet.getcurrent().parent is not None
+
+
+class Semaphore:
+    # Bounded semaphore for the runtime the process turns out to run: an eventlet one
+    # when first used from a green thread, so waiting yields to the hub, otherwise a
+    # native one, which plain threads can wait on. Chosen again after a fork.
+
+    def __init__(self, value: int):
+        self.value = value
+        self._pid = None
+        self._semaphore = None
+
+    def _current(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with Lock._creating:
+                if self._pid != pid:
+                    if on_hub():
+                        self._semaphore = GreenSemaphore(self.value)
+                    else:
+                        self._semaphore = _native_threading.BoundedSemaphore(self.value)
+                    self._pid = pid
+        return self._semaphore
+
+    def acquire(self, blocking: bool = True, timeout: float = None) -> bool:
+        return self._current().acquire(blocking, timeout)
+
+    def release(self):
+        self._current().release()
+
+
+def run_off_hub(function, *args):
+    # Call a CPU-heavy function (one releasing the GIL) on eventlet's native thread
+    # pool when called from a green thread; plain threads just call it.
+    if on_hub():
+        return tpool.execute(function, *args)
+    return function(*args)
+
+
+def connect(**kwargs):
+    # Open a connection whose I/O cooperates with the hub according to DB_IO_MODE.
+    if DB_IO_MODE == 'green':
+        # The C extension reads its socket in C, out of reach of the patched socket module.
+        return mysql.connector.connect(use_pure=True, **kwargs)
+    use_pure = not (DB_C_EXTENSION and getattr(mysql.connector, 'HAVE_CEXT', False))
+    if DB_IO_MODE == 'tpool':
+        connection = tpool.execute(mysql.connector.connect, use_pure=use_pure, **kwargs)
+        return tpool.Proxy(connection, autowrap_names=('cursor',))
+    return mysql.connector.connect(use_pure=use_pure, **kwargs)
@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('sql')
+
+# Repeats of one statement shape within a request before it is reported as a likely N+1.
+N_PLUS_ONE_THRESHOLD = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 5))
+# Statements slower than this many milliseconds are logged individually.
+SLOW_QUERY_MS = float(os.getenv('SQL_SLOW_QUERY_MS', 200))
+SLOWEST_KEPT = 3
+
+# Process-wide observers (see models/metrics.py): called with each statement's duration,
+# on every connection opened, and with each instrumented socket event name.
+query_listeners: List[Callable[[float], None]] = []
+connection_listeners: List[Callable[[], None]] = []
+event_listeners: List[Callable[[str], None]] = []
+
+_current_stats: ContextVar[Optional['QueryStats']] = ContextVar('query_stats', default=None)
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*%s(?:\s*,\s*%s)*\s*\)', re.IGNORECASE)
+_VALUES_LIST = re.compile(r'\bVALUES\s*(\(\s*%s(?:\s*,\s*%s)*\s*\))(?:\s*,\s*\(\s*%s(?:\s*,\s*%s)*\s*\))+', re.IGNORECASE)
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+
+def statement_shape(statement) -> str:
+    # Reduce a statement to its shape so calls differing only in values compare equal.
+    if isinstance(statement, (bytes, bytearray)):
+        statement = statement.decode('utf-8', errors='replace')
+    shape = _WHITESPACE.sub(' ', str(statement)).strip()
+    shape = _IN_LIST.sub('IN (...)', shape)
+    shape = _VALUES_LIST.sub(r'VALUES \1, ...', shape)
+    shape = _STRING_LITERAL.sub('?', shape)
+    return _NUMBER_LITERAL.sub('?', shape)
+
+
+class QueryStats:
+    # Database work done on behalf of one request or socket event.
+
+    def __init__(self, name: str):
+        self.name = name
+        self.query_count = 0
+        self.db_time = 0.0
+        self.connections_opened = 0
+        self.shapes: Counter = Counter()
+        self.slowest: List[Tuple[float, str]] = []
+
+    def record(self, statement, duration: float):
+        shape = statement_shape(statement)
+        self.query_count += 1
+        self.db_time += duration
+        self.shapes[shape] += 1
+
+        self.slowest.append((duration, shape))
+        self.slowest.sort(key=lambda item: item[0], reverse=True)
+        del self.slowest[SLOWEST_KEPT:]
+
+        if duration * 1000 >= SLOW_QUERY_MS:
+            logger.warning(f"Slow query in {self.name} ({duration * 1000:.1f} ms): {shape[:500]}")
+
+    def merge(self, other: 'QueryStats'):
+        # Fold a nested scope (e.g. a batch sub-request) into this one.
+        self.query_count += other.query_count
+        self.db_time += other.db_time
+        self.connections_opened += other.connections_opened
+        self.shapes.update(other.shapes)
+        self.slowest = sorted(self.slowest + other.slowest, key=lambda item: item[0], reverse=True)[:SLOWEST_KEPT]
+
+    def repeated_shapes(self) -> List[Tuple[str, int]]:
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= N_PLUS_ONE_THRESHOLD]
+
+    def server_timing(self) -> str:
+        return (f'db;dur={self.db_time * 1000:.1f};desc="{self.query_count} queries", '
+                f'db-conn;desc="{self.connections_opened} opened"')
+
+    def summary(self) -> Dict:
+        return {
+            'scope': self.name,
+            'queries': self.query_count,
+            'db_ms': round(self.db_time * 1000, 1),
+            'connections': self.connections_opened,
+            'slowest': [{'ms': round(duration * 1000, 1), 'sql': shape[:200]} for duration, shape in self.slowest],
+            'repeated': [{'count': count, 'sql': shape[:200]} for shape, count in self.repeated_shapes()]
+        }
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current_stats.get()
+
+
+def begin(name: str):
+    # Start collecting for a scope; returns a token for end().
+    return _current_stats.set(QueryStats(name))
+
+
+def end(token) -> Optional[QueryStats]:
+    # Stop collecting, log the scope and fold it into the enclosing scope, if any.
+    stats = _current_stats.get()
+    _current_stats.reset(token)
+    if stats is None:
+        return None
+
+    parent = _current_stats.get()
+    if parent is not None:
+        parent.merge(stats)
+
+    for shape, count in stats.repeated_shapes():
+        logger.warning(f"Possible N+1 in {stats.name}: {count} x {shape[:300]}")
+    if stats.query_count:
+        logger.info(json.dumps(stats.summary()))
+    return stats
+
+
+@contextmanager
+def track(name: str):
+    token = begin(name)
+    try:
+        yield _current_stats.get()
+    finally:
+        end(token)
+
+
+def instrument_event(name: str):
+    # Decorator collecting query stats for a Socket.IO event handler.
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            for listener in event_listeners:
+                listener(name)
+            with track(f"socket:{name}"):
+                return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+def instrument_async_event(name: str):
+    # instrument_event for coroutine handlers (the ASGI runtime).
+    def decorator(f):
+        @wraps(f)
+        async def decorated(*args, **kwargs):
+            for listener in event_listeners:
+                listener(name)
+            with track(f"socket:{name}"):
+                return await f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+def record_query(statement, duration: float):
+    # Report one statement's duration to the listeners and the current scope.
+    for listener in query_listeners:
+        listener(duration)
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(statement, duration)
+
+
+def connection_opened():
+    for listener in connection_listeners:
+        listener()
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.connections_opened += 1
+
+
+class InstrumentedCursor:
+    # Cursor proxy timing every statement into the current scope's stats.
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            record_query(operation, time.perf_counter() - started)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    # Connection proxy handing out instrumented cursors.
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._prepared: Dict[str, InstrumentedCursor] = {}
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs))
+
+    def prepared_cursor(self, statement: str) -> InstrumentedCursor:
+        # A server-side prepared statement for statement, prepared on first use and kept
+        # for the life of this connection. Callers must not close it.
+        cursor = self._prepared.get(statement)
+        if cursor is None:
+            cursor = self._prepared[statement] = self.cursor(prepared=True)
+        return cursor
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+def init_app(app):
+    # Collect query stats per HTTP request, send them as Server-Timing and log them.
+    from flask import request
+
+    @app.before_request
+    def begin_request_stats():
+        request.environ['sql.stats_token'] = begin(f"{request.method} {request.path}")
+
+    @app.after_request
+    def add_server_timing(response):
+        stats = _current_stats.get()
+        if stats is not None and 'sql.stats_token' in request.environ:
+            response.headers.add('Server-Timing', stats.server_timing())
+            response.headers['Timing-Allow-Origin'] = '*'
+        return response
+
+    @app.teardown_request
+    def end_request_stats(exc=None):
+        token = request.environ.pop('sql.stats_token', None)
+        if token is not None:
+            end(token)
@@ -0,0 +1,121 @@
+import os
+import time
+from typing import Any, Generator, Optional, Sequence
+
+from database.connection import Database
+from database.instrumentation import record_query
+
+# Shared query layer. Model logic that both runtimes need (the eventlet/WSGI server and
+# the ASGI server) is written once as a plan: a generator that yields Statements and
+# is sent each statement's result, e.g.
+#
+#   def room_by_id(room_id):
+#       room = yield Statement("SELECT ... WHERE id = %s", (room_id,), fetch='one')
+#       return format_room(room) if room else None
+#
+# run() drives a plan on a blocking mysql-connector cursor, run_async() on an aiomysql
+# cursor; plans always see rows as dicts. A plan never touches a connection itself, so
+# the caller decides on transactions: run_plan() here, AsyncDatabase.run_plan() for asyncio.
+
+Plan = Generator['Statement', Any, Any]
+
+# Run Statements marked prepare=True (the hot ones) as server-side prepared statements,
+# cached per connection, so the server parses them once per connection rather than on
+# every call. That only pays off when connections are reused, so it is on by default
+# only with DB_POOL_SIZE set.
+DB_PREPARED_STATEMENTS = os.getenv(
+    'DB_PREPARED_STATEMENTS', '1' if int(os.getenv('DB_POOL_SIZE', 0)) > 0 else '0'
+).lower() in ('1', 'true', 't')
+# Fetch plain tuple rows and name their columns once per result, instead of using
+# dictionary cursors, which rebuild the column names for every row.
+DB_TUPLE_ROWS = os.getenv('DB_TUPLE_ROWS', '1').lower() in ('1', 'true', 't')
+
+
+class Statement:
+    # One SQL statement and what the plan wants back from it:
+    #   'all'  list of rows     'one'  a row or None
+    #   None   {'rowcount': ..., 'lastrowid': ...} for writes
+    # prepare=True marks a hot statement worth preparing (see DB_PREPARED_STATEMENTS).
+
+    __slots__ = ('sql', 'params', 'fetch', 'prepare')
+
+    def __init__(self, sql: str, params: Sequence = (), fetch: Optional[str] = 'all', prepare: bool = False):
+        self.sql = sql
+        self.params = tuple(params)
+        self.fetch = fetch
+        self.prepare = prepare
+
+
+def _as_dicts(cursor, rows):
+    # Tuple rows as dicts, naming the columns once for the whole result.
+    if not rows or isinstance(rows[0], dict):
+        return rows
+    names = cursor.column_names
+    return [dict(zip(names, row)) for row in rows]
+
+
+def run(plan: Plan, cursor, connection=None):
+    # Run a plan on a blocking cursor and return its result. With the cursor's
+    # connection given, prepared statements run on that connection's cached cursors.
+    result = None
+    try:
+        while True:
+            statement = plan.send(result)
+            active = cursor
+            if statement.prepare and connection is not None and DB_PREPARED_STATEMENTS:
+                active = connection.prepared_cursor(statement.sql)
+            active.execute(statement.sql, statement.params)
+            if statement.fetch is None:
+                result = {'rowcount': active.rowcount, 'lastrowid': active.lastrowid}
+            elif statement.fetch == 'all' or active is not cursor:
+                # A cached prepared cursor is read to the end so it can run again.
+                result = _as_dicts(active, active.fetchall())
+                if statement.fetch == 'one':
+                    result = result[0] if result else None
+            else:
+                row = active.fetchone()
+                result = _as_dicts(active, [row])[0] if row is not None else None
+    except StopIteration as stop:
+        return stop.value
+
+
+async def run_async(plan: Plan, cursor):
+    # Run a plan on an aiomysql cursor and return its result. aiomysql speaks only the
+    # text protocol, so prepare is ignored here.
+    result = None
+    try:
+        while True:
+            statement = plan.send(result)
+            started = time.perf_counter()
+            try:
+                await cursor.execute(statement.sql, statement.params)
+            finally:
+                record_query(statement.sql, time.perf_counter() - started)
+            if statement.fetch == 'one':
+                result = await cursor.fetchone()
+            elif statement.fetch == 'all':
+                result = list(await cursor.fetchall())
+            else:
+                result = {'rowcount': cursor.rowcount, 'lastrowid': cursor.lastrowid}
+    except StopIteration as stop:
+        return stop.value
+
+
+def run_plan(plan: Plan, commit: bool = False):
+    # Run a plan on its own connection; commit=True commits its writes, and any error
+    # rolls them back.
+    conn = Database().get_connection()
+    if not conn:
+        raise Exception("Database connection failed")
+    cursor = conn.cursor(dictionary=not DB_TUPLE_ROWS)
+    try:
+        result = run(plan, cursor, conn)
+        if commit:
+            conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
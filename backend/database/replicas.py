@@ -0,0 +1,325 @@
+import itertools
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from mysql.connector import Error
+
+load_dotenv()
+
+# Read/write splitting. With DB_REPLICAS set ("host[:port],host[:port]", same
+# credentials as DB_HOST), every Database connection is a RoutedConnection: reads go to
+# a healthy replica until the connection writes, locks rows or starts a transaction,
+# and from then on everything goes to the primary.
+#
+# Read-your-writes: a write marks its session (the request's user, else its client IP)
+# as pinned to the primary for DB_PRIMARY_PIN_SECONDS, so the reads that follow a
+# like or a chat message see it even while replicas lag. Pins are kept in the rate
+# limit store, so with several worker processes it must be the shared one
+# (RATE_LIMIT_STORE); the launcher and asgi.py start one when it is unset.
+DB_REPLICAS = os.getenv('DB_REPLICAS', '')
+# Replicas further behind than this, or not replicating at all, are ejected.
+DB_REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', 5))
+# Seconds between lag checks of a replica, and before an ejected one is retried.
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', 5))
+DB_PRIMARY_PIN_SECONDS = float(os.getenv('DB_PRIMARY_PIN_SECONDS', 5))
+
+_READ = re.compile(r'^\s*\(?\s*(?:SELECT|SHOW|WITH|DESCRIBE|DESC|EXPLAIN)\b', re.IGNORECASE)
+# A WITH statement is only a read if its body is; MySQL allows WITH ... UPDATE/DELETE.
+_CTE = re.compile(r'^\s*\(?\s*WITH\b', re.IGNORECASE)
+_WRITE_KEYWORD = re.compile(r'\b(?:INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+_LOCKING_READ = re.compile(r'\bFOR\s+UPDATE\b|\bLOCK\s+IN\s+SHARE\s+MODE\b|\bFOR\s+SHARE\b', re.IGNORECASE)
+
+# Identifies the current session for read-your-writes; set per request by init_app().
+session_key: ContextVar[Optional[str]] = ContextVar('db_session_key', default=None)
+# Set once the current request or job has written, so it keeps reading the primary.
+_context_wrote: ContextVar[bool] = ContextVar('db_context_wrote', default=False)
+# Where pins are kept: a store with hit/peek like models.rate_limit's, shared between
+# worker processes when that one is. Set by init_app(); without it pins are per request.
+_pin_store = None
+
+
+def is_read(statement) -> bool:
+    if isinstance(statement, bytes):
+        statement = statement.decode('utf-8', 'replace')
+    if not _READ.match(statement) or _LOCKING_READ.search(statement):
+        return False
+    return not (_CTE.match(statement) and _WRITE_KEYWORD.search(statement))
+
+
+def pinned_to_primary() -> bool:
+    if _context_wrote.get():
+        return True
+    key = session_key.get()
+    if key is None or _pin_store is None:
+        return False
+    allowed, _, _ = _pin_store.peek(f"db_pin:{key}", 1, DB_PRIMARY_PIN_SECONDS)
+    return not allowed
+
+
+def mark_wrote():
+    # Pin the current request and session to the primary.
+    _context_wrote.set(True)
+    key = session_key.get()
+    if key is not None and _pin_store is not None:
+        _pin_store.hit(f"db_pin:{key}", 1 << 30, DB_PRIMARY_PIN_SECONDS)
+
+
+class Replica:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.healthy = True
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at = 0.0
+
+    def due_for_check(self, now: float) -> bool:
+        return now - self.checked_at >= DB_REPLICA_CHECK_INTERVAL
+
+    def status(self) -> Dict:
+        return {'replica': f"{self.host}:{self.port}", 'healthy': self.healthy, 'lag_s': self.lag, 'error': self.error}
+
+
+class ReplicaSet:
+    # Replicas from DB_REPLICAS, used round robin. There is no background checker: a
+    # replica's lag is measured on the connection that picks it, at most once per
+    # DB_REPLICA_CHECK_INTERVAL, and an ejected replica is tried again after that.
+
+    def __init__(self, spec: str):
+        self.replicas: List[Replica] = []
+        for entry in filter(None, (part.strip() for part in spec.split(','))):
+            host, _, port = entry.partition(':')
+            self.replicas.append(Replica(host, int(port or 3306)))
+        self._order = itertools.cycle(self.replicas) if self.replicas else None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def _candidates(self) -> List[Replica]:
+        now = time.time()
+        with self._lock:
+            ordered = [next(self._order) for _ in self.replicas]
+        return [replica for replica in ordered if replica.healthy or replica.due_for_check(now)]
+
+    def _eject(self, replica: Replica, reason: str):
+        if replica.healthy:
+            print(f"Ejecting database replica {replica.host}:{replica.port}: {reason}")
+        replica.healthy = False
+        replica.error = reason
+        replica.checked_at = time.time()
+
+    @staticmethod
+    def _lag(connection) -> Optional[float]:
+        # Seconds behind the primary; 0 for a server that is not a replica at all
+        # (e.g. a second local instance standing in for one).
+        cursor = connection.cursor(dictionary=True)
+        try:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except Error:
+                cursor.execute("SHOW SLAVE STATUS")
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        if not rows:
+            return 0.0
+        lag = rows[0].get('Seconds_Behind_Master', rows[0].get('Seconds_Behind_Source'))
+        return float(lag) if lag is not None else None
+
+    def _check(self, replica: Replica, connection) -> bool:
+        try:
+            lag = self._lag(connection)
+        except Error as e:
+            self._eject(replica, f"lag check failed: {e}")
+            return False
+        replica.lag = lag
+        if lag is None:
+            self._eject(replica, 'replication is not running')
+            return False
+        if lag > DB_REPLICA_MAX_LAG:
+            self._eject(replica, f"{lag:.0f}s behind the primary")
+            return False
+        if not replica.healthy:
+            print(f"Database replica {replica.host}:{replica.port} is back in rotation")
+        replica.healthy = True
+        replica.error = None
+        replica.checked_at = time.time()
+        return True
+
+    def connect(self, database):
+        # An open connection to a healthy replica, or None if there is none.
+        for replica in self._candidates():
+            connection = database._connect(replica.host, replica.port)
+            if connection is None:
+                self._eject(replica, 'connection failed')
+                continue
+            if replica.due_for_check(time.time()) and not self._check(replica, connection):
+                connection.close()
+                continue
+            return connection
+        return None
+
+    def status(self) -> List[Dict]:
+        return [replica.status() for replica in self.replicas]
+
+
+replica_set = ReplicaSet(DB_REPLICAS)
+
+
+class RoutedConnection:
+    # One logical connection over a replica and the primary, each opened on first use.
+    # Once it goes to the primary it stays there and the replica is closed, so it never
+    # holds more than one connection (and DB_MAX_CONNECTIONS slot) at a time.
+
+    def __init__(self, database):
+        self._database = database
+        self._replica = None
+        self._primary = None
+        self._cursors: List['RoutedCursor'] = []
+        self._replica_unavailable = False
+        self._pinned = None
+        self._wrote = False
+
+    def _use_primary(self):
+        if self._primary is None:
+            if self._replica is not None:
+                for cursor in self._cursors:
+                    cursor._drop(self._replica)
+                self._replica.close()
+                self._replica = None
+            self._primary = self._database._connect()
+            if self._primary is None:
+                raise Error(msg="Database connection failed")
+        return self._primary
+
+    def _wrote_now(self):
+        if not self._wrote:
+            self._wrote = True
+            mark_wrote()
+
+    def _route(self, statement):
+        read = is_read(statement)
+        if read and self._primary is None and not self._replica_unavailable:
+            if self._pinned is None:
+                self._pinned = pinned_to_primary()
+            if not self._pinned:
+                if self._replica is None:
+                    self._replica = replica_set.connect(self._database)
+                    self._replica_unavailable = self._replica is None
+                if self._replica is not None:
+                    return self._replica
+        if not read:
+            self._wrote_now()
+        return self._use_primary()
+
+    def cursor(self, *args, **kwargs):
+        cursor = RoutedCursor(self, args, kwargs)
+        self._cursors.append(cursor)
+        return cursor
+
+    def prepared_cursor(self, statement: str):
+        # Prepared on, and cached by, whichever connection the statement routes to.
+        return self._route(statement).prepared_cursor(statement)
+
+    def start_transaction(self, *args, **kwargs):
+        self._wrote_now()
+        return self._use_primary().start_transaction(*args, **kwargs)
+
+    def commit(self):
+        if self._primary is not None:
+            self._primary.commit()
+
+    def rollback(self):
+        for connection in (self._replica, self._primary):
+            if connection is not None:
+                connection.rollback()
+
+    def is_connected(self) -> bool:
+        connection = self._primary or self._replica
+        return connection.is_connected() if connection is not None else True
+
+    def close(self):
+        for connection in (self._replica, self._primary):
+            if connection is not None:
+                connection.close()
+        self._replica = self._primary = None
+
+    def __getattr__(self, name):
+        return getattr(self._use_primary(), name)
+
+
+class RoutedCursor:
+    # Cursor over a RoutedConnection: each statement runs on the connection it is routed
+    # to, and results are read from the cursor that ran the last one.
+
+    def __init__(self, connection: RoutedConnection, args, kwargs):
+        self._connection = connection
+        self._args = args
+        self._kwargs = kwargs
+        self._cursors = {}
+        self._active = None
+
+    def _cursor_on(self, connection):
+        cursor = self._cursors.get(id(connection))
+        if cursor is None:
+            cursor = self._cursors[id(connection)] = connection.cursor(*self._args, **self._kwargs)
+        self._active = cursor
+        return cursor
+
+    def _drop(self, connection):
+        cursor = self._cursors.pop(id(connection), None)
+        if cursor is not None:
+            cursor.close()
+            if self._active is cursor:
+                self._active = None
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        cursor = self._cursor_on(self._connection._route(operation))
+        return cursor.execute(operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        cursor = self._cursor_on(self._connection._route(operation))
+        return cursor.executemany(operation, seq_params, *args, **kwargs)
+
+    def close(self):
+        for cursor in self._cursors.values():
+            cursor.close()
+        self._cursors.clear()
+
+    def __iter__(self):
+        return iter(self._active)
+
+    def __getattr__(self, name):
+        if self._active is None:
+            raise AttributeError(name)
+        return getattr(self._active, name)
+
+
+def init_app(app):
+    # Key each request's reads and writes by its user (or client IP) and keep pins in
+    # the rate limit store, which RATE_LIMIT_STORE shares between worker processes.
+    global _pin_store
+    if not replica_set.enabled:
+        return
+    from flask import request
+    from models.auth import token_user_id
+    from models.rate_limit import LocalStore, store
+
+    _pin_store = store
+    if isinstance(store, LocalStore):
+        print("DB_REPLICAS without RATE_LIMIT_STORE: read-your-writes pins are kept per process, "
+              "so run a single worker or share the store between them")
+
+    @app.before_request
+    def set_session_key():
+        # Context variables can outlive a request on a reused greenlet or thread.
+        _context_wrote.set(False)
+        user_id = token_user_id(request.headers.get('Authorization'))
+        session_key.set(f"user:{user_id}" if user_id is not None else f"ip:{request.remote_addr}")
@@ -27,6 +27,30 @@ def create_achievement_tables_if_not_exist(cursor):
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
     """)
     
+    # Create exp_ledger table (one row per EXP change, written by models.exp_ledger)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS `exp_ledger` (
+      `id` bigint(20) NOT NULL AUTO_INCREMENT,
+      `user_id` bigint(20) NOT NULL,
+      `exp_delta` int(11) NOT NULL,
+      `source` varchar(50) NOT NULL,
+      `source_id` int(11) DEFAULT NULL,
+      `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
+      PRIMARY KEY (`id`),
+      KEY `user_created` (`user_id`,`created_at`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+    
+    # Create user_daily_exp table (EXP counted against the daily limit, per user and day)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS `user_daily_exp` (
+      `user_id` bigint(20) NOT NULL,
+      `day` date NOT NULL,
+      `exp_earned` int(11) NOT NULL DEFAULT 0,
+      PRIMARY KEY (`user_id`,`day`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+    
     print("Achievement tables created or already exist")
 
 def seed_achievement_data():
@@ -64,7 +64,9 @@ def create_blog_tables_if_not_exist(cursor):
     `parent_id` int(11) DEFAULT NULL,
     `likes_count` int(11) DEFAULT 0,
     `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
-    PRIMARY KEY (`id`)
+    PRIMARY KEY (`id`),
+    KEY `post_parent_created` (`post_id`,`parent_id`,`created_at`),
+    KEY `parent_id` (`parent_id`)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
     """)
     
@@ -77,7 +79,9 @@ def create_blog_tables_if_not_exist(cursor):
     `comment_id` int(11) DEFAULT NULL,
     `type` enum('like','dislike') NOT NULL,
     `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
-    PRIMARY KEY (`id`)
+    PRIMARY KEY (`id`),
+    KEY `post_user` (`post_id`,`user_id`),
+    KEY `comment_user` (`comment_id`,`user_id`)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
     """);
     
@@ -56,7 +56,8 @@ class DatabaseSeeder:
             'seed_events_data.py',       
             'seed_challenges_data.py',   
             'seed_blogs_data.py',        
-            'seed_learning_data.py'      
+            'seed_learning_data.py',     
+            'seed_related_content.py'    
         ]
         
         seed_dir = os.path.dirname(os.path.abspath(__file__))
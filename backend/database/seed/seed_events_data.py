@@ -5,7 +5,9 @@ from datetime import datetime, timedelta
 import mysql.connector
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from connection import Database
+from models.geo import Gazetteer
 
 def create_event_tables_if_not_exist(cursor):
     """Create all event-related tables if they don't exist"""
@@ -29,8 +31,10 @@ def create_event_tables_if_not_exist(cursor):
       `title` varchar(255) NOT NULL,
       `description` text NOT NULL,
       `location` varchar(255) NOT NULL,
+      `location_normalized` varchar(255) DEFAULT NULL,
       `latitude` decimal(10,8) DEFAULT NULL,
       `longitude` decimal(11,8) DEFAULT NULL,
+      `geohash` char(9) DEFAULT NULL,
       `start_date` datetime NOT NULL,
       `end_date` datetime NOT NULL,
       `registration_deadline` datetime DEFAULT NULL,
@@ -49,7 +53,12 @@ def create_event_tables_if_not_exist(cursor):
       `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
       PRIMARY KEY (`id`),
       KEY `organizer_id` (`organizer_id`),
-      KEY `category_id` (`category_id`)
+      KEY `category_id` (`category_id`),
+      KEY `status_start_date` (`status`,`start_date`),
+      KEY `category_status_start_date` (`category_id`,`status`,`start_date`),
+      KEY `start_date` (`start_date`),
+      KEY `geohash` (`geohash`),
+      KEY `latitude_longitude` (`latitude`,`longitude`)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
     """)
     
@@ -61,7 +70,8 @@ def create_event_tables_if_not_exist(cursor):
     `user_id` bigint(20) NOT NULL,
     `registered_at` timestamp NOT NULL DEFAULT current_timestamp(),
       PRIMARY KEY (`id`),
-      UNIQUE KEY `event_user` (`event_id`,`user_id`)
+      UNIQUE KEY `event_user` (`event_id`,`user_id`),
+      KEY `user_event` (`user_id`,`event_id`)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
     """)
     
@@ -75,7 +85,9 @@ def create_event_tables_if_not_exist(cursor):
       `parent_id` int(11) DEFAULT NULL,
       `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
       PRIMARY KEY (`id`),
-      KEY `event_id` (`event_id`)
+      KEY `event_id` (`event_id`),
+      KEY `event_parent_created` (`event_id`,`parent_id`,`created_at`),
+      KEY `parent_id` (`parent_id`)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
     """)
     
@@ -94,6 +106,38 @@ def create_event_tables_if_not_exist(cursor):
     
     print("Event tables created or already exist")
 
+def add_event_location_columns(cursor):
+    """Add the geo columns and indexes to an events table created before they existed"""
+    print("Adding event location columns if they don't exist...")
+
+    columns = [
+        ("location_normalized", "varchar(255) DEFAULT NULL AFTER `location`"),
+        ("latitude", "decimal(10,8) DEFAULT NULL AFTER `location_normalized`"),
+        ("longitude", "decimal(11,8) DEFAULT NULL AFTER `latitude`"),
+        ("geohash", "char(9) DEFAULT NULL AFTER `longitude`")
+    ]
+    cursor.execute("""
+    SELECT COLUMN_NAME FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'events'
+    """)
+    existing = {row[0] for row in cursor.fetchall()}
+    for name, definition in columns:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE `events` ADD COLUMN `{name}` {definition}")
+
+    indexes = [
+        ("geohash", "(`geohash`)"),
+        ("latitude_longitude", "(`latitude`,`longitude`)")
+    ]
+    cursor.execute("""
+    SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'events'
+    """)
+    existing = {row[0] for row in cursor.fetchall()}
+    for name, definition in indexes:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE `events` ADD KEY `{name}` {definition}")
+
 def seed_events_data():
     """Seed data for events-related tables"""
     try:
@@ -102,11 +146,13 @@ def seed_events_data():
         cursor = conn.cursor()
         
         create_event_tables_if_not_exist(cursor)
+        add_event_location_columns(cursor)
         
         print("Starting events data seeding...")
         
         seed_event_categories(cursor)
         seed_events(cursor)
+        geocode_event_locations(cursor)
         seed_event_comments(cursor)
         
         conn.commit()
@@ -366,6 +412,35 @@ def seed_events(cursor):
     
     print(f"Added {cursor.rowcount} events.")
 
+def geocode_event_locations(cursor):
+    """Fill normalised location, coordinates and geohash for events that lack them"""
+    print("Geocoding event locations...")
+    
+    cursor.execute("SELECT id, location FROM events WHERE geohash IS NULL")
+    events = cursor.fetchall()
+    
+    updates = []
+    for event_id, location in events:
+        geo = Gazetteer.locate(location)
+        if geo['geohash']:
+            updates.append((
+                geo['location_normalized'],
+                geo['latitude'],
+                geo['longitude'],
+                geo['geohash'],
+                event_id
+            ))
+    
+    if updates:
+        query = """
+        UPDATE events
+        SET location_normalized = %s, latitude = %s, longitude = %s, geohash = %s
+        WHERE id = %s
+        """
+        cursor.executemany(query, updates)
+    
+    print(f"Geocoded {len(updates)} of {len(events)} event locations.")
+
 def seed_event_comments(cursor):
     """Seed event comments table"""
     print("Seeding event comments...")
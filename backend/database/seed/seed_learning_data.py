@@ -43,7 +43,10 @@ def create_learning_tables_if_not_exist(cursor):
     `duration` varchar(50) DEFAULT NULL,
     `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
     `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
-    PRIMARY KEY (`id`)
+    PRIMARY KEY (`id`),
+    KEY `idx_category_type_status` (`category_id`,`type`,`status`,`created_at`),
+    KEY `idx_type_status` (`type`,`status`,`created_at`),
+    KEY `idx_status_created` (`status`,`created_at`)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
     """)
     
@@ -55,7 +58,8 @@ def create_learning_tables_if_not_exist(cursor):
       `user_id` bigint(20) NOT NULL,
       `created_at` timestamp NOT NULL DEFAULT current_timestamp(),
       PRIMARY KEY (`id`),
-      UNIQUE KEY `material_user` (`material_id`,`user_id`)
+      UNIQUE KEY `material_user` (`material_id`,`user_id`),
+      KEY `user_material` (`user_id`,`material_id`)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
     """)
     
@@ -71,6 +75,7 @@ def create_learning_tables_if_not_exist(cursor):
       `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
       PRIMARY KEY (`id`),
       KEY `material_id` (`material_id`),
+      KEY `material_parent_created` (`material_id`,`parent_id`,`created_at`),
       KEY `parent_id` (`parent_id`)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
     """)
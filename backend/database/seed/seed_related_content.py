@@ -0,0 +1,17 @@
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from models.related_content import RelatedContent
+
+def seed_related_content_data():
+    """Build the related-content index for learning materials, blog posts and forum discussions"""
+    print("Building related-content index...")
+    
+    RelatedContent.create_table_if_not_exists()
+    RelatedContent.rebuild_all()
+    
+    print("Related-content index built.")
+
+if __name__ == "__main__":
+    seed_related_content_data()
@@ -83,7 +83,22 @@ def create_user_related_tables(cursor):
       `login_time` timestamp NOT NULL DEFAULT current_timestamp(),
       `ip_address` varchar(45) DEFAULT NULL,
       `user_agent` text DEFAULT NULL,
-      PRIMARY KEY (`id`)
+      PRIMARY KEY (`id`),
+      KEY `user_login_time` (`user_id`,`login_time`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+    """)
+    
+    # Create user_login_state table (maintained on each login by models.login_state)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS `user_login_state` (
+      `user_id` bigint(20) NOT NULL,
+      `last_login_date` date DEFAULT NULL,
+      `current_streak` int(11) NOT NULL DEFAULT 0,
+      `best_streak` int(11) NOT NULL DEFAULT 0,
+      `login_count` int(11) NOT NULL DEFAULT 0,
+      `streak_advanced` tinyint(1) NOT NULL DEFAULT 0,
+      `updated_at` timestamp NOT NULL DEFAULT current_timestamp() ON UPDATE current_timestamp(),
+      PRIMARY KEY (`user_id`)
     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
     """)
     
@@ -0,0 +1,370 @@
+import gc
+import json
+import logging
+import os
+import random
+import secrets
+import select
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger('launcher')
+
+# Production launcher: imports the app once, then forks WEB_WORKERS eventlet workers
+# that share one listening socket, so the preloaded modules and reference data stay
+# shared copy-on-write. The master supervises them over heartbeat pipes:
+#   SIGHUP          rolling restart; each worker is replaced, then drained
+#   SIGTERM/SIGINT  drain every worker and exit
+# With several workers and no RATE_LIMIT_STORE, the master also starts a shared store,
+# so rate limits, login lockouts and read-your-writes pins hold across all of them.
+# The socket is bound with SO_REUSEPORT, so a new release can be deployed without
+# downtime by starting a second launcher on the same port and then sending SIGTERM
+# to the old one.
+
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', os.cpu_count() or 1))
+# Concurrent connections (HTTP and websockets) per worker.
+WORKER_CONNECTIONS = int(os.getenv('WORKER_CONNECTIONS', 1000))
+# Open database connections per worker; exported as DB_MAX_CONNECTIONS.
+WORKER_DB_CONNECTIONS = int(os.getenv('WORKER_DB_CONNECTIONS', 20))
+# Seconds a draining worker gets to finish requests before it is stopped.
+GRACEFUL_TIMEOUT = float(os.getenv('GRACEFUL_TIMEOUT', 30))
+# A worker that sends no heartbeat for this long is killed and replaced.
+WORKER_TIMEOUT = float(os.getenv('WORKER_TIMEOUT', 30))
+HEARTBEAT_INTERVAL = 1.0
+LISTEN_BACKLOG = 2048
+DEFAULT_BROKER = 'broker://127.0.0.1:7071'
+DEFAULT_STORE = '127.0.0.1:7070'
+
+
+class Launcher:
+    def __init__(self, host: str, port: int, workers: int = WEB_WORKERS):
+        self.host = host
+        self.port = port
+        self.count = max(1, workers)
+        self.workers = {}
+        self.services = {}
+        self.metrics = None
+        self.metrics_interval = 0.0
+        self.metrics_collected_at = 0.0
+        self.sock = None
+        self.app = None
+        self.socketio = None
+        self.stopping = False
+        self.reload_requested = False
+
+    # Master
+
+    def run(self):
+        os.environ.setdefault('DB_MAX_CONNECTIONS', str(WORKER_DB_CONNECTIONS))
+        os.environ.setdefault('SOCKETIO_LOGGER', '0')
+        # One release id for every worker, so their HTTP cache ETags agree.
+        os.environ.setdefault('RELEASE_ID', secrets.token_hex(8))
+        # Workers publish metric snapshots here, before anything imports models.metrics.
+        metrics_base = os.path.join(tempfile.gettempdir(), f"green-buddy-metrics-{os.getpid()}")
+        os.environ['METRICS_SNAPSHOT_DIR'] = metrics_base
+        os.environ['METRICS_FILE'] = f"{metrics_base}.prom"
+        if not os.getenv('SOCKETIO_MESSAGE_QUEUE'):
+            from models import socket_broker
+            os.environ['SOCKETIO_MESSAGE_QUEUE'] = DEFAULT_BROKER
+            socket_broker.generate_token()
+        if os.environ['SOCKETIO_MESSAGE_QUEUE'].startswith('broker://'):
+            self._start_service('broker')
+        if not os.getenv('RATE_LIMIT_STORE') and self.count > 1:
+            os.environ['RATE_LIMIT_STORE'] = DEFAULT_STORE
+            os.environ.setdefault('RATE_LIMIT_AUTHKEY', secrets.token_hex(32))
+            self._start_service('store')
+
+        from app import create_app
+        from models import metrics
+        self.app, self.socketio = create_app()
+        self.metrics = metrics.MetricsAggregator(metrics.METRICS_SNAPSHOT_DIR, metrics.METRICS_FILE)
+        self.metrics_interval = metrics.METRICS_SNAPSHOT_INTERVAL
+        # Keep the preloaded objects out of later collections, which would otherwise
+        # touch their pages and undo copy-on-write sharing.
+        gc.collect()
+        gc.freeze()
+
+        self.sock = self._listen()
+        signal.signal(signal.SIGHUP, self._request_reload)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        for index in range(self.count):
+            self._spawn(index)
+        logger.info(f"Master {os.getpid()} serving {self.host}:{self.port} with {self.count} workers")
+
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                self._rolling_restart()
+            self._pump(HEARTBEAT_INTERVAL)
+        self._shutdown()
+
+    def _request_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def _listen(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(LISTEN_BACKLOG)
+        return sock
+
+    def _start_service(self, name: str):
+        # Fork a helper the workers connect to: the Socket.IO broker or the shared store.
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            try:
+                if name == 'broker':
+                    from models import socket_broker
+                    socket_broker.serve(os.environ['SOCKETIO_MESSAGE_QUEUE'])
+                else:
+                    from models import rate_limit
+                    rate_limit.serve(os.environ['RATE_LIMIT_STORE'])
+            finally:
+                os._exit(0)
+        self.services[pid] = name
+
+    def _spawn(self, index: int) -> int:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            for info in self.workers.values():
+                os.close(info['fd'])
+            code = 0
+            try:
+                self._serve(index, write_fd)
+            except BaseException:
+                logger.exception(f"Worker {index} crashed")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+
+        os.close(write_fd)
+        now = time.time()
+        self.workers[pid] = {
+            'index': index, 'fd': read_fd, 'buffer': b'', 'started_at': now, 'last_beat': now,
+            'ready': False, 'retiring_at': None, 'status': {}
+        }
+        return pid
+
+    def _pump(self, timeout: float):
+        # Read heartbeats, reap and replace exited workers, kill hung ones, publish status.
+        fds = {info['fd']: pid for pid, info in self.workers.items()}
+        readable = select.select(list(fds), [], [], timeout)[0] if fds else []
+        if not fds:
+            time.sleep(timeout)
+        now = time.time()
+        for fd in readable:
+            info = self.workers.get(fds[fd])
+            try:
+                data = os.read(fd, 65536)
+            except OSError:
+                continue
+            if not info or not data:
+                continue
+            lines = (info['buffer'] + data).split(b'\n')
+            info['buffer'] = lines.pop()
+            if lines:
+                try:
+                    info['status'] = json.loads(lines[-1])
+                except ValueError:
+                    pass
+                info['last_beat'] = now
+                info['ready'] = True
+
+        self._reap()
+        for pid, info in list(self.workers.items()):
+            if info['retiring_at'] is not None:
+                if now - info['retiring_at'] > GRACEFUL_TIMEOUT + 5:
+                    self._kill(pid, signal.SIGKILL)
+            elif now - info['last_beat'] > WORKER_TIMEOUT:
+                logger.error(f"Worker {info['index']} (pid {pid}) missed heartbeats for {WORKER_TIMEOUT}s; killing it")
+                self._kill(pid, signal.SIGKILL)
+        self._write_status()
+        if now - self.metrics_collected_at >= self.metrics_interval:
+            self.metrics_collected_at = now
+            self.metrics.collect()
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            name = self.services.pop(pid, None)
+            if name is not None:
+                if not self.stopping:
+                    logger.error(f"The {name} process exited; restarting it")
+                    self._start_service(name)
+                continue
+
+            info = self.workers.pop(pid, None)
+            if info is None:
+                continue
+            os.close(info['fd'])
+            if info['retiring_at'] is None and not self.stopping:
+                logger.error(f"Worker {info['index']} (pid {pid}) exited with status {status}; replacing it")
+                self._spawn(info['index'])
+
+    def _kill(self, pid: int, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _retire(self, pid: int):
+        info = self.workers.get(pid)
+        if info is not None and info['retiring_at'] is None:
+            info['retiring_at'] = time.time()
+            self._kill(pid, signal.SIGTERM)
+
+    def _rolling_restart(self):
+        # Replace one worker at a time: start the new one, wait for its first heartbeat,
+        # then drain the old one, so serving capacity never drops below count.
+        logger.info("Rolling restart")
+        for pid in [pid for pid, info in self.workers.items() if info['retiring_at'] is None]:
+            info = self.workers.get(pid)
+            if info is None or self.stopping:
+                continue
+            new_pid = self._spawn(info['index'])
+            deadline = time.time() + WORKER_TIMEOUT
+            while time.time() < deadline and not self.stopping:
+                if new_pid not in self.workers or self.workers[new_pid]['ready']:
+                    break
+                self._pump(0.2)
+            self._retire(pid)
+
+    def _shutdown(self):
+        logger.info("Draining workers")
+        for pid in list(self.workers):
+            self._retire(pid)
+        deadline = time.time() + GRACEFUL_TIMEOUT + 5
+        while self.workers and time.time() < deadline:
+            self._pump(0.2)
+        for pid in list(self.workers):
+            self._kill(pid, signal.SIGKILL)
+        for pid in list(self.services):
+            self._kill(pid, signal.SIGTERM)
+        try:
+            from models.worker import WORKER_STATUS_FILE
+            os.remove(WORKER_STATUS_FILE)
+        except OSError:
+            pass
+        if self.metrics is not None:
+            self.metrics.close()
+
+    def _write_status(self):
+        from models.worker import WORKER_STATUS_FILE
+        now = time.time()
+        status = {
+            'master_pid': os.getpid(),
+            'updated_at': now,
+            'workers': [
+                dict(info['status'], index=info['index'], pid=pid, ready=info['ready'],
+                     retiring=info['retiring_at'] is not None,
+                     last_heartbeat_s=round(now - info['last_beat'], 1))
+                for pid, info in sorted(self.workers.items(), key=lambda item: item[1]['index'])
+            ]
+        }
+        temporary = f"{WORKER_STATUS_FILE}.{os.getpid()}"
+        try:
+            with open(temporary, 'w') as f:
+                json.dump(status, f)
+            os.replace(temporary, WORKER_STATUS_FILE)
+        except OSError as e:
+            logger.warning(f"Cannot write worker status: {str(e)}")
+
+    # Worker
+
+    def _serve(self, index: int, heartbeat_fd: int):
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        random.seed()
+        os.set_blocking(heartbeat_fd, False)
+        # The master stays unpatched; each worker patches after the fork, which also
+        # reaches modules the preload imported, since they look sockets up at call time.
+        from database import cooperative
+        cooperative.patch()
+
+        import eventlet
+        from eventlet import greenio, wsgi
+        from models import metrics
+        from models.jobs import Jobs
+        from models.worker import Worker
+
+        pool = eventlet.GreenPool(WORKER_CONNECTIONS)
+        Worker.forked(index, self.count, pool, self.socketio)
+        if index == 0:
+            Jobs.start_scheduler()
+        metrics.start_snapshots()
+
+        server = eventlet.spawn(
+            wsgi.server, greenio.GreenSocket(self.sock), self.app, custom_pool=pool, log_output=False
+        )
+
+        def drain():
+            Worker.draining = True
+            server.kill()
+            try:
+                # Clients reconnect, and the kernel hands them to another worker.
+                self.socketio.server.eio.disconnect()
+            except Exception as e:
+                logger.warning(f"Error disconnecting websockets: {str(e)}")
+            with eventlet.Timeout(GRACEFUL_TIMEOUT, False):
+                pool.waitall()
+            metrics.write_snapshot()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(0)
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: eventlet.spawn(drain))
+
+        def heartbeat():
+            while True:
+                try:
+                    os.write(heartbeat_fd, json.dumps(Worker.status()).encode() + b'\n')
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    # The master is gone.
+                    os._exit(1)
+                eventlet.sleep(HEARTBEAT_INTERVAL)
+
+        eventlet.spawn(heartbeat)
+        try:
+            server.wait()
+        except BaseException:
+            if not Worker.draining:
+                raise
+        if not Worker.draining:
+            raise RuntimeError('WSGI server stopped')
+        # drain() exits the process once in-flight requests are done.
+        eventlet.sleep(GRACEFUL_TIMEOUT + 1)
+
+
+if __name__ == '__main__':
+    Launcher(
+        os.getenv('FLASK_HOST', '127.0.0.1'),
+        int(os.getenv('FLASK_PORT', 5000)),
+        WEB_WORKERS
+    ).run()
@@ -1,15 +1,23 @@
 from datetime import datetime, timedelta
 import json
 from typing import List, Dict, Optional
-from database.connection import Database
+from database.connection import Database, run_in_transaction
+from models.exp_ledger import ExpLedger
 from models.user_stats import UserStats
+from models.http_cache import ResourceVersions
+from models.reference_data import ReferenceData
 from models.notification import Notification
 from models.websockets import send_achievement_notification
+from models.metrics import cache_counters
+from models.profiler import HeapSnapshots
 
-DAILY_EXP_LIMIT = 5000 
-EXP_PER_LEVEL = 100    
 CACHE_DURATION = 300   
 
+_cache_hits, _cache_misses = cache_counters('achievements')
+
+class _DailyLimitReached(Exception):
+    pass
+
 class AchievementCache:
     _cache = {}
     
@@ -18,8 +26,10 @@ class AchievementCache:
         if key in AchievementCache._cache:
             data, timestamp = AchievementCache._cache[key]
             if datetime.now() - timestamp < timedelta(seconds=CACHE_DURATION):
+                _cache_hits.inc()
                 return data
             del AchievementCache._cache[key]
+        _cache_misses.inc()
         return None
     
     @staticmethod
@@ -76,6 +86,8 @@ class AchievementCache:
             cursor.close()
             conn.close()
 
+HeapSnapshots.watch('AchievementCache._cache', AchievementCache._cache)
+
 class UserActivity:
     def __init__(self, id: int = None, user_id: int = None, activity_type: str = None,
                  activity_data: Dict = None, created_at: datetime = None):
@@ -154,7 +166,7 @@ class Achievements:
     @staticmethod
     def calculate_level(exp: int) -> int:
         # Calculate user level from experience points consistently across the application.
-        return (exp // EXP_PER_LEVEL) + 1
+        return ExpLedger.calculate_level(exp)
     
     @staticmethod
     def check_and_apply_daily_exp_limit(user_id: int, exp_to_add: int) -> int:
@@ -163,22 +175,7 @@ class Achievements:
         try:
             conn = db.get_connection()
             cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute("""
-            SELECT COALESCE(SUM(
-                CAST(JSON_EXTRACT(activity_data, '$.exp_reward') AS SIGNED)
-            ), 0) as daily_exp
-            FROM user_activities
-            WHERE user_id = %s 
-            AND activity_type IN ('achievement_earned', 'challenge_completed', 'learning_completed')
-            AND DATE(created_at) = CURDATE()
-        """, (user_id,))
-            
-            result = cursor.fetchone()
-            daily_exp = result['daily_exp'] if result else 0
-            
-            remaining_exp = max(0, DAILY_EXP_LIMIT - daily_exp)
-            return min(exp_to_add, remaining_exp)
+            return min(exp_to_add, ExpLedger.remaining_today(cursor, user_id))
         finally:
             cursor.close()
             conn.close()
@@ -186,53 +183,34 @@ class Achievements:
     @staticmethod
     def award_exp_with_transaction(user_id: int, exp_amount: int, activity_type: str, activity_data: Dict) -> Dict:
         """Award experience points to a user with proper transaction handling."""
-        db = Database()
-        try:
-            conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            conn.start_transaction(isolation_level='READ COMMITTED')
+        def award(cursor):
+            awarded = ExpLedger.apply(cursor, user_id, exp_amount, activity_type)
+            if awarded['exp_gained'] <= 0:
+                return awarded
             
-            cursor.execute("SELECT exp FROM users WHERE id = %s FOR UPDATE", (user_id,))
-            current_exp = cursor.fetchone()['exp']
-            
-            actual_exp = Achievements.check_and_apply_daily_exp_limit(user_id, exp_amount)
-            if actual_exp <= 0:
-                conn.rollback()
-                return {
-                    'success': False,
-                    'message': 'Daily EXP limit reached',
-                    'exp_gained': 0,
-                    'new_level': Achievements.calculate_level(current_exp)
-                }
-            
-            new_exp = current_exp + actual_exp
-            cursor.execute(
-                "UPDATE users SET exp = %s WHERE id = %s",
-                (new_exp, user_id)
-            )
-            
-            activity_data['exp_reward'] = actual_exp
             cursor.execute("""
                 INSERT INTO user_activities 
                 (user_id, activity_type, activity_data, created_at)
                 VALUES (%s, %s, %s, NOW())
-            """, (user_id, activity_type, json.dumps(activity_data)))
-            
-            conn.commit()
-            
+            """, (user_id, activity_type, json.dumps(dict(activity_data, exp_reward=awarded['exp_gained']))))
+            return awarded
+        
+        awarded = run_in_transaction(award)
+        if awarded['exp_gained'] <= 0:
             return {
-                'success': True,
-                'exp_gained': actual_exp,
-                'new_level': Achievements.calculate_level(new_exp),
-                'total_exp': new_exp
+                'success': False,
+                'message': 'Daily EXP limit reached',
+                'exp_gained': 0,
+                'new_level': awarded['new_level']
             }
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            cursor.close()
-            conn.close()
+        
+        activity_data['exp_reward'] = awarded['exp_gained']
+        return {
+            'success': True,
+            'exp_gained': awarded['exp_gained'],
+            'new_level': awarded['new_level'],
+            'total_exp': awarded['total_exp']
+        }
 
     @staticmethod
     def get_user_achievements(user_id: int) -> List[Dict]:
@@ -274,30 +252,17 @@ class Achievements:
             conn = db.get_connection()
             cursor = conn.cursor(dictionary=True)
             
-            cursor.execute("""
-                SELECT criteria, category FROM achievement_types WHERE id = %s
-            """, (achievement_id,))
-            achievement = cursor.fetchone()
+            achievement = ReferenceData.table('achievement_types').get(achievement_id)
             if not achievement or not achievement['criteria']:
                 return False
             
-            criteria = json.loads(achievement['criteria'])
+            criteria = achievement['criteria']
             
             user_stats = UserStats.get_user_stats(user_id)
             
             criterion_type = criteria['type']
-            
-            # Handle different field names for required count
-            if 'count' in criteria:
-                required_count = criteria['count']
-            elif 'months' in criteria and criterion_type == 'account_age':
-                required_count = criteria['months']
-            elif 'days' in criteria and criterion_type == 'login_streak':
-                required_count = criteria['days']
-            else:
-                required_count = criteria.get('count', 0)
+            required_count = Achievements.required_count(criteria)
 
-            
             if criterion_type in user_stats:
                 current_count = user_stats[criterion_type]
                 if current_count is None:
@@ -312,30 +277,16 @@ class Achievements:
     @staticmethod
     def award_achievement(user_id: int, achievement_id: int) -> Optional[Dict]:
         # Award an achievement to a user if they don't already have it.
-        db = Database()
-        achievement_data = None
-        notification_data = None
+        achievement = ReferenceData.table('achievement_types').get(achievement_id)
+        if not achievement:
+            return None
         
-        try:
-            conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            conn.start_transaction(isolation_level='READ COMMITTED')
-            
+        def award(cursor):
             cursor.execute("""
                 SELECT id FROM user_achievements
                 WHERE user_id = %s AND achievement_id = %s
             """, (user_id, achievement_id))
             if cursor.fetchone():
-                conn.rollback()
-                return None
-
-            cursor.execute("""
-                SELECT * FROM achievement_types WHERE id = %s
-            """, (achievement_id,))
-            achievement = cursor.fetchone()
-            if not achievement:
-                conn.rollback()
                 return None
 
             cursor.execute("""
@@ -343,129 +294,114 @@ class Achievements:
                 VALUES (%s, %s)
             """, (user_id, achievement_id))
 
-            cursor.execute("SELECT exp FROM users WHERE id = %s", (user_id,))
-            current_exp = cursor.fetchone()['exp']
-            
-            cursor.execute("""
-                SELECT COALESCE(SUM(
-                    CAST(JSON_EXTRACT(activity_data, '$.exp_reward') AS SIGNED)
-                ), 0) as daily_exp
-                FROM user_activities
-                WHERE user_id = %s 
-                AND activity_type IN ('achievement_earned', 'challenge_completed', 'learning_completed')
-                AND DATE(created_at) = CURDATE()
-            """, (user_id,))
-            
-            result = cursor.fetchone()
-            daily_exp = result['daily_exp'] if result else 0
-            
-            remaining_exp = max(0, DAILY_EXP_LIMIT - daily_exp)
-            actual_exp = min(achievement['exp_reward'], remaining_exp)
-            
-            if actual_exp <= 0:
-                conn.rollback()
-                return None
-            
-            new_exp = current_exp + actual_exp
-            cursor.execute(
-                "UPDATE users SET exp = %s WHERE id = %s",
-                (new_exp, user_id)
-            )
+            awarded = ExpLedger.apply(cursor, user_id, achievement['exp_reward'], 'achievement_earned', achievement_id)
+            if awarded['exp_gained'] <= 0:
+                # Raised so run_in_transaction rolls back the user_achievements row.
+                raise _DailyLimitReached()
             
             activity_data = {
                 'achievement_id': achievement_id,
                 'name': achievement['name'],
-                'exp_reward': actual_exp
+                'exp_reward': awarded['exp_gained']
             }
             cursor.execute("""
                 INSERT INTO user_activities 
                 (user_id, activity_type, activity_data, created_at)
                 VALUES (%s, %s, %s, NOW())
             """, (user_id, 'achievement_earned', json.dumps(activity_data)))
-
-            notification_data = {
-                'user_id': user_id,
-                'type': "achievement_earned",
-                'title': "Achievement Unlocked!",
-                'content': f"You've earned the '{achievement['name']}' achievement and {actual_exp} XP!",
-                'link': "/achievements"
-            }
+            return awarded
+        
+        try:
+            awarded = run_in_transaction(award)
+        except _DailyLimitReached:
+            return None
+        if not awarded:
+            return None
+        
+        actual_exp = awarded['exp_gained']
+        ResourceVersions.bump(f'user_achievements:{user_id}')
+        
+        try:
+            Notification.create(
+                user_id=user_id,
+                type="achievement_earned",
+                title="Achievement Unlocked!",
+                content=f"You've earned the '{achievement['name']}' achievement and {actual_exp} XP!",
+                link="/achievements"
+            )
             
-            achievement_data = {
+            send_achievement_notification(user_id, {
                 'id': achievement['id'],
                 'name': achievement['name'],
                 'description': achievement['description'],
                 'exp_reward': actual_exp,
                 'icon_name': achievement.get('icon_name', 'award'),
                 'category': achievement.get('category', 'general')
-            }
-
-            conn.commit()
-            
-            result = {
-                'id': achievement['id'],
-                'name': achievement['name'],
-                'description': achievement['description'],
-                'criteria': json.loads(achievement['criteria']) if achievement['criteria'] else {},
-                'exp_awarded': actual_exp,
-                'new_level': Achievements.calculate_level(new_exp)
-            }
-            
-            return result
-            
+            })
         except Exception as e:
-            if conn:
-                conn.rollback()
-            raise e
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
-            
-            if notification_data:
-                try:
-                    Notification.create(
-                        user_id=notification_data['user_id'],
-                        type=notification_data['type'],
-                        title=notification_data['title'],
-                        content=notification_data['content'],
-                        link=notification_data['link']
-                    )
-                    
-                    if achievement_data:
-                        send_achievement_notification(user_id, achievement_data)
-                except Exception as e:
-                    print(f"Error creating notification: {str(e)}")
+            print(f"Error creating notification: {str(e)}")
+        
+        return {
+            'id': achievement['id'],
+            'name': achievement['name'],
+            'description': achievement['description'],
+            'criteria': achievement['criteria'] or {},
+            'exp_awarded': actual_exp,
+            'new_level': awarded['new_level']
+        }
 
     @staticmethod
     def get_all() -> List[Dict]:
-        # Get all achievement types.
+        # Get all achievement types from the reference-data snapshot.
+        return ReferenceData.table('achievement_types').all()
+            
+    @staticmethod
+    def required_count(criteria: Dict) -> int:
+        # The stat value an achievement's criteria ask for.
+        criterion_type = criteria['type']
+        if 'count' in criteria:
+            return criteria['count']
+        if 'months' in criteria and criterion_type == 'account_age':
+            return criteria['months']
+        if 'days' in criteria and criterion_type == 'login_streak':
+            return criteria['days']
+        return criteria.get('count', 0)
+
+    @staticmethod
+    def check_stat_achievements(user_id: int, stats: Dict) -> List[Dict]:
+        # Award unearned achievements whose criteria are on the given stats, using the
+        # values passed in rather than refreshing the user's stats.
+        candidates = [
+            achievement for achievement in ReferenceData.table('achievement_types').all()
+            if isinstance(achievement['criteria'], dict) and achievement['criteria'].get('type') in stats
+            and (stats[achievement['criteria']['type']] or 0) >= Achievements.required_count(achievement['criteria'])
+        ]
+        if not candidates:
+            return []
+        
         db = Database()
         try:
             conn = db.get_connection()
             cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute('''
-                SELECT id, name, description, criteria, exp_reward, category, icon_name
-                FROM achievement_types
-                ORDER BY category, id
-            ''')
-            
-            achievements = cursor.fetchall()
-            
-            for achievement in achievements:
-                if achievement['criteria']:
-                    try:
-                        achievement['criteria'] = json.loads(achievement['criteria'])
-                    except json.JSONDecodeError:
-                        print(f"Warning: Invalid JSON in criteria for achievement {achievement['id']}")
-            
-            return achievements
+            cursor.execute("""
+                SELECT achievement_id
+                FROM user_achievements
+                WHERE user_id = %s
+            """, (user_id,))
+            earned_achievements = {row['achievement_id'] for row in cursor.fetchall()}
         finally:
             cursor.close()
             conn.close()
-            
+        
+        newly_awarded = []
+        for achievement in candidates:
+            if achievement['id'] in earned_achievements:
+                continue
+            awarded = Achievements.award_achievement(user_id, achievement['id'])
+            if awarded:
+                newly_awarded.append(awarded)
+        return newly_awarded
+
     @staticmethod
     def check_achievement_progress(user_id: int) -> List[Dict]:
         # Check progress for all achievements, award those that meet criteria, and return unearned achievements with progress data.
@@ -477,13 +413,7 @@ class Achievements:
             conn = db.get_connection()
             cursor = conn.cursor(dictionary=True)
             
-            cursor.execute('''
-                SELECT id, name, description, criteria, exp_reward, category
-                FROM achievement_types
-                ORDER BY category, id
-            ''')
-            
-            all_achievements = cursor.fetchall()
+            all_achievements = ReferenceData.table('achievement_types').all()
             
             cursor.execute('''
                 SELECT achievement_id
@@ -501,11 +431,10 @@ class Achievements:
                 if achievement['id'] in earned_achievements:
                     continue
                     
-                if not achievement['criteria']:
+                if not isinstance(achievement['criteria'], dict):
                     continue
                     
-                criteria_json = achievement['criteria']
-                criteria = json.loads(criteria_json) if criteria_json else {}
+                criteria = achievement['criteria']
                 achievement['criteria_obj'] = criteria 
                 
                 criteria_met = False
@@ -543,7 +472,7 @@ class Achievements:
                     'name': achievement['name'],
                     'description': achievement['description'],
                     'category': achievement['category'],
-                    'criteria': criteria_json,  
+                    'criteria': criteria,  
                 }
                 
                 progress_data.update(stats)
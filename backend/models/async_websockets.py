@@ -0,0 +1,198 @@
+import asyncio
+import logging
+from urllib.parse import parse_qs
+
+import socketio
+
+from models.chat import AsyncChat
+from models.websockets import SOCKETIO_LOGGER, authenticate_socket, user_room
+from models import websockets
+from models import metrics
+from models import socket_broker
+from models import json_provider
+from database.instrumentation import instrument_async_event
+
+logger = logging.getLogger(__name__)
+
+# The ASGI runtime's Socket.IO server: the same events and payloads as
+# models/websockets.py, handled by coroutines on AsyncChat. An idle connection is a
+# parked coroutine and a few buffers, with no thread, greenlet or database connection.
+
+server_instance = None
+
+
+def chat_room_ids(sid):
+    return [int(room[5:]) for room in server_instance.rooms(sid)
+            if room.startswith('room_') and room[5:].isdigit()]
+
+
+async def socket_user(sid):
+    return (await server_instance.get_session(sid)).get('user')
+
+
+def create_async_socketio():
+    global server_instance
+    sio = socketio.AsyncServer(
+        async_mode='asgi',
+        cors_allowed_origins='*',
+        logger=SOCKETIO_LOGGER,
+        engineio_logger=SOCKETIO_LOGGER,
+        client_manager=socket_broker.async_client_manager(),
+        json=json_provider
+    )
+    server_instance = sio
+    metrics.init_socket_server(sio)
+
+    @sio.on('connect')
+    @instrument_async_event('connect')
+    async def handle_connect(sid, environ, auth=None):
+        try:
+            token = parse_qs(environ.get('QUERY_STRING', '')).get('token', [None])[0]
+            if not token:
+                logger.error("No token provided for socket connection")
+                return False
+
+            user = authenticate_socket(token)
+            if not user:
+                logger.error("Invalid token for socket connection")
+                return False
+
+            await sio.save_session(sid, {'user': {
+                'user_id': user['id'],
+                'username': user.get('username', 'Unknown')
+            }})
+            await sio.enter_room(sid, user_room(user['id']))
+            return True
+        except Exception as e:
+            logger.error(f"Connection error: {str(e)}")
+            return False
+
+    @sio.on('disconnect')
+    @instrument_async_event('disconnect')
+    async def handle_disconnect(sid):
+        try:
+            user = await socket_user(sid)
+            if user:
+                for room_id in chat_room_ids(sid):
+                    await sio.leave_room(sid, f"room_{room_id}")
+                    await sio.emit('user_left', {
+                        'username': user['username'],
+                        'room_id': room_id
+                    }, room=f"room_{room_id}")
+        except Exception as e:
+            logger.error(f"Disconnection error: {str(e)}")
+
+    @sio.on('join_chat')
+    @instrument_async_event('join_chat')
+    async def handle_join_chat(sid, data):
+        try:
+            token = data.get('token')
+            room_id = data.get('room_id')
+
+            if not token or not room_id:
+                await sio.emit('error', {'message': 'Missing token or room_id'}, to=sid)
+                return
+
+            user = authenticate_socket(token)
+            if not user:
+                await sio.emit('error', {'message': 'Invalid token'}, to=sid)
+                return
+
+            user_id = user.get('id') or user.get('user_id')
+            if not user_id:
+                await sio.emit('error', {'message': 'Invalid user data'}, to=sid)
+                return
+
+            joined = await AsyncChat.join_chat(room_id, user_id)
+            if not joined:
+                logger.error(f"Room {room_id} not found or access denied for user {user_id}")
+                await sio.emit('error', {'message': 'Room not found or access denied'}, to=sid)
+                return
+
+            await sio.enter_room(sid, f"room_{room_id}")
+
+            await sio.emit('user_joined', {
+                'username': user.get('username'),
+                'room_id': room_id
+            }, room=f"room_{room_id}")
+
+            await sio.emit('joined_chat', {
+                'success': True,
+                'room': joined['room'],
+                'participants': joined['participants']
+            }, to=sid)
+        except Exception as e:
+            logger.error(f"Error joining chat: {str(e)}")
+            await sio.emit('error', {'message': str(e)}, to=sid)
+
+    @sio.on('leave_chat')
+    @instrument_async_event('leave_chat')
+    async def handle_leave_chat(sid, data):
+        try:
+            room_id = data.get('room_id')
+            user = await socket_user(sid)
+            if not room_id or not user:
+                return
+
+            if f"room_{room_id}" in sio.rooms(sid):
+                await sio.leave_room(sid, f"room_{room_id}")
+
+                await sio.emit('user_left', {
+                    'username': user['username'],
+                    'room_id': room_id
+                }, room=f"room_{room_id}")
+
+                await sio.emit('left_chat', {'success': True}, to=sid)
+        except Exception as e:
+            logger.error(f"Error leaving chat: {str(e)}")
+            await sio.emit('error', {'message': str(e)}, to=sid)
+
+    @sio.on('send_message')
+    @instrument_async_event('send_message')
+    async def handle_send_message(sid, data):
+        try:
+            user = await socket_user(sid)
+            if not user:
+                await sio.emit('error', {'message': 'Not authenticated'}, to=sid)
+                return
+
+            room_id = data.get('room_id')
+            content = data.get('content')
+
+            if not room_id or not content:
+                await sio.emit('error', {'message': 'Missing room_id or content'}, to=sid)
+                return
+
+            if f"room_{room_id}" not in sio.rooms(sid):
+                await sio.emit('error', {'message': 'Not a member of this room'}, to=sid)
+                return
+
+            result = await AsyncChat.send_message(room_id, user['user_id'], content)
+            if result is None:
+                await sio.emit('error', {'message': 'Cannot send messages to this room'}, to=sid)
+                return
+
+            message = result['message']
+            if not message:
+                await sio.emit('error', {'message': 'Failed to create message'}, to=sid)
+                return
+
+            message['room_id'] = room_id
+
+            await sio.emit('new_message', message, room=f"room_{room_id}")
+
+            await sio.emit('message_sent', {'success': True}, to=sid)
+        except Exception as e:
+            logger.error(f"Error sending message: {str(e)}")
+            await sio.emit('error', {'message': str(e)}, to=sid)
+
+    return sio
+
+
+def bind_loop(loop):
+    # Route emit_event() from synchronous code (Flask views on worker threads, jobs)
+    # to the AsyncServer running on loop.
+    def emit_from_thread(event, data, room=None):
+        asyncio.run_coroutine_threadsafe(server_instance.emit(event, data, room=room), loop)
+
+    websockets.async_emitter = emit_from_thread
@@ -1,15 +1,22 @@
 import os
 import jwt
 import logging
+from contextvars import ContextVar
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify, current_app
-from models.user import User
+from models.login_state import LoginState
 from typing import Union, Optional, Dict, Any
 from database.connection import Database
+from database.query_layer import Statement, run_plan
+from database.async_connection import AsyncDatabase
 
 logger = logging.getLogger(__name__)
 
+# Set by the batch endpoint so its sub-requests reuse the user it authenticated
+# instead of each loading it again.
+batch_user: ContextVar[Optional[Dict[str, Any]]] = ContextVar('batch_user', default=None)
+
 def generate_token(user_data: Union[int, dict], expires_delta: timedelta = None) -> str:
     # Generate a JWT token for the user with optional expiration time.
     try:
@@ -55,36 +62,46 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
         logger.error(f"Unexpected error verifying token: {str(e)}")
         return None
 
-def get_current_user() -> Optional[Dict[str, Any]]:
-    # Get the current authenticated user from the request.
-    auth_header = request.headers.get('Authorization')
+def token_user_id(auth_header: Optional[str]) -> Optional[int]:
+    # The user id from an "Authorization: Bearer <token>" header, or None.
     if not auth_header:
         return None
     if not auth_header.startswith('Bearer '):
         return None
     
-    try:
-        token = auth_header.split(' ')[1]
-        
-        payload = verify_token(token)
-        if not payload:
-            logger.debug("Token verification failed")
-            return None
-            
-        user_id = payload.get('user_id')
-        if not user_id:
-            logger.debug("No user_id found in token payload")
-            return None
-        
-        try:
-            if isinstance(user_id, dict) and 'id' in user_id:
-                user_id = user_id['id']
-            user_id = int(user_id)
-        except (ValueError, TypeError) as e:
-            logger.error(f"Error converting user_id to integer: {str(e)}")
-            return None
+    token = auth_header.split(' ')[1]
+    
+    payload = verify_token(token)
+    if not payload:
+        logger.debug("Token verification failed")
+        return None
         
-        user = User.get_by_id(user_id)
+    user_id = payload.get('user_id')
+    if not user_id:
+        logger.debug("No user_id found in token payload")
+        return None
+    
+    try:
+        if isinstance(user_id, dict) and 'id' in user_id:
+            user_id = user_id['id']
+        return int(user_id)
+    except (ValueError, TypeError) as e:
+        logger.error(f"Error converting user_id to integer: {str(e)}")
+        return None
+
+class AuthQueries:
+    # Plans shared by get_current_user and AsyncAuth (see database/query_layer.py).
+
+    @staticmethod
+    def current_user(user_id: int):
+        user = yield Statement(
+            """
+            SELECT id, username, email, role, created_at, last_login, avatar_url, bio
+            FROM users
+            WHERE id = %s
+            """,
+            (user_id,), fetch='one', prepare=True
+        )
         if not user:
             logger.debug(f"No user found for user_id: {user_id}")
             return None
@@ -93,7 +110,7 @@ def get_current_user() -> Optional[Dict[str, Any]]:
         
         is_admin = user.get('role') == 'admin'
             
-        user_data = {
+        return {
             'id': int(user.get('id')),
             'username': user.get('username', ''),
             'email': user.get('email', ''),
@@ -104,7 +121,18 @@ def get_current_user() -> Optional[Dict[str, Any]]:
             'avatar_url': user.get('avatar_url'),
             'bio': user.get('bio')
         }
-        return user_data
+
+def get_current_user() -> Optional[Dict[str, Any]]:
+    # Get the current authenticated user from the request.
+    preauthenticated = batch_user.get()
+    if preauthenticated is not None:
+        return preauthenticated
+    
+    try:
+        user_id = token_user_id(request.headers.get('Authorization'))
+        if user_id is None:
+            return None
+        return run_plan(AuthQueries.current_user(user_id))
     except Exception as e:
         logger.error(f"Error in get_current_user: {str(e)}")
         return None
@@ -120,6 +148,18 @@ def token_required(f):
         return f(current_user, *args, **kwargs)
     return decorated
 
+def admin_required(f):
+    # Decorator for routes restricted to admins.
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        current_user = get_current_user()
+        if not current_user:
+            return jsonify({'error': 'Authentication required'}), 401
+        if not (current_user.get('is_admin') or 'admin' in current_user.get('roles', [])):
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(current_user, *args, **kwargs)
+    return decorated
+
 def optional_auth(f):
     # Decorator to optionally include authenticated user in routes.
     @wraps(f)
@@ -191,14 +231,37 @@ class Auth:
             connection.close()
     
     @staticmethod
-    def record_login_in_db(user_id, ip_address):
-        # Records a login in the user_logins table.
-        # Returns True if successful, False otherwise.
+    def update_password_hash(user_id, password_hash):
+        # Replaces a user's password hash, e.g. when upgrading legacy hash parameters.
         try:
             db = Database()
             connection = db.get_connection()
             cursor = connection.cursor()
             
+            cursor.execute(
+                "UPDATE users SET password_hash = %s WHERE id = %s",
+                (password_hash, user_id)
+            )
+            
+            connection.commit()
+            return True
+        except Exception as e:
+            print(f"Error updating password hash: {str(e)}")
+            connection.rollback()
+            raise e
+        finally:
+            cursor.close()
+            connection.close()
+    
+    @staticmethod
+    def record_login_in_db(user_id, ip_address):
+        # Records a login in the user_logins table and updates the user's login state.
+        # Returns the new login state if successful, None otherwise.
+        try:
+            db = Database()
+            connection = db.get_connection()
+            cursor = connection.cursor(dictionary=True)
+            
             cursor.execute(
                 """
                 INSERT INTO user_logins (user_id, login_time, ip_address)
@@ -206,13 +269,14 @@ class Auth:
                 """, 
                 (user_id, ip_address)
             )
+            state = LoginState.record(cursor, user_id)
             
             connection.commit()
-            return True
+            return state
         except Exception as e:
             print(f"Error recording login: {str(e)}")
             connection.rollback()
-            return False
+            return None
         finally:
             cursor.close()
             connection.close()
@@ -307,4 +371,18 @@ class Auth:
             raise e
         finally:
             cursor.close()
-            conn.close() 
\ No newline at end of file
+            conn.close() 
+
+class AsyncAuth:
+    # Auth resolution for the ASGI runtime, on the same plan as get_current_user.
+
+    @staticmethod
+    async def current_user(auth_header: Optional[str]) -> Optional[Dict[str, Any]]:
+        try:
+            user_id = token_user_id(auth_header)
+            if user_id is None:
+                return None
+            return await AsyncDatabase.run_plan(AuthQueries.current_user(user_id))
+        except Exception as e:
+            logger.error(f"Error in current_user: {str(e)}")
+            return None
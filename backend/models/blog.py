@@ -1,118 +1,130 @@
 from models.user_stats import UserStats
 from database.connection import Database
+from models.comment_tree import CommentTree
+from models.http_cache import ResourceVersions
+from models.reference_data import ReferenceData
+from models.related_content import RelatedContent
+from models.projection import Projection
+from models.list_query import ListQuery
+
+# Fields available to GET /blog?fields=; the summary matches what post cards render.
+BLOG_POST_LIST_FIELDS = Projection(
+    columns={
+        'id': 'bp.id',
+        'title': 'bp.title',
+        'excerpt': 'bp.excerpt',
+        'content': 'bp.content',
+        'author_id': 'bp.author_id',
+        'is_featured': 'bp.is_featured',
+        'status': 'bp.status',
+        'featured_image_url': 'bp.featured_image_url',
+        'created_at': 'bp.created_at',
+        'updated_at': 'bp.updated_at',
+        'author_name': 'u.username',
+        'author_avatar_url': 'u.avatar_url',
+        'views_count': 'COALESCE(bp.views_count, 0)',
+        'likes_count': '(SELECT COUNT(*) FROM blog_likes WHERE post_id = bp.id)',
+        'comments_count': '(SELECT COUNT(*) FROM blog_comments WHERE post_id = bp.id)',
+        'tags': {
+            'tag_ids': 'GROUP_CONCAT(DISTINCT t.id)',
+            'tag_names': 'GROUP_CONCAT(DISTINCT t.name)'
+        },
+        'is_liked': None,
+        'is_trending': None
+    },
+    summary=(
+        'id', 'title', 'excerpt', 'featured_image_url', 'created_at', 'author_id', 'author_name',
+        'author_avatar_url', 'views_count', 'likes_count', 'comments_count', 'tags', 'is_liked',
+        'is_trending'
+    )
+)
 
 class BlogPost:
     @staticmethod
-    def get_all(category=None, search=None, author_id=None, tag=None, page=1, per_page=10, current_user_id=None):
+    def get_all(category=None, search=None, author_id=None, tag=None, page=1, per_page=10, current_user_id=None,
+                fields=None, cursor=None):
         # Get all blog posts with optional filters and pagination.
+        # fields selects a projection of BLOG_POST_LIST_FIELDS; defaults to the card summary.
+        # cursor switches from page numbers to keyset pagination for deep pages: request
+        # page 1 without one, then pass each response's next_cursor back as cursor.
+        select_list, field_names = BLOG_POST_LIST_FIELDS.select(fields)
+        with_tags = 'tags' in field_names
+        
         db = Database()
         conn = db.get_connection()
         if not conn:
             raise Exception("Database connection failed")
         
         try:
-            cursor = conn.cursor(dictionary=True)
-            
-            trending_post_ids = BlogPost.get_trending_post_ids()
-            
-            query = """
-                SELECT DISTINCT 
-                    bp.*,
-                    u.username as author_name,
-                    u.avatar_url as author_avatar_url,
-                    COALESCE(bp.views_count, 0) as views_count,
-                    (SELECT COUNT(*) FROM blog_likes WHERE post_id = bp.id) as likes_count,
-                    (SELECT COUNT(*) FROM blog_comments WHERE post_id = bp.id) as comments_count,
-                    GROUP_CONCAT(DISTINCT t.id) as tag_ids,
-                    GROUP_CONCAT(DISTINCT t.name) as tag_names,
-                    CASE 
-                        WHEN %s IS NOT NULL THEN EXISTS(
-                            SELECT 1 FROM blog_likes 
-                            WHERE post_id = bp.id AND user_id = %s
-                        )
-                        ELSE FALSE
-                    END as is_liked
-                FROM blog_posts bp
-                LEFT JOIN users u ON bp.author_id = u.id
-                LEFT JOIN blog_post_tags pt ON bp.id = pt.post_id
-                LEFT JOIN blog_tags t ON pt.tag_id = t.id
-                WHERE 1=1
-            """
-            params = [current_user_id, current_user_id] 
-            
-            if category:
-                query += " AND bp.category = %s"
-                params.append(category)
-            if search:
-                query += " AND (bp.title LIKE %s OR bp.content LIKE %s OR bp.excerpt LIKE %s)"
-                search_term = f"%{search}%"
-                params.extend([search_term, search_term, search_term])
-            if author_id:
-                query += " AND bp.author_id = %s"
-                params.append(author_id)
-            if tag:
-                query += " AND EXISTS (SELECT 1 FROM blog_post_tags pt2 WHERE pt2.post_id = bp.id AND pt2.tag_id = %s)"
-                params.append(tag)
+            db_cursor = conn.cursor(dictionary=True)
             
-            query += " GROUP BY bp.id ORDER BY bp.created_at DESC"
-            
-            count_query = """
-                SELECT COUNT(DISTINCT bp.id) as total 
-                FROM blog_posts bp
-                LEFT JOIN users u ON bp.author_id = u.id
-                LEFT JOIN blog_likes l ON bp.id = l.post_id
-                LEFT JOIN blog_comments c ON bp.id = c.post_id
+            tag_joins = """
                 LEFT JOIN blog_post_tags pt ON bp.id = pt.post_id
                 LEFT JOIN blog_tags t ON pt.tag_id = t.id
-                WHERE 1=1
-            """
-            count_params = []
+            """ if with_tags else ""
+            list_query = ListQuery(
+                f"blog_posts bp LEFT JOIN users u ON bp.author_id = u.id {tag_joins}",
+                count_from="blog_posts bp"
+            )
             
             if category:
-                count_query += " AND bp.category = %s"
-                count_params.append(category)
+                list_query.where("bp.category = %s", category)
             if search:
-                count_query += " AND (bp.title LIKE %s OR bp.content LIKE %s OR bp.excerpt LIKE %s)"
                 search_term = f"%{search}%"
-                count_params.extend([search_term, search_term, search_term])
+                list_query.where("(bp.title LIKE %s OR bp.content LIKE %s OR bp.excerpt LIKE %s)",
+                                 search_term, search_term, search_term)
             if author_id:
-                count_query += " AND bp.author_id = %s"
-                count_params.append(author_id)
+                list_query.where("bp.author_id = %s", author_id)
             if tag:
-                count_query += " AND EXISTS (SELECT 1 FROM blog_post_tags pt2 WHERE pt2.post_id = bp.id AND pt2.tag_id = %s)"
-                count_params.append(tag)
-            
-            cursor.execute(count_query, count_params)
-            total = cursor.fetchone()['total']
-            
-            query += " LIMIT %s OFFSET %s"
-            offset = (page - 1) * per_page
-            params.extend([per_page, offset])
-            
-            cursor.execute(query, params)
-            posts = cursor.fetchall()
+                list_query.where("EXISTS (SELECT 1 FROM blog_post_tags pt2 WHERE pt2.post_id = bp.id AND pt2.tag_id = %s)", tag)
+            
+            group_by = "bp.id" if with_tags else None
+            if cursor:
+                result = list_query.fetch_after(db_cursor, select_list, "bp.created_at", "bp.id", cursor,
+                                                per_page=per_page, group_by=group_by)
+            else:
+                result = list_query.fetch_page(db_cursor, select_list, "bp.created_at DESC, bp.id DESC",
+                                               page=page, per_page=per_page, group_by=group_by,
+                                               cursor_columns=("bp.created_at", "bp.id"))
+            posts, total, next_cursor = result['rows'], result['total'], result['next_cursor']
+            
+            liked_ids = set()
+            if 'is_liked' in field_names and current_user_id and posts:
+                post_ids = [post['id'] for post in posts]
+                placeholders = ', '.join(['%s'] * len(post_ids))
+                db_cursor.execute(f"""
+                    SELECT post_id FROM blog_likes
+                    WHERE user_id = %s AND post_id IN ({placeholders})
+                """, [current_user_id] + post_ids)
+                liked_ids = {row['post_id'] for row in db_cursor.fetchall()}
+            
+            trending_post_ids = BlogPost.get_trending_post_ids() if 'is_trending' in field_names else []
             
             for post in posts:
-                is_trending = post['id'] in trending_post_ids
-                post['is_trending'] = is_trending
+                if 'is_liked' in field_names:
+                    post['is_liked'] = post['id'] in liked_ids
+                if 'is_trending' in field_names:
+                    post['is_trending'] = post['id'] in trending_post_ids
                 
-                if post['tag_ids']:
-                    post['tags'] = [
-                        {'id': int(id), 'name': name}
-                        for id, name in zip(
-                            post['tag_ids'].split(','),
-                            post['tag_names'].split(',')
-                        )
-                    ]
-                else:
-                    post['tags'] = []
-                del post['tag_ids']
-                del post['tag_names']
+                if with_tags:
+                    if post['tag_ids']:
+                        post['tags'] = [
+                            {'id': int(id), 'name': name}
+                            for id, name in zip(
+                                post['tag_ids'].split(','),
+                                post['tag_names'].split(',')
+                            )
+                        ]
+                    else:
+                        post['tags'] = []
+                    del post['tag_ids']
+                    del post['tag_names']
             
             return {
                 'posts': posts,
                 'total': total,
-                'total_pages': (total + per_page - 1) // per_page
+                'total_pages': (total + per_page - 1) // per_page,
+                'next_cursor': next_cursor
             }
             
         except Exception as e:
@@ -122,7 +134,7 @@ class BlogPost:
             print(f"Error details: {e}")
             raise e
         finally:
-            cursor.close()
+            db_cursor.close()
             conn.close()
 
     @staticmethod
@@ -298,6 +310,13 @@ class BlogPost:
                     )
                 conn.commit()
             
+            ResourceVersions.bump('blog_categories', 'blog_tags')
+            
+            try:
+                RelatedContent.refresh_item('blog', post_id)
+            except Exception as e:
+                print(f"Error updating related content: {str(e)}")
+            
             return BlogPost.get_by_id(post_id)
         except Exception as e:
             conn.rollback()
@@ -357,6 +376,13 @@ class BlogPost:
                         )
                 
                 conn.commit()
+                
+                ResourceVersions.bump('blog_categories', 'blog_tags')
+                
+                try:
+                    RelatedContent.refresh_item('blog', post_id)
+                except Exception as e:
+                    print(f"Error updating related content: {str(e)}")
             
             return BlogPost.get_by_id(post_id)
         except Exception as e:
@@ -379,6 +405,14 @@ class BlogPost:
             cursor.execute("DELETE FROM blog_posts WHERE id = %s", (post_id,))
             
             conn.commit()
+            
+            ResourceVersions.bump('blog_categories', 'blog_tags')
+            
+            try:
+                RelatedContent.remove_item('blog', post_id)
+            except Exception as e:
+                print(f"Error updating related content: {str(e)}")
+            
             return True
         except Exception as e:
             conn.rollback()
@@ -390,28 +424,20 @@ class BlogPost:
 
     @staticmethod
     def get_related(post_id, limit=3, current_user_id=None):
-        """Get posts related to the specified post based on shared tags."""
+        """Get posts related to the specified post from the precomputed related-content index."""
         try:
             db = Database()
             conn = db.get_connection()
             cursor = conn.cursor(dictionary=True)
             
-            tag_query = """
-                SELECT pt.tag_id 
-                FROM blog_post_tags pt 
-                WHERE pt.post_id = %s
-            """
-            cursor.execute(tag_query, (post_id,))
-            tag_rows = cursor.fetchall()
+            related_ids = RelatedContent.get_related_ids('blog', post_id, limit)
             
-            if not tag_rows:
+            if not related_ids:
                 return []
             
-            tag_ids = [row['tag_id'] for row in tag_rows]
-            
-            placeholders = ', '.join(['%s'] * len(tag_ids))
+            placeholders = ', '.join(['%s'] * len(related_ids))
             query = f"""
-                SELECT DISTINCT 
+                SELECT 
                     bp.*,
                     u.username as author_name,
                     COALESCE(bp.views_count, 0) as views_count,
@@ -419,7 +445,6 @@ class BlogPost:
                     (SELECT COUNT(*) FROM blog_comments WHERE post_id = bp.id) as comments_count,
                     GROUP_CONCAT(DISTINCT t.id) as tag_ids,
                     GROUP_CONCAT(DISTINCT t.name) as tag_names,
-                    COUNT(DISTINCT pt.tag_id) as matching_tags_count,
                     CASE 
                         WHEN %s IS NOT NULL THEN EXISTS(
                             SELECT 1 FROM blog_likes 
@@ -428,20 +453,18 @@ class BlogPost:
                         ELSE FALSE
                     END as is_liked
                 FROM blog_posts bp
-                JOIN blog_post_tags pt ON bp.id = pt.post_id
-                JOIN blog_tags t ON pt.tag_id = t.id
                 JOIN users u ON bp.author_id = u.id
-                WHERE pt.tag_id IN ({placeholders}) 
-                AND bp.id != %s
+                LEFT JOIN blog_post_tags pt ON bp.id = pt.post_id
+                LEFT JOIN blog_tags t ON pt.tag_id = t.id
+                WHERE bp.id IN ({placeholders})
                 GROUP BY bp.id
-                ORDER BY matching_tags_count DESC, bp.created_at DESC
-                LIMIT %s
             """
             
-            params = [current_user_id, current_user_id] + tag_ids + [post_id, limit]
+            params = [current_user_id, current_user_id] + related_ids
             
             cursor.execute(query, params)
-            posts = cursor.fetchall()
+            rank = {related_id: position for position, related_id in enumerate(related_ids)}
+            posts = sorted(cursor.fetchall(), key=lambda post: rank[post['id']])
             
             for post in posts:
                 if post['tag_ids']:
@@ -456,7 +479,6 @@ class BlogPost:
                     post['tags'] = []
                 del post['tag_ids']
                 del post['tag_names']
-                del post['matching_tags_count']
             
             return posts
         except Exception as e:
@@ -529,31 +551,26 @@ class BlogPost:
             conn.close()
 
     @staticmethod
-    def get_comments(post_id):
+    def get_comments(post_id, limit=20, cursor=None, current_user_id=None, threaded=False):
+        # Get every comment as a flat list, or with threaded=True a page of top-level
+        # comments with their reply threads.
         try:
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT 
-                    c.*,
-                    u.username as author_name,
-                    u.avatar_url as author_avatar_url
-                FROM blog_comments c
-                LEFT JOIN users u ON c.user_id = u.id
-                WHERE c.post_id = %s
-                ORDER BY c.created_at DESC
-            """
-            
-            cursor.execute(query, (post_id,))
-            return cursor.fetchall()
+            if not threaded:
+                return {
+                    'items': CommentTree.load_flat('blog', post_id, viewer_id=current_user_id),
+                    'has_more': False,
+                    'next_cursor': None
+                }
+            return CommentTree.load(
+                'blog',
+                post_id,
+                limit=limit,
+                cursor=cursor,
+                viewer_id=current_user_id
+            )
         except Exception as e:
             print(f"Error in get_comments: {str(e)}")
             raise e
-        finally:
-            cursor.close()
-            conn.close()
 
     @staticmethod
     def add_comment(post_id, user_id, content):
@@ -604,25 +621,30 @@ class BlogPost:
     @staticmethod
     def get_categories():
         try:
+            categories = ReferenceData.table('categories').all()
+            
             db = Database()
             conn = db.get_connection()
             cursor = conn.cursor(dictionary=True)
             
             cursor.execute("""
-                SELECT c.*, COUNT(b.id) as post_count
-                FROM categories c
-                LEFT JOIN blog_posts b ON c.id = b.category_id
-                GROUP BY c.id
-                ORDER BY c.name
+                SELECT category_id, COUNT(*) as count
+                FROM blog_posts
+                GROUP BY category_id
             """)
+            counts = {row['category_id']: row['count'] for row in cursor.fetchall()}
             
-            return cursor.fetchall()
+            for category in categories:
+                category['post_count'] = counts.get(category['id'], 0)
+            
+            return categories
         except Exception as e:
             print(f"Error in get_categories: {str(e)}")
             raise e
         finally:
-            cursor.close()
-            conn.close()
+            if 'cursor' in locals():
+                cursor.close()
+                conn.close()
 
     @staticmethod
     def get_tags():
@@ -1,5 +1,8 @@
 from models.notification import Notification
-from database.connection import Database
+from database.connection import Database, run_in_transaction
+from models.exp_ledger import ExpLedger
+from models.http_cache import ResourceVersions
+from models.reference_data import ReferenceData
 from enum import Enum
 import json
 
@@ -116,6 +119,7 @@ class Challenge:
             
             conn.commit()
             challenge_id = cursor.lastrowid
+            ResourceVersions.bump('challenge_categories')
             
             return Challenge.get_by_id(challenge_id)
         except Exception as e:
@@ -183,6 +187,7 @@ class Challenge:
                 
                 cursor.execute(query, params)
                 conn.commit()
+                ResourceVersions.bump('challenge_categories')
             
             return Challenge.get_by_id(challenge_id)
         except Exception as e:
@@ -383,25 +388,30 @@ class Challenge:
     @staticmethod
     def get_categories():
         try:
+            categories = ReferenceData.table('categories').all()
+            
             db = Database()
             conn = db.get_connection()
             cursor = conn.cursor(dictionary=True)
             
             cursor.execute("""
-                SELECT c.*, COUNT(ch.id) as challenge_count
-                FROM categories c
-                LEFT JOIN challenges ch ON c.id = ch.category_id
-                GROUP BY c.id
-                ORDER BY c.name
+                SELECT category_id, COUNT(*) as count
+                FROM challenges
+                GROUP BY category_id
             """)
+            counts = {row['category_id']: row['count'] for row in cursor.fetchall()}
             
-            return cursor.fetchall()
+            for category in categories:
+                category['challenge_count'] = counts.get(category['id'], 0)
+            
+            return categories
         except Exception as e:
             print(f"Error in get_categories: {str(e)}")
             raise e
         finally:
-            cursor.close()
-            conn.close()
+            if 'cursor' in locals():
+                cursor.close()
+                conn.close()
 
     @staticmethod
     def submit(challenge_id, user_id, submission):
@@ -488,15 +498,7 @@ class Challenge:
     @staticmethod
     def review_submission(submission_id: int, is_approved: bool, feedback: str = None) -> bool:
         # Review a challenge submission and update both challenge_submissions and challenge_status tables.
-        db = Database()
-        conn = None
-        cursor = None
-        submission_data = None
-        
-        try:
-            conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-
+        def review(cursor):
             cursor.execute("""
                 SELECT 
                     cs.*, 
@@ -513,7 +515,7 @@ class Challenge:
             submission = cursor.fetchone()
             if not submission:
                 print(f"No pending submission found with ID {submission_id}")
-                return False
+                return None
 
             submission_data = {
                 'user_id': submission['user_id'],
@@ -533,7 +535,7 @@ class Challenge:
 
             if cursor.rowcount == 0:
                 print(f"Submission {submission_id} was already reviewed")
-                return False
+                return None
 
             cursor.execute("""
                 UPDATE challenge_status 
@@ -550,39 +552,35 @@ class Challenge:
             ))
 
             if is_approved:
-                cursor.execute("""
-                    UPDATE users 
-                    SET exp = exp + %s 
-                    WHERE id = %s
-                """, (submission_data['exp_reward'], submission_data['user_id']))
-                
-                try:
-                    from models.user_stats import UserStats
-                    UserStats.update_stat_and_achievements(
-                        submission_data['user_id'], 
-                        'challenges_completed',
-                        {
-                            'challenge_id': submission_data['challenge_id'],
-                            'challenge_title': submission_data['challenge_title']
-                        }
-                    )
-                except Exception as e:
-                    print(f"Error updating stats: {str(e)}")
-
-            conn.commit()
-            print(f"Successfully reviewed submission {submission_id}")
+                # Reviewed rewards are granted in full, outside the daily limit.
+                ExpLedger.apply(
+                    cursor, submission_data['user_id'], submission_data['exp_reward'],
+                    'challenge_completed', submission_data['challenge_id'], capped=False
+                )
+            return submission_data
 
+        try:
+            submission_data = run_in_transaction(review)
         except Exception as e:
             print(f"Error reviewing submission: {str(e)}")
-            if conn:
-                conn.rollback()
             return False
-
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
+        if not submission_data:
+            return False
+        print(f"Successfully reviewed submission {submission_id}")
+
+        if is_approved:
+            try:
+                from models.user_stats import UserStats
+                UserStats.update_stat_and_achievements(
+                    submission_data['user_id'], 
+                    'challenges_completed',
+                    {
+                        'challenge_id': submission_data['challenge_id'],
+                        'challenge_title': submission_data['challenge_title']
+                    }
+                )
+            except Exception as e:
+                print(f"Error updating stats: {str(e)}")
 
         try:
             if submission_data:
@@ -3,9 +3,191 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any, Union
 
 from database.connection import Database
+from database.query_layer import Statement, run_plan
+from database.async_connection import AsyncDatabase
 
 logger = logging.getLogger(__name__)
 
+
+def _format_room(room: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': room['id'],
+        'name': room['name'],
+        'description': room['description'],
+        'type': room['type'],
+        'created_at': room['created_at']
+    }
+
+
+class ChatQueries:
+    # Chat logic shared by the models below (WSGI) and AsyncChat (ASGI), written as
+    # query_layer plans.
+
+    @staticmethod
+    def room_by_id(room_id: int):
+        room = yield Statement(
+            """
+            SELECT id, name, description, created_at, type
+            FROM chat_rooms
+            WHERE id = %s
+            """,
+            (room_id,), fetch='one'
+        )
+        return _format_room(room) if room else None
+
+    @staticmethod
+    def is_participant(room_id: int, user_id: int):
+        row = yield Statement(
+            """
+            SELECT 1 AS found
+            FROM chat_room_participants
+            WHERE room_id = %s AND user_id = %s
+            """,
+            (room_id, user_id), fetch='one', prepare=True
+        )
+        return row is not None
+
+    @staticmethod
+    def join_room(room_id: int, user_id: int):
+        room = yield from ChatQueries.room_by_id(room_id)
+        if not room:
+            return False
+        if (yield from ChatQueries.is_participant(room_id, user_id)):
+            return True
+        yield Statement(
+            """
+            INSERT IGNORE INTO chat_room_participants (room_id, user_id, role, joined_at, last_read_at)
+            VALUES (%s, %s, 'member', NOW(), NOW())
+            """,
+            (room_id, user_id), fetch=None
+        )
+        return True
+
+    @staticmethod
+    def create_message(room_id: int, sender_id: int, content: str):
+        result = yield Statement(
+            """
+            INSERT INTO chat_messages (room_id, sender_id, content, created_at)
+            VALUES (%s, %s, %s, NOW())
+            """,
+            (room_id, sender_id, content), fetch=None, prepare=True
+        )
+        message = yield Statement(
+            """
+            SELECT 
+                cm.id, 
+                cm.content, 
+                cm.created_at,
+                u.username as sender_name 
+            FROM chat_messages cm
+            JOIN users u ON cm.sender_id = u.id
+            WHERE cm.id = %s
+            """,
+            (result['lastrowid'],), fetch='one', prepare=True
+        )
+        if not message:
+            return None
+        return {
+            'id': message['id'],
+            'content': message['content'],
+            'sender_name': message['sender_name'],
+            'created_at': message['created_at']
+        }
+
+    @staticmethod
+    def send_message(room_id: int, sender_id: int, content: str):
+        # Post a message, joining public rooms on the way. Returns {'message': ...}
+        # (None if the insert found nothing), or None if the sender may not post here.
+        if not (yield from ChatQueries.is_participant(room_id, sender_id)):
+            room = yield from ChatQueries.room_by_id(room_id)
+            if not room or room['type'] != 'public':
+                return None
+            yield from ChatQueries.join_room(room_id, sender_id)
+        message = yield from ChatQueries.create_message(room_id, sender_id, content)
+        return {'message': message}
+
+    @staticmethod
+    def join_chat(room_id: int, user_id: int):
+        # Enter a room's live chat: the room and its participants, joining the user to
+        # public rooms. None if the room does not exist or is private to others.
+        room = yield Statement(
+            """
+            SELECT r.*, 
+                   CASE WHEN p.user_id IS NOT NULL THEN 1 ELSE 0 END as is_member
+            FROM chat_rooms r
+            LEFT JOIN chat_room_participants p 
+                ON r.id = p.room_id AND p.user_id = %s
+            WHERE r.id = %s AND (r.type = 'public' OR p.user_id IS NOT NULL)
+            """,
+            (user_id, room_id), fetch='one'
+        )
+        if not room:
+            return None
+
+        participants = yield Statement(
+            """
+            SELECT u.id, u.username, p.role, p.joined_at
+            FROM chat_room_participants p
+            JOIN users u ON p.user_id = u.id
+            WHERE p.room_id = %s
+            """,
+            (room_id,)
+        )
+
+        if not room['is_member']:
+            yield Statement(
+                """
+                INSERT IGNORE INTO chat_room_participants 
+                (room_id, user_id, role, last_read_at)
+                VALUES (%s, %s, 'member', CURRENT_TIMESTAMP)
+                """,
+                (room_id, user_id), fetch=None
+            )
+
+        return {
+            'room': dict(_format_room(room), is_member=room['is_member']),
+            'participants': [{
+                'id': p['id'],
+                'username': p['username'],
+                'role': p['role'],
+                'joined_at': p['joined_at']
+            } for p in participants]
+        }
+
+    @staticmethod
+    def unread_count(room_id: int, user_id: int):
+        result = yield Statement(
+            """
+            SELECT 
+                COUNT(cm.id) as unread_count
+            FROM chat_messages cm
+            JOIN chat_room_participants crp ON cm.room_id = crp.room_id
+            WHERE cm.room_id = %s 
+            AND crp.user_id = %s
+            AND (crp.last_read_at IS NULL OR cm.created_at > crp.last_read_at)
+            """,
+            (room_id, user_id), fetch='one', prepare=True
+        )
+        return result['unread_count'] if result else 0
+
+    @staticmethod
+    def all_unread_counts(user_id: int):
+        results = yield Statement(
+            """
+            SELECT 
+                crp.room_id,
+                COUNT(cm.id) as unread_count
+            FROM chat_room_participants crp
+            LEFT JOIN chat_messages cm ON crp.room_id = cm.room_id 
+                AND (crp.last_read_at IS NULL OR cm.created_at > crp.last_read_at)
+            WHERE crp.user_id = %s
+            GROUP BY crp.room_id
+            """,
+            (user_id,), prepare=True
+        )
+        return {result['room_id']: result['unread_count'] for result in results}
+
+
 class ChatMessage:
     # Model class for chat messages.
     
@@ -13,53 +195,10 @@ class ChatMessage:
     def create(room_id: int, sender_id: int, content: str) -> Dict[str, Any]:
         # Create a new chat message.
         try:
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute(
-                """
-                INSERT INTO chat_messages (room_id, sender_id, content, created_at)
-                VALUES (%s, %s, %s, NOW())
-                """,
-                (room_id, sender_id, content)
-            )
-            
-            message_id = cursor.lastrowid
-            conn.commit()
-            
-            cursor.execute(
-                """
-                SELECT 
-                    cm.id, 
-                    cm.content, 
-                    cm.created_at,
-                    u.username as sender_name 
-                FROM chat_messages cm
-                JOIN users u ON cm.sender_id = u.id
-                WHERE cm.id = %s
-                """,
-                (message_id,)
-            )
-            
-            message = cursor.fetchone()
-            
-            if message:
-                return {
-                    'id': message['id'],
-                    'content': message['content'],
-                    'sender_name': message['sender_name'],
-                    'created_at': message['created_at'].isoformat() if message['created_at'] else None
-                }
-            return None
-            
+            return run_plan(ChatQueries.create_message(room_id, sender_id, content), commit=True)
         except Exception as e:
-            conn.rollback()
             logger.error(f"Error creating message: {str(e)}")
             raise e
-        finally:
-            cursor.close()
-            conn.close()
     
     @staticmethod
     def get_room_messages(room_id: int, page: int = 1, per_page: int = 50) -> List[Dict[str, Any]]:
@@ -99,7 +238,7 @@ class ChatMessage:
                     'content': message['content'],
                     'sender_id': message['sender_id'],
                     'sender_name': message['sender_name'],
-                    'created_at': message['created_at'].isoformat() if message['created_at'] else None
+                    'created_at': message['created_at']
                 })
                 
             return formatted_messages
@@ -146,7 +285,7 @@ class Chat:
                     'name': room['name'],
                     'description': room['description'],
                     'type': room['type'],
-                    'created_at': room['created_at'].isoformat() if room['created_at'] else None
+                    'created_at': room['created_at']
                 })
                 
             return formatted_rooms
@@ -162,105 +301,46 @@ class Chat:
     def get_room_by_id(room_id: int) -> Optional[Dict[str, Any]]:
         # Get a chat room by its ID.
         try:
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute(
-                """
-                SELECT 
-                    id, 
-                    name, 
-                    description, 
-                    created_at,
-                    type
-                FROM chat_rooms
-                WHERE id = %s
-                """,
-                (room_id,)
-            )
-            
-            room = cursor.fetchone()
-            
-            if room:
-                return {
-                    'id': room['id'],
-                    'name': room['name'],
-                    'description': room['description'],
-                    'type': room['type'],
-                    'created_at': room['created_at'].isoformat() if room['created_at'] else None
-                }
-            return None
-            
+            return run_plan(ChatQueries.room_by_id(room_id))
         except Exception as e:
             logger.error(f"Error getting chat room by ID: {str(e)}")
             raise e
-        finally:
-            cursor.close()
-            conn.close()
     
     @staticmethod
     def is_participant(room_id: int, user_id: int) -> bool:
         # Check if a user is a participant in a chat room.
-
         try:
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute(
-                """
-                SELECT COUNT(*) as count
-                FROM chat_room_participants
-                WHERE room_id = %s AND user_id = %s
-                """,
-                (room_id, user_id)
-            )
-            
-            result = cursor.fetchone()
-            
-            return result['count'] > 0
-            
+            return run_plan(ChatQueries.is_participant(room_id, user_id))
         except Exception as e:
             logger.error(f"Error checking if user is participant: {str(e)}")
             raise e
-        finally:
-            cursor.close()
-            conn.close()
     
     @staticmethod
     def join_room(room_id: int, user_id: int) -> bool:
         # Add a user to a chat room.
-
         try:
-            room = Chat.get_room_by_id(room_id)
-            if not room:
-                return False
-                
-            if Chat.is_participant(room_id, user_id):
-                return True
-                
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                """
-                INSERT INTO chat_room_participants (room_id, user_id, role, joined_at, last_read_at)
-                VALUES (%s, %s, 'member', NOW(), NOW())
-                """,
-                (room_id, user_id)
-            )
-            
-            conn.commit()
-            return True
-            
+            return run_plan(ChatQueries.join_room(room_id, user_id), commit=True)
         except Exception as e:
             logger.error(f"Error joining chat room: {str(e)}")
             return False
-        finally:
-            cursor.close()
-            conn.close()
+    
+    @staticmethod
+    def join_chat(room_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        # Enter a room's live chat; see ChatQueries.join_chat.
+        try:
+            return run_plan(ChatQueries.join_chat(room_id, user_id), commit=True)
+        except Exception as e:
+            logger.error(f"Error joining chat: {str(e)}")
+            raise e
+    
+    @staticmethod
+    def send_message(room_id: int, sender_id: int, content: str) -> Optional[Dict[str, Any]]:
+        # Post a message, joining public rooms first; see ChatQueries.send_message.
+        try:
+            return run_plan(ChatQueries.send_message(room_id, sender_id, content), commit=True)
+        except Exception as e:
+            logger.error(f"Error sending message: {str(e)}")
+            raise e
     
     @staticmethod
     def leave_room(room_id: int, user_id: int) -> bool:
@@ -322,7 +402,7 @@ class Chat:
                     'user_id': participant['user_id'],
                     'username': participant['username'],
                     'role': participant['role'],
-                    'joined_at': participant['joined_at'].isoformat() if participant['joined_at'] else None
+                    'joined_at': participant['joined_at']
                 })
                 
             return formatted_participants
@@ -338,71 +418,19 @@ class Chat:
     def get_unread_count(room_id: int, user_id: int) -> int:
         # Get the count of unread messages in a specific room for a user.
         try:
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute(
-                """
-                SELECT 
-                    COUNT(cm.id) as unread_count
-                FROM chat_messages cm
-                JOIN chat_room_participants crp ON cm.room_id = crp.room_id
-                WHERE cm.room_id = %s 
-                AND crp.user_id = %s
-                AND (crp.last_read_at IS NULL OR cm.created_at > crp.last_read_at)
-                """,
-                (room_id, user_id)
-            )
-            
-            result = cursor.fetchone()
-            
-            return result['unread_count'] if result else 0
-            
+            return run_plan(ChatQueries.unread_count(room_id, user_id))
         except Exception as e:
             logger.error(f"Error getting unread count: {str(e)}")
             return 0
-        finally:
-            cursor.close()
-            conn.close()
     
     @staticmethod
     def get_all_unread_counts(user_id: int) -> Dict[int, int]:
         # Get unread message counts for all rooms the user is a participant in.
-        
         try:
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute(
-                """
-                SELECT 
-                    crp.room_id,
-                    COUNT(cm.id) as unread_count
-                FROM chat_room_participants crp
-                LEFT JOIN chat_messages cm ON crp.room_id = cm.room_id 
-                    AND (crp.last_read_at IS NULL OR cm.created_at > crp.last_read_at)
-                WHERE crp.user_id = %s
-                GROUP BY crp.room_id
-                """,
-                (user_id,)
-            )
-            
-            results = cursor.fetchall()
-            
-            unread_counts = {}
-            for result in results:
-                unread_counts[result['room_id']] = result['unread_count']
-                
-            return unread_counts
-            
+            return run_plan(ChatQueries.all_unread_counts(user_id))
         except Exception as e:
             logger.error(f"Error getting all unread counts: {str(e)}")
             return {}
-        finally:
-            cursor.close()
-            conn.close()
     
     @staticmethod
     def mark_messages_read(room_id: int, user_id: int) -> bool:
@@ -432,3 +460,47 @@ class Chat:
         finally:
             cursor.close()
             conn.close()
+
+
+class AsyncChat:
+    # Coroutine versions of the hot chat paths for the ASGI runtime, on the same plans.
+
+    @staticmethod
+    async def get_room_by_id(room_id: int) -> Optional[Dict[str, Any]]:
+        return await AsyncDatabase.run_plan(ChatQueries.room_by_id(room_id))
+
+    @staticmethod
+    async def is_participant(room_id: int, user_id: int) -> bool:
+        return await AsyncDatabase.run_plan(ChatQueries.is_participant(room_id, user_id))
+
+    @staticmethod
+    async def join_room(room_id: int, user_id: int) -> bool:
+        try:
+            return await AsyncDatabase.run_plan(ChatQueries.join_room(room_id, user_id), commit=True)
+        except Exception as e:
+            logger.error(f"Error joining chat room: {str(e)}")
+            return False
+
+    @staticmethod
+    async def join_chat(room_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        return await AsyncDatabase.run_plan(ChatQueries.join_chat(room_id, user_id), commit=True)
+
+    @staticmethod
+    async def send_message(room_id: int, sender_id: int, content: str) -> Optional[Dict[str, Any]]:
+        return await AsyncDatabase.run_plan(ChatQueries.send_message(room_id, sender_id, content), commit=True)
+
+    @staticmethod
+    async def get_unread_count(room_id: int, user_id: int) -> int:
+        try:
+            return await AsyncDatabase.run_plan(ChatQueries.unread_count(room_id, user_id))
+        except Exception as e:
+            logger.error(f"Error getting unread count: {str(e)}")
+            return 0
+
+    @staticmethod
+    async def get_all_unread_counts(user_id: int) -> Dict[int, int]:
+        try:
+            return await AsyncDatabase.run_plan(ChatQueries.all_unread_counts(user_id))
+        except Exception as e:
+            logger.error(f"Error getting all unread counts: {str(e)}")
+            return {}
@@ -0,0 +1,251 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple
+
+from database.connection import Database
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_DEPTH = 8
+DEFAULT_MAX_CHILDREN = 50
+
+# Comment tables that share the (id, parent_id, user_id, created_at) layout.
+# likes_table is None for sources that do not support comment likes.
+COMMENT_SOURCES = {
+    'learning': {
+        'table': 'learning_material_comments',
+        'owner_column': 'material_id',
+        'likes_table': 'learning_material_comment_likes',
+        'user_columns': 'u.username, u.avatar_url as user_avatar'
+    },
+    'blog': {
+        'table': 'blog_comments',
+        'owner_column': 'post_id',
+        'likes_table': 'blog_likes',
+        'user_columns': 'u.username as author_name, u.avatar_url as author_avatar_url'
+    },
+    'event': {
+        'table': 'event_comments',
+        'owner_column': 'event_id',
+        'likes_table': None,
+        'user_columns': 'u.username as author_name, u.avatar_url as author_avatar_url'
+    }
+}
+
+
+class CommentTree:
+    # Loads threaded comments for any comment source in a fixed number of queries.
+
+    @staticmethod
+    def encode_cursor(comment: Dict[str, Any]) -> Optional[str]:
+        # Build a keyset cursor from the last root comment of a page.
+        if not comment or not comment.get('created_at'):
+            return None
+        created_at = comment['created_at']
+        if isinstance(created_at, datetime):
+            created_at = created_at.isoformat()
+        return f"{created_at}_{comment['id']}"
+
+    @staticmethod
+    def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+        # Parse a cursor produced by encode_cursor, returning None if it is malformed.
+        if not cursor:
+            return None
+        try:
+            created_at, comment_id = cursor.rsplit('_', 1)
+            return datetime.fromisoformat(created_at), int(comment_id)
+        except (ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def count_roots(source: str, owner_id: int) -> int:
+        # Count top-level comments for an owner.
+        config = COMMENT_SOURCES[source]
+        db = Database()
+        conn = db.get_connection()
+        cursor = conn.cursor(dictionary=True)
+
+        try:
+            cursor.execute(f"""
+                SELECT COUNT(*) as total
+                FROM {config['table']}
+                WHERE {config['owner_column']} = %s AND parent_id IS NULL
+            """, (owner_id,))
+            result = cursor.fetchone()
+            return result['total'] if result else 0
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def load_flat(source: str, owner_id: int, viewer_id: int = None) -> List[Dict[str, Any]]:
+        # Every comment of an owner, newest first, as a flat list linked by parent_id.
+        # This is the default response of the blog and event endpoints; load() is the
+        # threaded, paginated alternative they serve with ?threaded=1.
+        config = COMMENT_SOURCES[source]
+        db = Database()
+        conn = db.get_connection()
+        if not conn:
+            raise Exception("Database connection failed")
+        db_cursor = conn.cursor(dictionary=True)
+
+        try:
+            db_cursor.execute(f"""
+                SELECT c.*, {config['user_columns']}
+                FROM {config['table']} c
+                LEFT JOIN users u ON c.user_id = u.id
+                WHERE c.{config['owner_column']} = %s
+                ORDER BY c.created_at DESC, c.id DESC
+            """, (owner_id,))
+            rows = db_cursor.fetchall()
+            likes_counts, liked_ids = CommentTree._load_likes(
+                db_cursor, config['likes_table'], [row['id'] for row in rows], viewer_id
+            )
+        finally:
+            db_cursor.close()
+            conn.close()
+
+        if config['likes_table']:
+            for row in rows:
+                row['likes_count'] = likes_counts.get(row['id'], 0)
+                row['is_liked'] = row['id'] in liked_ids
+        return rows
+
+    @staticmethod
+    def load(source: str, owner_id: int, limit: int = 10, cursor: str = None, offset: int = 0,
+             viewer_id: int = None, max_depth: int = DEFAULT_MAX_DEPTH,
+             max_children: int = DEFAULT_MAX_CHILDREN) -> Dict[str, Any]:
+        # Load a page of root comments with all their descendants.
+        # Roots are ordered newest first; replies oldest first. Pass either a keyset
+        # cursor (preferred) or an offset for legacy page-number callers.
+        config = COMMENT_SOURCES[source]
+        table = config['table']
+        after = CommentTree.decode_cursor(cursor)
+
+        root_conditions = [f"{config['owner_column']} = %s", "parent_id IS NULL"]
+        root_params: List[Any] = [owner_id]
+        if after:
+            root_conditions.append("(created_at < %s OR (created_at = %s AND id < %s))")
+            root_params.extend([after[0], after[0], after[1]])
+
+        # Fetch one extra root to know whether another page exists.
+        root_params.append(limit + 1)
+        if not after and offset:
+            roots_limit = "LIMIT %s OFFSET %s"
+            root_params.append(offset)
+        else:
+            roots_limit = "LIMIT %s"
+
+        db = Database()
+        conn = db.get_connection()
+        if not conn:
+            raise Exception("Database connection failed")
+        db_cursor = conn.cursor(dictionary=True)
+
+        try:
+            # Replies are ranked among their siblings, oldest first, and only the first
+            # max_children of each parent are followed. The ranking sits in its own CTE
+            # because window functions are not allowed in the recursive part.
+            db_cursor.execute(f"""
+                WITH RECURSIVE roots AS (
+                    SELECT id
+                    FROM {table}
+                    WHERE {' AND '.join(root_conditions)}
+                    ORDER BY created_at DESC, id DESC
+                    {roots_limit}
+                ),
+                replies AS (
+                    SELECT id, parent_id,
+                           ROW_NUMBER() OVER (PARTITION BY parent_id ORDER BY created_at ASC, id ASC) as sibling_rank,
+                           COUNT(*) OVER (PARTITION BY parent_id) as sibling_count
+                    FROM {table}
+                    WHERE {config['owner_column']} = %s AND parent_id IS NOT NULL
+                ),
+                thread AS (
+                    SELECT c.id, c.id as root_id, 0 as depth, 0 as sibling_count
+                    FROM {table} c
+                    JOIN roots r ON c.id = r.id
+                    UNION ALL
+                    SELECT p.id, t.root_id, t.depth + 1, p.sibling_count
+                    FROM replies p
+                    JOIN thread t ON p.parent_id = t.id
+                    WHERE t.depth < %s AND p.sibling_rank <= %s
+                )
+                SELECT c.*, {config['user_columns']}, t.depth, t.sibling_count
+                FROM thread t
+                JOIN {table} c ON c.id = t.id
+                LEFT JOIN users u ON c.user_id = u.id
+                ORDER BY t.depth ASC, c.created_at ASC, c.id ASC
+            """, root_params + [owner_id, max_depth, max_children])
+            rows = db_cursor.fetchall()
+
+            comment_ids = [row['id'] for row in rows]
+            likes_counts, liked_ids = CommentTree._load_likes(
+                db_cursor, config['likes_table'], comment_ids, viewer_id
+            )
+        finally:
+            db_cursor.close()
+            conn.close()
+
+        nodes = {}
+        roots = []
+        for row in rows:
+            row['likes_count'] = likes_counts.get(row['id'], 0)
+            row['is_liked'] = row['id'] in liked_ids
+            row['replies'] = []
+            row['replies_count'] = 0
+            depth = row.pop('depth')
+            sibling_count = row.pop('sibling_count')
+            nodes[row['id']] = row
+
+            if depth == 0:
+                roots.append(row)
+                continue
+
+            # Only the first max_children replies of a parent come back from the query;
+            # sibling_count still counts all of them.
+            parent = nodes.get(row['parent_id'])
+            if parent is None:
+                continue
+            parent['replies_count'] = sibling_count
+            parent['replies'].append(row)
+
+        for node in nodes.values():
+            node['has_more_replies'] = node['replies_count'] > len(node['replies'])
+
+        roots.sort(key=lambda c: (c['created_at'], c['id']), reverse=True)
+        has_more = len(roots) > limit
+        roots = roots[:limit]
+
+        return {
+            'items': roots,
+            'has_more': has_more,
+            'next_cursor': CommentTree.encode_cursor(roots[-1]) if has_more and roots else None
+        }
+
+    @staticmethod
+    def _load_likes(cursor, likes_table: Optional[str], comment_ids: List[int],
+                    viewer_id: Optional[int]) -> Tuple[Dict[int, int], set]:
+        # Batch-load like counts and the viewer's liked comments for a set of comments.
+        if not likes_table or not comment_ids:
+            return {}, set()
+
+        placeholders = ', '.join(['%s'] * len(comment_ids))
+        cursor.execute(f"""
+            SELECT comment_id, COUNT(*) as count
+            FROM {likes_table}
+            WHERE comment_id IN ({placeholders})
+            GROUP BY comment_id
+        """, comment_ids)
+        likes_counts = {row['comment_id']: row['count'] for row in cursor.fetchall()}
+
+        liked_ids = set()
+        if viewer_id:
+            cursor.execute(f"""
+                SELECT comment_id
+                FROM {likes_table}
+                WHERE user_id = %s AND comment_id IN ({placeholders})
+            """, [viewer_id] + comment_ids)
+            liked_ids = {row['comment_id'] for row in cursor.fetchall()}
+
+        return likes_counts, liked_ids
@@ -1,11 +1,68 @@
+from datetime import datetime, time, timedelta
+
 from database.connection import Database
+from models.comment_tree import CommentTree
+from models.geo import Gazetteer, DEFAULT_RADIUS_KM, EARTH_RADIUS_KM, bounding_box, covering_geohashes
+from models.http_cache import ResourceVersions
+from models.projection import Projection
+from models.list_query import ListQuery
+from models.reference_data import ReferenceData
 from models.user_stats import UserStats
 from models.achievement import UserActivity, achievements
 
+CALENDAR_MAX_EVENTS = 500
+
+# Fields available to GET /events?fields=. Counts and category_name are filled in by
+# _attach_counts; the summary is what the event list cards render.
+EVENT_LIST_FIELDS = Projection(
+    columns={
+        'id': 'e.id',
+        'title': 'e.title',
+        'description': 'e.description',
+        'location': 'e.location',
+        'location_normalized': 'e.location_normalized',
+        'latitude': 'e.latitude',
+        'longitude': 'e.longitude',
+        'start_date': 'e.start_date',
+        'end_date': 'e.end_date',
+        'registration_deadline': 'e.registration_deadline',
+        'image_url': 'e.image_url',
+        'organizer_id': 'e.organizer_id',
+        'organizer_username': 'u.username',
+        'category_id': 'e.category_id',
+        'max_participants': 'e.max_participants',
+        'requirements': 'e.requirements',
+        'schedule': 'e.schedule',
+        'status': 'e.status',
+        'co2_offset': 'e.co2_offset',
+        'trees_planted': 'e.trees_planted',
+        'volunteer_hour': 'e.volunteer_hour',
+        'created_at': 'e.created_at',
+        'updated_at': 'e.updated_at',
+        'category_name': None,
+        'participant_count': None,
+        'upvotes': None,
+        'downvotes': None,
+        'is_registered': None
+    },
+    summary=(
+        'id', 'title', 'description', 'location', 'start_date', 'end_date', 'image_url',
+        'organizer_username', 'category_id', 'category_name', 'max_participants', 'status',
+        'participant_count', 'upvotes', 'downvotes', 'is_registered'
+    ),
+    required=('id', 'category_id'),
+    summary_columns={'description': 'LEFT(e.description, 280)'}
+)
+
 class Event:
     @staticmethod
-    def get_all(page=1, category=None, status=None, search=None, location=None, start_date=None, user_id=None):
+    def get_all(page=1, category=None, status=None, search=None, location=None, start_date=None, user_id=None,
+                near=None, radius=None, fields=None):
         # Get all events with calculated fields.
+        # fields selects a projection of EVENT_LIST_FIELDS; defaults to the list summary.
+        # location is a text match on the event location. near is an opt-in
+        # (latitude, longitude) tuple; results are then limited to radius km and
+        # sorted by distance, which leaves out events without coordinates.
         try:
             db = Database()
             conn = db.get_connection()
@@ -13,73 +70,73 @@ class Event:
                 raise Exception("Database connection failed")
             
             cursor = conn.cursor(dictionary=True)
+            select_list, field_names = EVENT_LIST_FIELDS.select(fields)
+            
+            distance_select = ""
+            select_params = []
+            list_query = ListQuery("events e LEFT JOIN users u ON e.organizer_id = u.id", count_from="events e")
+            
+            if near:
+                latitude, longitude = near
+                radius = radius or DEFAULT_RADIUS_KM
+                distance_expr = """
+                    (2 * %s * ASIN(SQRT(
+                        POWER(SIN(RADIANS(e.latitude - %s) / 2), 2) +
+                        COS(RADIANS(%s)) * COS(RADIANS(e.latitude)) *
+                        POWER(SIN(RADIANS(e.longitude - %s) / 2), 2)
+                    )))
+                """
+                distance_params = [EARTH_RADIUS_KM, latitude, latitude, longitude]
+                distance_select = f"{distance_expr} as distance_km,"
+                select_params.extend(distance_params)
+                
+                # Geohash prefixes and the bounding box narrow the scan via indexes
+                # before the exact distance check.
+                prefixes = covering_geohashes(latitude, longitude, radius)
+                if prefixes:
+                    list_query.where("(" + " OR ".join(["e.geohash LIKE %s"] * len(prefixes)) + ")",
+                                     *(f"{prefix}%" for prefix in prefixes))
+                
+                min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius)
+                list_query.where("e.latitude BETWEEN %s AND %s", min_lat, max_lat)
+                if min_lon is not None:
+                    list_query.where("e.longitude BETWEEN %s AND %s", min_lon, max_lon)
+                
+                list_query.where(f"{distance_expr} <= %s", *distance_params, radius)
             
-            base_query = """
-                SELECT 
-                    e.*,
-                    c.name as category_name,
-                    u.username as organizer_username,
-                    COUNT(DISTINCT ep.user_id) as participant_count,
-                    COUNT(DISTINCT CASE WHEN ev.vote_type = 'upvote' THEN ev.id END) as upvotes,
-                    COUNT(DISTINCT CASE WHEN ev.vote_type = 'downvote' THEN ev.id END) as downvotes,
-                    CASE WHEN ep_current.user_id IS NOT NULL THEN TRUE ELSE FALSE END as is_registered
-                FROM events e
-                LEFT JOIN event_categories c ON e.category_id = c.id
-                LEFT JOIN users u ON e.organizer_id = u.id
-                LEFT JOIN event_participants ep ON e.id = ep.event_id
-                LEFT JOIN event_votes ev ON e.id = ev.event_id
-                LEFT JOIN event_participants ep_current ON e.id = ep_current.event_id 
-                    AND ep_current.user_id = %s
-            """
-            
-            where_conditions = []
-            params = [user_id if user_id else None] 
+            if location:
+                list_query.where("e.location LIKE %s", f"%{location}%")
             
             if category:
-                where_conditions.append("c.id = %s")
-                params.append(category)
+                list_query.where("e.category_id = %s", category)
             
             if status:
-                where_conditions.append("e.status = %s")
-                params.append(status)
+                list_query.where("e.status = %s", status)
             
             if search:
-                where_conditions.append("(e.title LIKE %s OR e.description LIKE %s)")
-                params.extend([f"%{search}%", f"%{search}%"])
-            
-            if location:
-                where_conditions.append("e.location LIKE %s")
-                params.append(f"%{location}%")
+                list_query.where("(e.title LIKE %s OR e.description LIKE %s)", f"%{search}%", f"%{search}%")
             
             if start_date:
-                where_conditions.append("DATE(e.start_date) = DATE(%s)")
-                params.append(start_date)
-            
-            where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
-            
-            count_query = f"""
-                SELECT COUNT(DISTINCT e.id) as total
-                FROM events e
-                LEFT JOIN event_categories c ON e.category_id = c.id
-                {where_clause}
-            """
-            
-            count_params = params[1:] if len(params) > 1 else []
-            cursor.execute(count_query, count_params)
-            total = cursor.fetchone()['total']
+                day_start = datetime.combine(start_date.date(), time.min)
+                list_query.where("e.start_date >= %s AND e.start_date < %s", day_start, day_start + timedelta(days=1))
             
             per_page = 10
-            offset = (page - 1) * per_page
-            
-            query = base_query + where_clause + """
-                GROUP BY e.id
-                ORDER BY e.start_date ASC
-                LIMIT %s OFFSET %s
-            """
+            order_clause = "distance_km ASC, e.start_date ASC" if near else "e.start_date ASC"
+            result = list_query.fetch_page(
+                cursor,
+                f"""{distance_select}
+                    {select_list}""",
+                order_clause,
+                page=page,
+                per_page=per_page,
+                select_params=select_params
+            )
+            events, total = result['rows'], result['total']
+            Event._attach_counts(cursor, events, user_id, field_names)
             
-            params.extend([per_page, offset])
-            cursor.execute(query, params)
-            events = cursor.fetchall()
+            for event in events:
+                if event.get('distance_km') is not None:
+                    event['distance_km'] = round(event['distance_km'], 2)
             
             cursor.close()
             conn.close()
@@ -101,6 +158,154 @@ class Event:
                 'total_pages': 0
             }
 
+    @staticmethod
+    def _attach_counts(cursor, events, user_id=None, fields=None):
+        # Add category_name, participant_count, upvotes, downvotes and is_registered to a
+        # page of events using one grouped query per table instead of fanning out joins per row.
+        # fields limits the work to the requested computed fields; None adds all of them.
+        wanted = {'category_name', 'participant_count', 'upvotes', 'downvotes', 'is_registered'}
+        if fields is not None:
+            wanted.intersection_update(fields)
+        
+        categories = ReferenceData.table('event_categories')
+        for event in events:
+            if 'category_name' in wanted:
+                event['category_name'] = categories.label(event['category_id'])
+            for name in wanted - {'category_name'}:
+                event[name] = 0
+        
+        if not events:
+            return events
+        
+        by_id = {event['id']: event for event in events}
+        event_ids = list(by_id)
+        placeholders = ', '.join(['%s'] * len(event_ids))
+        
+        if 'participant_count' in wanted:
+            cursor.execute(f"""
+                SELECT event_id, COUNT(*) as count
+                FROM event_participants
+                WHERE event_id IN ({placeholders})
+                GROUP BY event_id
+            """, event_ids)
+            for row in cursor.fetchall():
+                by_id[row['event_id']]['participant_count'] = row['count']
+        
+        if 'upvotes' in wanted or 'downvotes' in wanted:
+            cursor.execute(f"""
+                SELECT event_id, vote_type, COUNT(*) as count
+                FROM event_votes
+                WHERE event_id IN ({placeholders}) AND vote_type IN ('upvote', 'downvote')
+                GROUP BY event_id, vote_type
+            """, event_ids)
+            for row in cursor.fetchall():
+                key = row['vote_type'] + 's'
+                if key in wanted:
+                    by_id[row['event_id']][key] = row['count']
+        
+        if user_id and 'is_registered' in wanted:
+            cursor.execute(f"""
+                SELECT event_id
+                FROM event_participants
+                WHERE user_id = %s AND event_id IN ({placeholders})
+            """, [user_id] + event_ids)
+            for row in cursor.fetchall():
+                by_id[row['event_id']]['is_registered'] = 1
+        
+        return events
+
+    @staticmethod
+    def get_calendar(date_from, date_to=None, status='published', category=None, user_id=None,
+                     limit=CALENDAR_MAX_EVENTS):
+        # Get events starting in the half-open range [date_from, date_to), earliest first.
+        # date_to=None leaves the range open-ended.
+        try:
+            db = Database()
+            conn = db.get_connection()
+            if not conn:
+                raise Exception("Database connection failed")
+            
+            cursor = conn.cursor(dictionary=True)
+            
+            where_conditions = ["e.status = %s", "e.start_date >= %s"]
+            params = [status, date_from]
+            
+            if date_to:
+                where_conditions.append("e.start_date < %s")
+                params.append(date_to)
+            
+            if category:
+                where_conditions.append("e.category_id = %s")
+                params.append(category)
+            
+            cursor.execute(f"""
+                SELECT 
+                    e.*,
+                    u.username as organizer_username
+                FROM events e
+                LEFT JOIN users u ON e.organizer_id = u.id
+                WHERE {' AND '.join(where_conditions)}
+                ORDER BY e.start_date ASC, e.id ASC
+                LIMIT %s
+            """, params + [limit])
+            events = cursor.fetchall()
+            Event._attach_counts(cursor, events, user_id)
+            
+            cursor.close()
+            conn.close()
+            
+            return events
+        except Exception as e:
+            print(f"Error getting calendar events: {e}")
+            return []
+
+    @staticmethod
+    def get_upcoming(limit=10, status='published', category=None, user_id=None):
+        # Get the next events starting from now.
+        return Event.get_calendar(
+            datetime.now(), status=status, category=category,
+            user_id=user_id, limit=limit
+        )
+
+    @staticmethod
+    def get_month_counts(year, month, status='published', category=None):
+        # Get per-day event counts for a month grid in a single grouped query.
+        # Returns {'YYYY-MM-DD': count} for days that have at least one event.
+        try:
+            db = Database()
+            conn = db.get_connection()
+            if not conn:
+                raise Exception("Database connection failed")
+            
+            cursor = conn.cursor(dictionary=True)
+            
+            month_start = datetime(year, month, 1)
+            month_end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+            
+            where_conditions = ["status = %s", "start_date >= %s", "start_date < %s"]
+            params = [status, month_start, month_end]
+            
+            if category:
+                where_conditions.append("category_id = %s")
+                params.append(category)
+            
+            cursor.execute(f"""
+                SELECT DATE(start_date) as day, COUNT(*) as count
+                FROM events
+                WHERE {' AND '.join(where_conditions)}
+                GROUP BY DATE(start_date)
+                ORDER BY day
+            """, params)
+            days = {row['day'].isoformat(): row['count'] for row in cursor.fetchall()}
+            
+            cursor.close()
+            conn.close()
+            
+            return days
+        except Exception as e:
+            print(f"Error getting calendar month counts: {e}")
+            return {}
+
     @staticmethod
     def get_by_id(event_id, user_id=None):
         # Get event by ID with all calculated fields.
@@ -205,33 +410,37 @@ class Event:
             conn = db.get_connection()
             cursor = conn.cursor(dictionary=True)
             
-            cursor.execute("SELECT id FROM event_categories WHERE name = %s", (category,))
-            category_result = cursor.fetchone()
-            if not category_result:
+            category_id = ReferenceData.table('event_categories').id_for(category)
+            if category_id is None:
                 raise ValueError(f"Category '{category}' not found")
             
             valid_statuses = ['draft', 'published', 'cancelled', 'completed']
             if status not in valid_statuses:
                 raise ValueError(f"Invalid status. Must be one of: {', '.join(valid_statuses)}")
             
+            geo = Gazetteer.locate(location)
+            
             query = """
                 INSERT INTO events (
                     organizer_id, title, description, start_date, end_date,
-                    location, category_id, max_participants, status, created_at,
+                    location, location_normalized, latitude, longitude, geohash,
+                    category_id, max_participants, status, created_at,
                     requirements, schedule, organizer_name, contact_email,
                     contact_phone, image_url
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), %s, %s, %s, %s, %s, %s)
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), %s, %s, %s, %s, %s, %s)
             """
             
             cursor.execute(query, (
                 organizer_id, title, description, start_date, end_date,
-                location, category_result['id'], max_participants, status,
+                location, geo['location_normalized'], geo['latitude'], geo['longitude'], geo['geohash'],
+                category_id, max_participants, status,
                 requirements, schedule, organizer_name, contact_email,
                 contact_phone, image_url
             ))
             
             conn.commit()
             event_id = cursor.lastrowid
+            ResourceVersions.bump('event_categories')
             
             return Event.get_by_id(event_id)
         except Exception as e:
@@ -270,18 +479,20 @@ class Event:
                 'image_url': image_url
             }
             
+            if location is not None:
+                field_updates.update(Gazetteer.locate(location))
+            
             for field, value in field_updates.items():
-                if value is not None:
+                if value is not None or field in ('location_normalized', 'latitude', 'longitude', 'geohash'):
                     updates.append(f"{field} = %s")
                     params.append(value)
             
             if category is not None:
-                cursor.execute("SELECT id FROM event_categories WHERE name = %s", (category,))
-                category_result = cursor.fetchone()
-                if not category_result:
+                category_id = ReferenceData.table('event_categories').id_for(category)
+                if category_id is None:
                     raise ValueError(f"Category '{category}' not found")
                 updates.append("category_id = %s")
-                params.append(category_result['id'])
+                params.append(category_id)
             
             if status is not None:
                 valid_statuses = ['draft', 'published', 'cancelled', 'completed']
@@ -296,6 +507,7 @@ class Event:
                 
                 cursor.execute(query, params)
                 conn.commit()
+                ResourceVersions.bump('event_categories')
             
             return Event.get_by_id(event_id)
         except Exception as e:
@@ -318,6 +530,7 @@ class Event:
             cursor.execute("DELETE FROM events WHERE id = %s", (event_id,))
             
             conn.commit()
+            ResourceVersions.bump('event_categories')
             return True
         except Exception as e:
             conn.rollback()
@@ -458,36 +671,37 @@ class Event:
     @staticmethod
     def get_categories():
         try:
+            categories = ReferenceData.table('event_categories').all()
+            if not categories:
+                return [{
+                    'id': 1,
+                    'name': 'General',
+                    'description': 'Default category for all events',
+                    'event_count': 0
+                }]
+            
             db = Database()
             conn = db.get_connection()
             cursor = conn.cursor(dictionary=True)
             
-            try:
-                cursor.execute("""
-                    SELECT c.*, COUNT(e.id) as event_count
-                    FROM event_categories c
-                    LEFT JOIN events e ON c.id = e.category_id
-                    GROUP BY c.id
-                    ORDER BY c.name
-                """)
-                               
-                return cursor.fetchall()
-            except Exception as e:
-                if "Table 'green_buddy.event_categories' doesn't exist" in str(e):
-                    return [{
-                        'id': 1,
-                        'name': 'General',
-                        'description': 'Default category for all events',
-                        'event_count': 0
-                    }]
-                raise e
+            cursor.execute("""
+                SELECT category_id, COUNT(*) as count
+                FROM events
+                GROUP BY category_id
+            """)
+            counts = {row['category_id']: row['count'] for row in cursor.fetchall()}
             
+            for category in categories:
+                category['event_count'] = counts.get(category['id'], 0)
+            
+            return categories
         except Exception as e:
             print(f"Error in get_categories: {str(e)}")
             raise e
         finally:
-            cursor.close()
-            conn.close()
+            if 'cursor' in locals():
+                cursor.close()
+                conn.close()
 
     @staticmethod
     def get_user_vote(event_id, user_id):
@@ -585,29 +799,17 @@ class Event:
             conn.close()
 
     @staticmethod
-    def get_comments(event_id):
-        # Get all comments for an event.
-        db = Database()
-        conn = db.get_connection()
-        if not conn:
-            raise Exception("Could not connect to database")
-            
-        cursor = conn.cursor(dictionary=True, buffered=True)
-        try:
-            cursor.execute("""
-                SELECT 
-                    c.*,
-                    u.username as author_name
-                FROM event_comments c
-                JOIN users u ON c.user_id = u.id
-                WHERE c.event_id = %s
-                ORDER BY c.created_at DESC
-            """, (event_id,))
-            
-            return {"comments": cursor.fetchall()}
-        finally:
-            cursor.close()
-            conn.close()
+    def get_comments(event_id, limit=20, cursor=None, threaded=False):
+        # Get all comments for an event, or with threaded=True a page of them with
+        # their reply threads.
+        if not threaded:
+            return {"comments": CommentTree.load_flat('event', event_id)}
+        result = CommentTree.load('event', event_id, limit=limit, cursor=cursor)
+        return {
+            "comments": result['items'],
+            "has_more": result['has_more'],
+            "next_cursor": result['next_cursor']
+        }
 
     @staticmethod
     def add_comment(event_id, user_id, content):
@@ -0,0 +1,96 @@
+from typing import Dict, Optional
+
+from database.connection import Database, run_in_transaction
+from models.jobs import Jobs
+
+DAILY_EXP_LIMIT = 5000
+EXP_PER_LEVEL = 100
+# Days of user_daily_exp rows kept; only today's row is read by the limit.
+DAILY_EXP_RETENTION_DAYS = 7
+
+
+class ExpLedger:
+    # Every EXP change is one exp_ledger row plus the users.exp update, written on the
+    # caller's connection. user_daily_exp keeps a per-user, per-day total of capped
+    # awards, so the daily limit is a primary key lookup instead of a scan of
+    # user_activities. The users row is locked first, which serializes a user's awards.
+
+    @staticmethod
+    def calculate_level(exp: int) -> int:
+        return (exp // EXP_PER_LEVEL) + 1
+
+    @staticmethod
+    def remaining_today(cursor, user_id: int) -> int:
+        # EXP the user can still earn from capped sources today.
+        cursor.execute("""
+            SELECT exp_earned
+            FROM user_daily_exp
+            WHERE user_id = %s AND day = CURDATE()
+        """, (user_id,))
+        row = cursor.fetchone()
+        return max(0, DAILY_EXP_LIMIT - (row['exp_earned'] if row else 0))
+
+    @staticmethod
+    def apply(cursor, user_id: int, amount: int, source: str, source_id: Optional[int] = None,
+              capped: bool = True) -> Dict:
+        # Add up to amount EXP inside the caller's transaction. Capped awards are cut to
+        # what is left of today's limit; uncapped ones (e.g. reviewed challenges) are not
+        # limited and do not use it up.
+        cursor.execute("SELECT exp FROM users WHERE id = %s FOR UPDATE", (user_id,))
+        user = cursor.fetchone()
+        if not user:
+            raise ValueError(f"User {user_id} not found")
+        current_exp = user['exp'] or 0
+
+        actual_exp = max(0, amount)
+        if capped:
+            actual_exp = min(actual_exp, ExpLedger.remaining_today(cursor, user_id))
+
+        if actual_exp > 0:
+            cursor.execute("UPDATE users SET exp = exp + %s WHERE id = %s", (actual_exp, user_id))
+            cursor.execute("""
+                INSERT INTO exp_ledger (user_id, exp_delta, source, source_id)
+                VALUES (%s, %s, %s, %s)
+            """, (user_id, actual_exp, source, source_id))
+            if capped:
+                cursor.execute("""
+                    INSERT INTO user_daily_exp (user_id, day, exp_earned)
+                    VALUES (%s, CURDATE(), %s)
+                    ON DUPLICATE KEY UPDATE exp_earned = exp_earned + VALUES(exp_earned)
+                """, (user_id, actual_exp))
+
+        total_exp = current_exp + actual_exp
+        return {
+            'exp_gained': actual_exp,
+            'total_exp': total_exp,
+            'new_level': ExpLedger.calculate_level(total_exp)
+        }
+
+    @staticmethod
+    def award(user_id: int, amount: int, source: str, source_id: Optional[int] = None,
+              capped: bool = True) -> Dict:
+        # apply() in a transaction of its own, retried on deadlock.
+        return run_in_transaction(
+            lambda cursor: ExpLedger.apply(cursor, user_id, amount, source, source_id, capped)
+        )
+
+    @staticmethod
+    def prune_daily(days: int = DAILY_EXP_RETENTION_DAYS) -> int:
+        # Delete daily aggregate rows older than days; the ledger keeps the history.
+        db = Database()
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM user_daily_exp WHERE day < CURDATE() - INTERVAL %s DAY", (days,))
+            conn.commit()
+            return cursor.rowcount
+        except Exception as e:
+            conn.rollback()
+            print(f"Error pruning daily EXP rows: {str(e)}")
+            return 0
+        finally:
+            cursor.close()
+            conn.close()
+
+
+Jobs.every(60 * 60, ExpLedger.prune_daily)
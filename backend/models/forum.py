@@ -1,4 +1,8 @@
 from database.connection import Database
+from models.http_cache import ResourceVersions
+from models.reference_data import ReferenceData
+from models.related_content import RelatedContent
+from models.list_query import ListQuery
 from datetime import datetime
 from typing import List, Dict, Any, Tuple, Optional
 
@@ -38,7 +42,16 @@ class Forum:
             except Exception as e:
                 print(f"Error updating stats: {str(e)}")
             
-            return True, str(cursor.lastrowid)
+            discussion_id = cursor.lastrowid
+            
+            ResourceVersions.bump('forum_categories')
+            
+            try:
+                RelatedContent.refresh_item('forum', discussion_id)
+            except Exception as e:
+                print(f"Error updating related content: {str(e)}")
+            
+            return True, str(discussion_id)
         except Exception as e:
             return False, str(e)
         finally:
@@ -46,66 +59,62 @@ class Forum:
             connection.close()
 
     @staticmethod
-    def get_discussions(page=1, category=None):
+    def get_discussions(page=1, category=None, cursor=None):
+        # cursor switches from page numbers to keyset pagination for deep pages: request
+        # page 1 without one, then pass each response's next_cursor back as cursor.
         try:
             db = Database()
             conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = """
-                SELECT 
-                    d.*,
-                    c.name as category_name,
-                    u.username as author_name,
-                    COUNT(DISTINCT l.user_id) as likes_count,
-                    COUNT(DISTINCT r.id) as replies_count,
-                    EXISTS(SELECT 1 FROM forum_replies r2 WHERE r2.discussion_id = d.id AND r2.is_solution = TRUE) as has_solution
-                FROM forum_discussions d
-                LEFT JOIN forum_categories c ON d.category_id = c.id
-                LEFT JOIN users u ON d.author_id = u.id
-                LEFT JOIN forum_likes l ON d.id = l.discussion_id
-                LEFT JOIN forum_replies r ON d.id = r.discussion_id
-                WHERE 1=1
-            """
-            params = []
-            
-            if category and category != 'all':
-                query += " AND c.name = %s"
-                params.append(category)
-            
-            query += " GROUP BY d.id ORDER BY d.created_at DESC"
+            db_cursor = conn.cursor(dictionary=True)
             
+            categories = ReferenceData.table('forum_categories')
             limit = 10
-            offset = (page - 1) * limit
-            query += " LIMIT %s OFFSET %s"
-            params.extend([limit, offset])
-            
-            cursor.execute(query, params)
-            discussions = cursor.fetchall()
             
-            count_query = """
-                SELECT COUNT(DISTINCT d.id) as total
-                FROM forum_discussions d
-                LEFT JOIN forum_categories c ON d.category_id = c.id
-                WHERE 1=1
+            select_list = """
+                d.*,
+                u.username as author_name,
+                (SELECT COUNT(DISTINCT l.user_id) FROM forum_likes l WHERE l.discussion_id = d.id) as likes_count,
+                (SELECT COUNT(*) FROM forum_replies r WHERE r.discussion_id = d.id) as replies_count,
+                EXISTS(SELECT 1 FROM forum_replies r2 WHERE r2.discussion_id = d.id AND r2.is_solution = TRUE) as has_solution
             """
+            list_query = ListQuery("forum_discussions d LEFT JOIN users u ON d.author_id = u.id",
+                                   count_from="forum_discussions d")
+            
             if category and category != 'all':
-                count_query += " AND c.name = %s"
+                category_id = categories.id_for(category)
+                if category_id is None:
+                    return {
+                        'discussions': [],
+                        'page': page,
+                        'total': 0,
+                        'total_pages': 0,
+                        'next_cursor': None
+                    }
+                list_query.where("d.category_id = %s", category_id)
             
-            cursor.execute(count_query, params[:-2] if category and category != 'all' else [])
-            total = cursor.fetchone()['total']
+            if cursor:
+                result = list_query.fetch_after(db_cursor, select_list, "d.created_at", "d.id", cursor,
+                                                per_page=limit)
+            else:
+                result = list_query.fetch_page(db_cursor, select_list, "d.created_at DESC, d.id DESC",
+                                               page=page, per_page=limit, cursor_columns=("d.created_at", "d.id"))
+            discussions, total, next_cursor = result['rows'], result['total'], result['next_cursor']
+            
+            for discussion in discussions:
+                discussion['category_name'] = categories.label(discussion['category_id'])
             
             return {
                 'discussions': discussions,
                 'page': page,
                 'total': total,
-                'total_pages': (total + limit - 1) // limit
+                'total_pages': (total + limit - 1) // limit,
+                'next_cursor': next_cursor
             }
         except Exception as e:
             print(f"Error in get_discussions: {str(e)}")
             raise e
         finally:
-            cursor.close()
+            db_cursor.close()
             conn.close()
 
     @staticmethod
@@ -118,24 +127,25 @@ class Forum:
             query = """
                 SELECT 
                     d.*,
-                    c.name as category_name,
                     u.username as author_name, 
                     u.avatar_url as author_avatar_url,
                     COUNT(DISTINCT l.user_id) as likes_count,
                     COUNT(DISTINCT r.id) as replies_count,
                     EXISTS(SELECT 1 FROM forum_replies r2 WHERE r2.discussion_id = d.id AND r2.is_solution = TRUE) as has_solution
                 FROM forum_discussions d
-                LEFT JOIN forum_categories c ON d.category_id = c.id
                 LEFT JOIN users u ON d.author_id = u.id
                 LEFT JOIN forum_likes l ON d.id = l.discussion_id
                 LEFT JOIN forum_replies r ON d.id = r.discussion_id
                 WHERE d.id = %s
-                GROUP BY d.id, d.category_id, c.name, u.username
+                GROUP BY d.id, d.category_id, u.username
             """
             
             cursor.execute(query, (discussion_id,))
             discussion = cursor.fetchone()
             
+            if discussion:
+                discussion['category_name'] = ReferenceData.table('forum_categories').label(discussion['category_id'])
+            
             return discussion
         except Exception as e:
             print(f"Error in get_discussion_by_id: {str(e)}")
@@ -199,9 +209,8 @@ class Forum:
             conn = db.get_connection()
             cursor = conn.cursor(dictionary=True)
             
-            cursor.execute("SELECT id FROM forum_categories WHERE name = %s", (category,))
-            category_result = cursor.fetchone()
-            if not category_result:
+            category_id = ReferenceData.table('forum_categories').id_for(category)
+            if category_id is None:
                 raise ValueError(f"Category '{category}' not found")
             
             query = """
@@ -212,7 +221,7 @@ class Forum:
             """
             
             cursor.execute(query, (
-                author_id, category_result['id'], title, content, excerpt
+                author_id, category_id, title, content, excerpt
             ))
             
             conn.commit()
@@ -231,6 +240,13 @@ class Forum:
             except Exception as e:
                 print(f"Error updating stats: {str(e)}")
             
+            ResourceVersions.bump('forum_categories')
+            
+            try:
+                RelatedContent.refresh_item('forum', discussion_id)
+            except Exception as e:
+                print(f"Error updating related content: {str(e)}")
+            
             return Forum.get_discussion_by_id(discussion_id)
         except Exception as e:
             conn.rollback()
@@ -269,12 +285,11 @@ class Forum:
                 params.extend([content, excerpt])
             
             if category is not None:
-                cursor.execute("SELECT id FROM forum_categories WHERE name = %s", (category,))
-                category_result = cursor.fetchone()
-                if not category_result:
+                category_id = ReferenceData.table('forum_categories').id_for(category)
+                if category_id is None:
                     raise ValueError(f"Category '{category}' not found")
                 updates.append("category_id = %s")
-                params.append(category_result['id'])
+                params.append(category_id)
             
             if updates:
                 query = f"UPDATE forum_discussions SET {', '.join(updates)} WHERE id = %s"
@@ -282,6 +297,13 @@ class Forum:
                 
                 cursor.execute(query, params)
                 conn.commit()
+                
+                ResourceVersions.bump('forum_categories')
+                
+                try:
+                    RelatedContent.refresh_item('forum', discussion_id)
+                except Exception as e:
+                    print(f"Error updating related content: {str(e)}")
             
             return Forum.get_discussion_by_id(discussion_id)
         except Exception as e:
@@ -313,6 +335,14 @@ class Forum:
             cursor.execute("DELETE FROM forum_discussions WHERE id = %s", (discussion_id,))
             
             conn.commit()
+            
+            ResourceVersions.bump('forum_categories')
+            
+            try:
+                RelatedContent.remove_item('forum', discussion_id)
+            except Exception as e:
+                print(f"Error updating related content: {str(e)}")
+            
             return True
         except Exception as e:
             conn.rollback()
@@ -620,23 +650,10 @@ class Forum:
     @staticmethod
     def get_categories():
         try:
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute("""
-                SELECT * FROM forum_categories
-                ORDER BY name
-            """)
-            
-            categories = cursor.fetchall()
-            return categories
+            return ReferenceData.table('forum_categories').all()
         except Exception as e:
             print(f"Error in get_categories: {str(e)}")
             raise e
-        finally:
-            cursor.close()
-            conn.close()
 
     @staticmethod
     def get_top_contributors(limit=10):
@@ -730,7 +747,8 @@ class Forum:
     @staticmethod
     def get_related_discussions(discussion_id, limit=5):
     
-        # Get discussions related to the specified discussion based on category and popularity.
+        # Get discussions related to the specified discussion from the precomputed
+        # related-content index, topped up with popular discussions.
 
         
         try:
@@ -739,7 +757,7 @@ class Forum:
             cursor = conn.cursor(dictionary=True)
             
             cursor.execute(
-                "SELECT title, category_id FROM forum_discussions WHERE id = %s",
+                "SELECT id FROM forum_discussions WHERE id = %s",
                 (discussion_id,)
             )
             source = cursor.fetchone()
@@ -750,7 +768,7 @@ class Forum:
                     "error": "Source discussion not found"
                 }
             
-            category_related_query = """
+            select_columns = """
                 SELECT 
                     d.id,
                     d.title,
@@ -759,58 +777,41 @@ class Forum:
                     d.views_count as view_count,
                     u.username,
                     c.name as category_name,
-                    COUNT(DISTINCT l.id) as like_count,
-                    COUNT(DISTINCT r.id) as reply_count,
-                    'same_category' as relation_type
+                    (SELECT COUNT(*) FROM forum_likes l
+                     WHERE l.discussion_id = d.id AND l.reply_id IS NULL) as like_count,
+                    (SELECT COUNT(*) FROM forum_replies r WHERE r.discussion_id = d.id) as reply_count,
+                    %s as relation_type
                 FROM forum_discussions d
                 LEFT JOIN forum_categories c ON d.category_id = c.id
                 LEFT JOIN users u ON d.author_id = u.id
-                LEFT JOIN forum_likes l ON d.id = l.discussion_id AND l.reply_id IS NULL
-                LEFT JOIN forum_replies r ON d.id = r.discussion_id
-                WHERE d.id != %s AND d.category_id = %s
-                GROUP BY d.id, d.title, d.excerpt, d.created_at, d.views_count, u.username, c.name
-                ORDER BY d.created_at DESC
-                LIMIT %s
             """
             
-            cursor.execute(category_related_query, (discussion_id, source['category_id'], limit))
-            category_related = cursor.fetchall()
+            related_discussions = []
+            related_ids = RelatedContent.get_related_ids('forum', discussion_id, limit)
             
-            remaining = limit - len(category_related)
+            if related_ids:
+                placeholder = ', '.join(['%s'] * len(related_ids))
+                cursor.execute(
+                    select_columns + f" WHERE d.id IN ({placeholder})",
+                    ['similar'] + related_ids
+                )
+                rank = {related_id: position for position, related_id in enumerate(related_ids)}
+                related_discussions = sorted(cursor.fetchall(), key=lambda d: rank[d['id']])
+            
+            remaining = limit - len(related_discussions)
             
             if remaining > 0:
-                exclude_ids = [discussion_id] + [d['id'] for d in category_related]
+                exclude_ids = [discussion_id] + [d['id'] for d in related_discussions]
                 placeholder = ', '.join(['%s'] * len(exclude_ids))
                 
-                popular_query = f"""
-                    SELECT 
-                        d.id,
-                        d.title,
-                        d.excerpt,
-                        d.created_at,
-                        d.views_count as view_count,
-                        u.username,
-                        c.name as category_name,
-                        COUNT(DISTINCT l.id) as like_count,
-                        COUNT(DISTINCT r.id) as reply_count,
-                        'popular' as relation_type
-                    FROM forum_discussions d
-                    LEFT JOIN forum_categories c ON d.category_id = c.id
-                    LEFT JOIN users u ON d.author_id = u.id
-                    LEFT JOIN forum_likes l ON d.id = l.discussion_id AND l.reply_id IS NULL
-                    LEFT JOIN forum_replies r ON d.id = r.discussion_id
+                popular_query = select_columns + f"""
                     WHERE d.id NOT IN ({placeholder})
-                    GROUP BY d.id, d.title, d.excerpt, d.created_at, d.views_count, u.username, c.name
                     ORDER BY (d.likes_count + d.views_count) DESC, d.created_at DESC
                     LIMIT %s
                 """
                 
-                cursor.execute(popular_query, exclude_ids + [remaining])
-                popular_related = cursor.fetchall()
-                
-                related_discussions = category_related + popular_related
-            else:
-                related_discussions = category_related
+                cursor.execute(popular_query, ['popular'] + exclude_ids + [remaining])
+                related_discussions += cursor.fetchall()
             
             return {
                 "success": True,
@@ -828,4 +829,3 @@ class Forum:
                 cursor.close()
             if conn:
                 conn.close()
-            
\ No newline at end of file
@@ -0,0 +1,210 @@
+import csv
+import math
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+GEOHASH_PRECISION = 9
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 500
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              'data', 'gazetteer.csv')
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_COUNTRY_SUFFIXES = {'us', 'usa', 'united states', 'united states of america'}
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    # Encode a coordinate as a base32 geohash of the given length.
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            bounds[0] = mid
+        else:
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    # Return the (latitude, longitude) span in degrees of a geohash cell.
+    total_bits = precision * 5
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Great-circle distance between two coordinates in kilometres.
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude: float, longitude: float,
+                 radius_km: float) -> Tuple[float, float, Optional[float], Optional[float]]:
+    # Return (min_lat, max_lat, min_lon, max_lon) enclosing the circle.
+    # Longitude bounds are None when the box wraps the antimeridian or reaches a pole.
+    d_lat = radius_km / KM_PER_DEGREE
+    min_lat = max(-90.0, latitude - d_lat)
+    max_lat = min(90.0, latitude + d_lat)
+
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat <= 1e-9:
+        return min_lat, max_lat, None, None
+
+    d_lon = radius_km / (KM_PER_DEGREE * cos_lat)
+    min_lon = longitude - d_lon
+    max_lon = longitude + d_lon
+    if min_lon < -180.0 or max_lon > 180.0:
+        return min_lat, max_lat, None, None
+
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def covering_geohashes(latitude: float, longitude: float, radius_km: float) -> List[str]:
+    # Return the geohash prefixes whose cells together cover the search circle.
+    # Picks the finest precision whose cells are at least radius_km wide, then takes
+    # the centre cell and its eight neighbours. Returns [] when no useful prefix exists.
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-9)
+    precision = 0
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        lat_span, lon_span = geohash_cell_size(candidate)
+        if lat_span * KM_PER_DEGREE < radius_km or lon_span * KM_PER_DEGREE * cos_lat < radius_km:
+            break
+        precision = candidate
+
+    if precision == 0:
+        return []
+
+    lat_span, lon_span = geohash_cell_size(precision)
+    cells = set()
+    for d_lat in (-lat_span, 0, lat_span):
+        for d_lon in (-lon_span, 0, lon_span):
+            cell_lat = latitude + d_lat
+            if cell_lat < -90.0 or cell_lat > 90.0:
+                continue
+            cell_lon = (longitude + d_lon + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(cell_lat, cell_lon, precision))
+
+    return sorted(cells)
+
+
+def parse_coordinates(value: str) -> Optional[Tuple[float, float]]:
+    # Parse a "lat,lon" string, returning None if it is malformed or out of range.
+    try:
+        lat_text, lon_text = value.split(',')
+        latitude, longitude = float(lat_text), float(lon_text)
+    except (AttributeError, ValueError):
+        return None
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        return None
+    return latitude, longitude
+
+
+def _normalize_part(text: str) -> str:
+    text = re.sub(r'\d+', ' ', text.lower())
+    text = re.sub(r'[^\w\s]', '', text)
+    return ' '.join(text.split())
+
+
+class Gazetteer:
+    # Offline place lookup backed by the bundled gazetteer.csv.
+
+    _index: Optional[Dict[str, Dict]] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _load() -> Dict[str, Dict]:
+        if Gazetteer._index is not None:
+            return Gazetteer._index
+
+        with Gazetteer._lock:
+            if Gazetteer._index is not None:
+                return Gazetteer._index
+
+            index = {}
+            with open(GAZETTEER_PATH, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    label_parts = [row['name'], row['city'], row['region']]
+                    place = {
+                        'name': ', '.join(part for part in label_parts if part),
+                        'latitude': float(row['latitude']),
+                        'longitude': float(row['longitude'])
+                    }
+                    parts = [_normalize_part(part) for part in label_parts]
+                    name, city, region = parts
+
+                    # Register the most specific spelling first so it wins over shorter ones.
+                    keys = ['|'.join(part for part in parts if part)]
+                    if city:
+                        keys.append(f"{name}|{city}")
+                    if region:
+                        keys.append(f"{name}|{region}")
+                    keys.append(name)
+                    for key in keys:
+                        index.setdefault(key, place)
+
+            Gazetteer._index = index
+            return index
+
+    @staticmethod
+    def geocode(location: str) -> Optional[Dict]:
+        # Resolve free-text location to {'name', 'latitude', 'longitude'}, or None.
+        # Tries the full comma-separated string, then drops leading parts
+        # ("Gas Works Park, Seattle, WA" -> "Seattle, WA" -> "WA").
+        if not location:
+            return None
+
+        index = Gazetteer._load()
+        parts = [_normalize_part(part) for part in location.split(',')]
+        parts = [part for part in parts if part]
+        if parts and parts[-1] in _COUNTRY_SUFFIXES and len(parts) > 1:
+            parts = parts[:-1]
+
+        for start in range(len(parts)):
+            place = index.get('|'.join(parts[start:]))
+            if place:
+                return place
+        return None
+
+    @staticmethod
+    def locate(location: str) -> Dict:
+        # Return the normalised location columns stored alongside an event.
+        place = Gazetteer.geocode(location)
+        if not place:
+            return {
+                'location_normalized': None,
+                'latitude': None,
+                'longitude': None,
+                'geohash': None
+            }
+        return {
+            'location_normalized': place['name'],
+            'latitude': place['latitude'],
+            'longitude': place['longitude'],
+            'geohash': geohash_encode(place['latitude'], place['longitude'])
+        }
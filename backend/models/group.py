@@ -1,6 +1,25 @@
 from typing import Optional, Dict, Any
 from database.connection import Database
 from models.user_stats import UserStats
+from models.projection import Projection
+from models.list_query import ListQuery
+
+# Fields available to GET /groups?fields=; the summary is what the group cards render.
+GROUP_LIST_FIELDS = Projection(
+    columns={
+        'id': 'g.id',
+        'name': 'g.name',
+        'description': 'g.description',
+        'creator_id': 'g.creator_id',
+        'creator_name': 'u.username',
+        'image_url': 'g.image_url',
+        'is_private': 'g.is_private',
+        'created_at': 'g.created_at',
+        'member_count': '(SELECT COUNT(*) FROM group_members m WHERE m.group_id = g.id)'
+    },
+    summary=('id', 'name', 'description', 'image_url', 'is_private', 'creator_name', 'member_count'),
+    summary_columns={'description': 'LEFT(g.description, 280)'}
+)
 
 class Group:
     def __init__(self, id: int = None, name: str = None, description: str = None,
@@ -16,49 +35,23 @@ class Group:
         self.creator_name = creator_name
 
     @classmethod
-    def get_all(cls, page=1, search=None):
+    def get_all(cls, page=1, search=None, fields=None):
+        # fields selects a projection of GROUP_LIST_FIELDS; defaults to the card summary.
+        select_list, _ = GROUP_LIST_FIELDS.select(fields)
         try:
             db = Database()
             conn = db.get_connection()
             cursor = conn.cursor(dictionary=True)
             
-            query = """
-                SELECT 
-                    g.*,
-                    u.username as creator_name,
-                    COUNT(DISTINCT m.user_id) as member_count
-                FROM groups g
-                LEFT JOIN users u ON g.creator_id = u.id
-                LEFT JOIN group_members m ON g.id = m.group_id
-                WHERE 1=1
-            """
-            params = []
+            list_query = ListQuery("groups g LEFT JOIN users u ON g.creator_id = u.id", count_from="groups g")
             
             if search:
-                query += " AND (g.name LIKE %s OR g.description LIKE %s)"
                 search_term = f"%{search}%"
-                params.extend([search_term, search_term])
-            
-            query += " GROUP BY g.id ORDER BY g.created_at DESC"
+                list_query.where("(g.name LIKE %s OR g.description LIKE %s)", search_term, search_term)
             
             limit = 10
-            offset = (page - 1) * limit
-            query += " LIMIT %s OFFSET %s"
-            params.extend([limit, offset])
-            
-            cursor.execute(query, params)
-            groups = cursor.fetchall()
-            
-            count_query = """
-                SELECT COUNT(DISTINCT g.id) as total
-                FROM groups g
-                WHERE 1=1
-            """
-            if search:
-                count_query += " AND (g.name LIKE %s OR g.description LIKE %s)"
-            
-            cursor.execute(count_query, params[:-2] if search else [])  # Exclude LIMIT and OFFSET params
-            total = cursor.fetchone()['total']
+            result = list_query.fetch_page(cursor, select_list, "g.created_at DESC", page=page, per_page=limit)
+            groups, total = result['rows'], result['total']
             
             return {
                 'groups': groups,
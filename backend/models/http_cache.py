@@ -0,0 +1,219 @@
+import hashlib
+import logging
+import os
+import secrets
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+
+from flask import request, make_response
+
+from database.connection import Database
+from models.auth import verify_token
+from models.metrics import cache_counters
+
+logger = logging.getLogger(__name__)
+
+# Cache-Control sent with conditional responses, keyed by blueprint name.
+CACHE_CONTROL = {
+    'blog': 'public, max-age=60',
+    'events': 'public, max-age=60',
+    'forum': 'public, max-age=60',
+    'challenges': 'public, max-age=300',
+    'learning': 'public, max-age=300',
+    'achievements': 'private, max-age=0, must-revalidate'
+}
+_etag_hits, _etag_misses = cache_counters('http_conditional')
+
+DEFAULT_CACHE_CONTROL = 'no-cache'
+PER_USER_CACHE_CONTROL = 'private, max-age=0, must-revalidate'
+
+
+def _now() -> datetime:
+    # HTTP dates have one-second resolution.
+    return datetime.now(timezone.utc).replace(microsecond=0)
+
+
+# Shared by every worker of one deployment; the launcher and asgi.py draw one when it
+# is unset, and a lone process draws its own.
+RELEASE_ID = os.getenv('RELEASE_ID') or secrets.token_hex(8)
+# Seconds a worker reuses version stamps read from the database. A bump in another
+# worker can go unseen (and answered 304) for this long; bumps in this one never are.
+RESOURCE_VERSION_TTL = float(os.getenv('RESOURCE_VERSION_TTL', 1))
+RESOURCE_VERSION_CACHE_SIZE = 10000
+
+
+class ResourceVersions:
+    # Version stamps for cacheable resources, kept in the resource_versions table so a
+    # bump() in one worker is seen by every other one. Writes call bump() after
+    # committing; a conditional GET reads its stamps from a short-lived local copy, or
+    # all at once in one primary-key lookup. A resource read before it was ever bumped
+    # gets a version-0 row, so every worker reports the same Last-Modified for it.
+    # RELEASE_ID keeps ETags from an earlier release from matching.
+
+    _table_ready = False
+    _cache: Dict[str, Tuple[float, Tuple[int, datetime]]] = {}
+
+    @staticmethod
+    def create_table_if_not_exists(cursor):
+        if ResourceVersions._table_ready:
+            return
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS resource_versions (
+                name VARCHAR(191) PRIMARY KEY,
+                version BIGINT NOT NULL,
+                modified_at DATETIME NOT NULL
+            )
+        """)
+        ResourceVersions._table_ready = True
+
+    @staticmethod
+    def get_many(names: List[str]) -> List[Tuple[int, datetime]]:
+        # Stamps for names, in order.
+        now = time.monotonic()
+        cache = ResourceVersions._cache
+        stamps = {}
+        for name in names:
+            cached = cache.get(name)
+            if cached and cached[0] > now:
+                stamps[name] = cached[1]
+        missing = [name for name in names if name not in stamps]
+        if missing:
+            stamps.update(ResourceVersions._load(missing))
+            if len(cache) >= RESOURCE_VERSION_CACHE_SIZE:
+                cache.clear()
+            expires = now + RESOURCE_VERSION_TTL
+            for name in missing:
+                cache[name] = (expires, stamps[name])
+        return [stamps[name] for name in names]
+
+    @staticmethod
+    def _load(names: List[str]) -> Dict[str, Tuple[int, datetime]]:
+        conn = Database().get_connection()
+        if not conn:
+            raise Exception("Database connection failed")
+        cursor = conn.cursor(dictionary=True)
+        try:
+            ResourceVersions.create_table_if_not_exists(cursor)
+            placeholders = ', '.join(['%s'] * len(names))
+            query = f"SELECT name, version, modified_at FROM resource_versions WHERE name IN ({placeholders})"
+            cursor.execute(query, names)
+            rows = cursor.fetchall()
+            if len(rows) < len(names):
+                found = {row['name'] for row in rows}
+                modified = _now().replace(tzinfo=None)
+                cursor.executemany(
+                    "INSERT IGNORE INTO resource_versions (name, version, modified_at) VALUES (%s, 0, %s)",
+                    [(name, modified) for name in names if name not in found]
+                )
+                conn.commit()
+                # Another worker may have inserted first; read back the row that won.
+                cursor.execute(query, names)
+                rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+        return {row['name']: (row['version'], row['modified_at'].replace(tzinfo=timezone.utc)) for row in rows}
+
+    @staticmethod
+    def get(name: str) -> Tuple[int, datetime]:
+        return ResourceVersions.get_many([name])[0]
+
+    @staticmethod
+    def bump(*names: str):
+        modified = _now().replace(tzinfo=None)
+        conn = Database().get_connection()
+        if not conn:
+            logger.error(f"Cannot bump resource versions {names}: database connection failed")
+            return
+        cursor = conn.cursor()
+        try:
+            ResourceVersions.create_table_if_not_exists(cursor)
+            cursor.executemany("""
+                INSERT INTO resource_versions (name, version, modified_at)
+                VALUES (%s, 1, %s)
+                ON DUPLICATE KEY UPDATE version = version + 1, modified_at = VALUES(modified_at)
+            """, [(name, modified) for name in names])
+            conn.commit()
+            for name in names:
+                ResourceVersions._cache.pop(name, None)
+        except Exception as e:
+            logger.error(f"Error bumping resource versions {names}: {str(e)}")
+        finally:
+            cursor.close()
+            conn.close()
+
+
+def _token_user_id() -> Optional[int]:
+    # Identify the caller from the bearer token alone, without loading the user.
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None
+    try:
+        payload = verify_token(auth_header.split(' ')[1])
+        user_id = payload.get('user_id') if payload else None
+        if isinstance(user_id, dict):
+            user_id = user_id.get('id')
+        return int(user_id) if user_id is not None else None
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def conditional(*resources: str, per_user: bool = False):
+    # Decorator adding ETag/Last-Modified validation to a GET view.
+    # resources are version-stamp names and may reference view arguments or the
+    # caller, e.g. 'learning_material:{material_id}' or 'user_achievements:{user_id}'.
+    # per_user folds the caller into the ETag for responses that differ by user.
+    # Place it above token_required so a matching request is answered before
+    # the user is loaded.
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+
+            user_id = _token_user_id() if per_user else None
+            if user_id is None and any('{user_id}' in resource for resource in resources):
+                return f(*args, **kwargs)
+
+            names = [resource.format(user_id=user_id, **kwargs) for resource in resources]
+            try:
+                stamps = ResourceVersions.get_many(names)
+            except Exception as e:
+                logger.error(f"Error reading resource versions: {str(e)}")
+                return f(*args, **kwargs)
+            last_modified = max(modified for _, modified in stamps)
+
+            fingerprint = '|'.join(
+                [RELEASE_ID, request.full_path, str(user_id)] +
+                [f"{name}={version}" for name, (version, _) in zip(names, stamps)]
+            )
+            etag = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            elif request.if_modified_since:
+                not_modified = last_modified <= request.if_modified_since
+            else:
+                not_modified = False
+
+            if not_modified:
+                _etag_hits.inc()
+                response = make_response('', 304)
+            else:
+                _etag_misses.inc()
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            if per_user:
+                response.headers['Cache-Control'] = PER_USER_CACHE_CONTROL
+                response.vary.add('Authorization')
+            else:
+                response.headers['Cache-Control'] = CACHE_CONTROL.get(request.blueprint, DEFAULT_CACHE_CONTROL)
+            return response
+        return decorated
+    return decorator
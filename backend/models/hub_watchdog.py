@@ -0,0 +1,143 @@
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import weakref
+from typing import Optional
+
+from database import instrumentation
+from models.metrics import Counter, Histogram
+
+try:
+    import greenlet
+except ImportError:
+    greenlet = None
+
+try:
+    from eventlet import hubs, patcher
+    _real_threading = patcher.original('threading')
+    _real_sleep = patcher.original('time').sleep
+except ImportError:
+    hubs = None
+    _real_threading = threading
+    _real_sleep = time.sleep
+
+logger = logging.getLogger(__name__)
+
+# A greenlet running this long without yielding to the hub is reported as blocking.
+BLOCK_THRESHOLD = float(os.getenv('HUB_BLOCK_THRESHOLD', 0.1))
+ENABLED = os.getenv('HUB_WATCHDOG', '1').lower() in ('1', 'true', 't')
+
+HUB_BLOCKS = Counter(
+    'eventlet_hub_blocks_total', 'Greenlets that held the hub longer than the threshold, by endpoint.',
+    ('endpoint',)
+)
+HUB_BLOCK_SECONDS = Histogram(
+    'eventlet_hub_block_duration_seconds', 'Time greenlets held the hub past the threshold.',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+
+class HubWatchdog:
+    # Tracks greenlet switches and reports any greenlet that runs for longer than
+    # BLOCK_THRESHOLD without switching back to the hub. The switch hook only stores
+    # a timestamp; a real OS thread does the checking, so it can log the stack of a
+    # greenlet that is still blocking.
+
+    _hub = None
+    _running = None
+    _switched_at = 0.0
+    _thread_id: Optional[int] = None
+    _reported = False
+    _labels = weakref.WeakKeyDictionary()
+    _started = False
+
+    @staticmethod
+    def label(glet, endpoint: str, description: str):
+        # Attach the request or event being served to the current greenlet.
+        HubWatchdog._labels[glet] = (endpoint, description)
+
+    @staticmethod
+    def _describe(glet):
+        return HubWatchdog._labels.get(glet, ('unknown', getattr(glet, '__name__', repr(glet))))
+
+    @staticmethod
+    def _trace(event, args):
+        if event not in ('switch', 'throw'):
+            return
+        now = time.perf_counter()
+        origin, target = args
+        hub_greenlet = HubWatchdog._hub
+
+        ran = now - HubWatchdog._switched_at
+        if origin is not hub_greenlet and ran >= BLOCK_THRESHOLD and HubWatchdog._switched_at:
+            endpoint, _ = HubWatchdog._describe(origin)
+            HUB_BLOCKS.labels(endpoint).inc()
+            HUB_BLOCK_SECONDS.observe(ran)
+            if HubWatchdog._reported:
+                logger.warning(f"Hub released after {ran * 1000:.0f} ms by {endpoint}")
+
+        HubWatchdog._running = None if target is hub_greenlet else target
+        HubWatchdog._switched_at = now
+        HubWatchdog._reported = False
+        HubWatchdog._thread_id = _real_threading.get_ident()
+
+    @staticmethod
+    def _watch():
+        interval = BLOCK_THRESHOLD / 2
+        while True:
+            _real_sleep(interval)
+            running = HubWatchdog._running
+            if running is None or HubWatchdog._reported:
+                continue
+            held = time.perf_counter() - HubWatchdog._switched_at
+            if held < BLOCK_THRESHOLD:
+                continue
+
+            HubWatchdog._reported = True
+            frame = sys._current_frames().get(HubWatchdog._thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame else '<no frame>'
+            endpoint, description = HubWatchdog._describe(running)
+            logger.warning(
+                f"Event loop blocked for {held * 1000:.0f} ms by {description} ({endpoint}):\n{stack}"
+            )
+
+    @staticmethod
+    def start():
+        if HubWatchdog._started or greenlet is None or hubs is None:
+            return
+        HubWatchdog._started = True
+        # greenlet.settrace is per OS thread: this must run on the serving thread.
+        HubWatchdog._hub = hubs.get_hub().greenlet
+        HubWatchdog._switched_at = time.perf_counter()
+        greenlet.settrace(HubWatchdog._trace)
+        _real_threading.Thread(target=HubWatchdog._watch, name='hub-watchdog', daemon=True).start()
+
+
+def init_app(app):
+    # Label each request's greenlet with its route. The watchdog starts with the first
+    # request, so a launcher that imports the app before forking never creates a hub
+    # or thread that its workers would inherit.
+    if not ENABLED or greenlet is None or hubs is None:
+        return
+    from flask import request
+
+    @app.before_request
+    def label_greenlet():
+        if not HubWatchdog._started:
+            HubWatchdog.start()
+        HubWatchdog.label(greenlet.getcurrent(), request.endpoint or 'unmatched',
+                          f"{request.method} {request.path}")
+
+    @app.teardown_request
+    def unlabel_greenlet(exc=None):
+        HubWatchdog._labels.pop(greenlet.getcurrent(), None)
+
+    def label_socket_event(name: str):
+        if not HubWatchdog._started:
+            HubWatchdog.start()
+        HubWatchdog.label(greenlet.getcurrent(), f"socket:{name}", f"socket event {name}")
+
+    instrumentation.event_listeners.append(label_socket_event)
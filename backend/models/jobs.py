@@ -0,0 +1,120 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+from models.metrics import Counter, Gauge
+
+try:
+    import eventlet
+    from eventlet.queue import Full, LightQueue
+except ImportError:
+    eventlet = None
+
+logger = logging.getLogger(__name__)
+
+# Green threads running queued jobs in each worker, and jobs held before enqueue()
+# falls back to running the job in the caller.
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', 1000))
+
+BACKGROUND_JOBS_QUEUED = Gauge('background_jobs_queued', 'Jobs waiting in this worker\'s queue.')
+BACKGROUND_JOBS = Counter('background_jobs_total', 'Background jobs run, by job and result.', ('job', 'result'))
+
+
+def _job_name(function: Callable) -> str:
+    return getattr(function, '__qualname__', getattr(function, '__name__', repr(function)))
+
+
+class Jobs:
+    # In-process job queue and scheduler. Work that does not have to finish before the
+    # response is enqueued and run by green threads in the same worker; scheduled jobs
+    # run in one worker only (the launcher starts the scheduler in worker 0).
+    # Everything is started lazily, after the launcher has forked. Runtimes without an
+    # eventlet hub (the ASGI server) call use_threads() to run jobs on OS threads.
+
+    _queue = None
+    _executor = None
+    _schedules: List[Tuple[float, Callable, str]] = []
+    _scheduler_started = False
+
+    @staticmethod
+    def _run(function: Callable, args, kwargs):
+        name = _job_name(function)
+        try:
+            function(*args, **kwargs)
+            BACKGROUND_JOBS.labels(name, 'ok').inc()
+        except Exception as e:
+            BACKGROUND_JOBS.labels(name, 'error').inc()
+            logger.error(f"Background job {name} failed: {str(e)}", exc_info=True)
+
+    @staticmethod
+    def _work():
+        while True:
+            function, args, kwargs = Jobs._queue.get()
+            Jobs._run(function, args, kwargs)
+
+    @staticmethod
+    def _ensure_started():
+        if Jobs._queue is None:
+            Jobs._queue = LightQueue(JOB_QUEUE_SIZE)
+            for _ in range(JOB_WORKERS):
+                eventlet.spawn(Jobs._work)
+
+    @staticmethod
+    def use_threads():
+        if Jobs._executor is None:
+            Jobs._executor = ThreadPoolExecutor(JOB_WORKERS, thread_name_prefix='job')
+
+    @staticmethod
+    def enqueue(function: Callable, *args, **kwargs):
+        # Run function(*args, **kwargs) in the background; inline without eventlet or
+        # when the queue is full.
+        if Jobs._executor is not None:
+            if Jobs.queued() >= JOB_QUEUE_SIZE:
+                return Jobs._run(function, args, kwargs)
+            Jobs._executor.submit(Jobs._run, function, args, kwargs)
+            return
+        if eventlet is None:
+            return Jobs._run(function, args, kwargs)
+        Jobs._ensure_started()
+        try:
+            Jobs._queue.put_nowait((function, args, kwargs))
+        except Full:
+            Jobs._run(function, args, kwargs)
+
+    @staticmethod
+    def queued() -> int:
+        if Jobs._executor is not None:
+            return Jobs._executor._work_queue.qsize()
+        return Jobs._queue.qsize() if Jobs._queue is not None else 0
+
+    @staticmethod
+    def every(seconds: float, function: Callable, name: str = None):
+        # Register a job to run every `seconds` once the scheduler is started.
+        Jobs._schedules.append((seconds, function, name or _job_name(function)))
+
+    @staticmethod
+    def _schedule_loop(seconds: float, function: Callable, name: str, sleep: Callable = None):
+        while True:
+            (sleep or eventlet.sleep)(seconds)
+            started = time.perf_counter()
+            Jobs._run(function, (), {})
+            logger.debug(f"Scheduled job {name} took {time.perf_counter() - started:.3f}s")
+
+    @staticmethod
+    def start_scheduler():
+        if Jobs._scheduler_started or (eventlet is None and Jobs._executor is None):
+            return
+        Jobs._scheduler_started = True
+        for seconds, function, name in Jobs._schedules:
+            if Jobs._executor is not None:
+                threading.Thread(target=Jobs._schedule_loop, args=(seconds, function, name, time.sleep),
+                                 name=f"schedule-{name}", daemon=True).start()
+            else:
+                eventlet.spawn(Jobs._schedule_loop, seconds, function, name)
+
+
+BACKGROUND_JOBS_QUEUED.set_function(Jobs.queued)
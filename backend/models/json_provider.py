@@ -0,0 +1,122 @@
+import gzip
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from types import MappingProxyType
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed; the framing overhead isn't worth it.
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_MIMETYPES = ('application/json', 'text/plain', 'text/html')
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+# Naive datetimes are stored in server time and were always sent as GMT by
+# Flask's default provider, so they keep being tagged as UTC here.
+ORJSON_OPTIONS = (orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+def _default(obj):
+    # Types neither orjson nor the stdlib encoder handle natively.
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).decode('utf-8', errors='replace')
+    if isinstance(obj, timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, MappingProxyType):
+        return dict(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _stdlib_default(obj):
+    # Match the orjson output when falling back to the stdlib encoder.
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            return obj.isoformat() + 'Z'
+        return obj.isoformat().replace('+00:00', 'Z')
+    if isinstance(obj, (date, time)):
+        return obj.isoformat()
+    return _default(obj)
+
+
+def dumps(obj, **kwargs) -> str:
+    # The provider's encoding without an app: Socket.IO packets and message queue
+    # payloads (see websockets.py) and JSON kept in database columns. separators is
+    # accepted for python-socketio, orjson output is compact anyway.
+    if orjson is not None and set(kwargs) <= {'separators'}:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS).decode('utf-8')
+    kwargs.setdefault('default', _stdlib_default)
+    kwargs.setdefault('ensure_ascii', False)
+    return json.dumps(obj, **kwargs)
+
+
+def loads(s, **kwargs):
+    if orjson is not None and not kwargs:
+        return orjson.loads(s)
+    return json.loads(s, **kwargs)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # Flask JSON provider backed by orjson when it is installed.
+    # datetime/date/time are ISO 8601, Decimal becomes a float and bytes are
+    # decoded as UTF-8, so models can return database rows unchanged.
+
+    def dumps(self, obj, **kwargs) -> str:
+        return dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is not None:
+            body = orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        else:
+            body = self.dumps(obj) + '\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def compress_response(response):
+    # after_request hook: brotli or gzip encode large textual responses the client accepts.
+    if (response.direct_passthrough or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    accept_encoding = request.accept_encodings
+    if brotli is not None and accept_encoding['br']:
+        response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+        response.headers['Content-Encoding'] = 'br'
+    elif accept_encoding['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
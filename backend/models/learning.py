@@ -1,13 +1,42 @@
 from datetime import datetime
 from database.connection import Database
 from models.auth import get_current_user
+from models.comment_tree import CommentTree
+from models.http_cache import ResourceVersions
+from models.reference_data import ReferenceData
+from models.related_content import RelatedContent, RELATED_TOP_K
 from flask import abort
 from mysql.connector import Error as MySQLError
 
+# Columns needed by catalogue cards; `content` is only loaded by get_by_id.
+MATERIAL_LIST_COLUMNS = """
+    lm.id, lm.title, lm.excerpt, lm.category_id, lm.type, lm.duration, lm.thumbnail_url,
+    lm.views_count, lm.author_id, lm.status, lm.created_at, lm.updated_at
+"""
+
+MAX_PER_PAGE = 100
+
 class LearningResource:
     @staticmethod
-    def get_all(category=None, type=None, search=None):
-        # Get all learning resources with optional filters.
+    def get_liked_material_ids(cursor, user_id, material_ids):
+        # Return the subset of material_ids liked by user_id in a single query.
+        if not user_id or not material_ids:
+            return set()
+        
+        placeholders = ', '.join(['%s'] * len(material_ids))
+        cursor.execute(f"""
+            SELECT material_id
+            FROM learning_material_likes
+            WHERE user_id = %s AND material_id IN ({placeholders})
+        """, [user_id] + list(material_ids))
+        return {row['material_id'] for row in cursor.fetchall()}
+
+    @staticmethod
+    def get_all(category=None, type=None, search=None, status=None, page=1, per_page=50):
+        # Get a page of learning resources with optional filters.
+
+        page = max(1, page)
+        per_page = max(1, min(per_page, MAX_PER_PAGE))
 
         db = Database()
         conn = db.get_connection()
@@ -21,50 +50,60 @@ class LearningResource:
         cursor = None
         try:
             cursor = conn.cursor(dictionary=True)
-            query = """
-                SELECT lm.*, u.username as author_name, u.avatar_url as author_avatar_url, u.bio as author_bio, lc.title as category_title,
-                    (SELECT COUNT(*) FROM learning_material_likes WHERE material_id = lm.id) as likes_count
-                FROM learning_materials lm
-                LEFT JOIN users u ON lm.author_id = u.id
-                LEFT JOIN learning_categories lc ON lm.category_id = lc.id
-                WHERE 1=1
-            """
+            
+            # Equality filters come first so they can use idx_category_type_status.
+            where_conditions = []
             params = []
             
             if category:
-                query += " AND lm.category_id = %s"
+                where_conditions.append("lm.category_id = %s")
                 params.append(category)
             if type:
-                query += " AND lm.type = %s"
+                where_conditions.append("lm.type = %s")
                 params.append(type)
+            if status:
+                where_conditions.append("lm.status = %s")
+                params.append(status)
             if search:
-                query += " AND (lm.title LIKE %s OR lm.content LIKE %s OR lm.excerpt LIKE %s)"
+                where_conditions.append("(lm.title LIKE %s OR lm.content LIKE %s OR lm.excerpt LIKE %s)")
                 params.extend([f"%{search}%", f"%{search}%", f"%{search}%"])
             
-            cursor.execute(query, params)
+            where_clause = " WHERE " + " AND ".join(where_conditions) if where_conditions else ""
+            
+            cursor.execute(f"SELECT COUNT(*) as total FROM learning_materials lm{where_clause}", params)
+            total = cursor.fetchone()['total']
+            
+            query = f"""
+                SELECT {MATERIAL_LIST_COLUMNS},
+                    u.username as author_name, u.avatar_url as author_avatar_url, u.bio as author_bio,
+                    (SELECT COUNT(*) FROM learning_material_likes WHERE material_id = lm.id) as likes_count
+                FROM learning_materials lm
+                LEFT JOIN users u ON lm.author_id = u.id
+                {where_clause}
+                ORDER BY lm.created_at DESC, lm.id DESC
+                LIMIT %s OFFSET %s
+            """
+            cursor.execute(query, params + [per_page, (page - 1) * per_page])
             resources = cursor.fetchall() or []
             
+            liked_ids = set()
             current_user = get_current_user()
             if current_user:
-                for resource in resources:
-                    try:
-                        cursor.execute(
-                            "SELECT 1 FROM learning_material_likes WHERE material_id = %s AND user_id = %s",
-                            (resource['id'], current_user['id'])
-                        )
-                        resource['is_liked'] = bool(cursor.fetchone())
-                    except MySQLError as e:
-                        print(f"Error fetching user data: {e}")
-                        resource['is_liked'] = False
-                        
-            
+                try:
+                    liked_ids = LearningResource.get_liked_material_ids(
+                        cursor, current_user['id'], [resource['id'] for resource in resources]
+                    )
+                except MySQLError as e:
+                    print(f"Error fetching user data: {e}")
+            
+            categories = ReferenceData.table('learning_categories')
             materials = []
             for resource in resources:
                 material = {
                     'id': resource['id'],
                     'title': resource['title'],
                     'excerpt': resource['excerpt'] or '',
-                    'category_title': resource.get('category_title', ''),
+                    'category_title': categories.label(resource['category_id'], 'title'),
                     'type': resource['type'],
                     'duration': resource.get('duration', ''),
                     'thumbnail_url': resource.get('thumbnail_url'),
@@ -74,7 +113,7 @@ class LearningResource:
                     'author_name': resource.get('author_name', ''),
                     'author_avatar_url': resource.get('author_avatar_url', ''),
                     'status': resource.get('status', 'published'),
-                    'is_liked': resource.get('is_liked', False),
+                    'is_liked': resource['id'] in liked_ids,
                     'author_bio': resource.get('author_bio', '')
                 }
                 materials.append(material)
@@ -82,7 +121,11 @@ class LearningResource:
             return {
                 "success": True,
                 "data": {
-                    "materials": materials
+                    "materials": materials,
+                    "total": total,
+                    "page": page,
+                    "per_page": per_page,
+                    "total_pages": (total + per_page - 1) // per_page
                 }
             }
             
@@ -325,6 +368,7 @@ class LearningResource:
             )
             
             conn.commit()
+            ResourceVersions.bump(f'learning_material:{post_id}')
             return {
                 "success": True,
                 "data": {
@@ -383,6 +427,7 @@ class LearningResource:
             likes_count = cursor.fetchone()['count']
             
             conn.commit()
+            ResourceVersions.bump(f'learning_material:{material_id}')
             return {
                 "success": True,
                 "data": {
@@ -403,7 +448,7 @@ class LearningResource:
             
     @staticmethod
     def get_related_materials(material_id: int, limit: int = 3, same_type_only: bool = False) -> dict:
-        # Get related materials based on category and optionally type.
+        # Get related materials from the precomputed related-content index.
 
         
         mappings = {
@@ -418,47 +463,46 @@ class LearningResource:
         cursor = conn.cursor(dictionary=True, buffered=True)
                 
         try:
-            material_result = LearningResource.get_by_id(material_id)
-            if not material_result['success']:
-                return material_result
-            
-            material = material_result['data']['material']
+            cursor.execute("SELECT id, type FROM learning_materials WHERE id = %s", (material_id,))
+            material = cursor.fetchone()
+            if not material:
+                return {
+                    "success": False,
+                    "error": "Material not found"
+                }
             
-            query = """
-                SELECT DISTINCT lm.*, u.username as author_name,
-                    (SELECT COUNT(*) FROM learning_material_likes WHERE material_id = lm.id) as likes_count
-                FROM learning_materials lm
-                LEFT JOIN users u ON lm.author_id = u.id
-                WHERE lm.id != %s 
-                AND lm.category_id = %s
-                AND lm.status = 'published'
-            """
-            params = [material_id, material['category_id']]
+            related_ids = RelatedContent.get_related_ids('learning', material_id, RELATED_TOP_K)
+            related_materials = []
             
-            if same_type_only:
-                query += " AND lm.type = %s"
-                params.append(material['type'])
+            if related_ids:
+                placeholders = ','.join(['%s'] * len(related_ids))
+                query = f"""
+                    SELECT {MATERIAL_LIST_COLUMNS}, u.username as author_name,
+                        (SELECT COUNT(*) FROM learning_material_likes WHERE material_id = lm.id) as likes_count
+                    FROM learning_materials lm
+                    LEFT JOIN users u ON lm.author_id = u.id
+                    WHERE lm.id IN ({placeholders})
+                    AND lm.status = 'published'
+                """
+                params = related_ids[:]
                 
-            query += """
-                ORDER BY 
-                    lm.views_count DESC,
-                    likes_count DESC,
-                    lm.created_at DESC
-                LIMIT %s
-            """
-            params.append(limit)
-            
-            cursor.execute(query, params)
-            related_materials = cursor.fetchall()
+                if same_type_only:
+                    query += " AND lm.type = %s"
+                    params.append(material['type'])
+                
+                cursor.execute(query, params)
+                rank = {related_id: position for position, related_id in enumerate(related_ids)}
+                related_materials = sorted(cursor.fetchall(), key=lambda row: rank[row['id']])[:limit]
                         
             if len(related_materials) < limit:
+                # Top up sparse neighbourhoods with the most viewed published materials.
                 remaining_count = limit - len(related_materials)
-                existing_ids = [material_id] + [material['id'] for material in related_materials]
+                existing_ids = [material_id] + [related['id'] for related in related_materials]
                 
                 placeholders = ','.join(['%s'] * len(existing_ids))
                 
                 query = f"""
-                    SELECT DISTINCT lm.*, u.username as author_name,
+                    SELECT {MATERIAL_LIST_COLUMNS}, u.username as author_name,
                         (SELECT COUNT(*) FROM learning_material_likes WHERE material_id = lm.id) as likes_count
                     FROM learning_materials lm
                     LEFT JOIN users u ON lm.author_id = u.id
@@ -472,25 +516,13 @@ class LearningResource:
                     params.append(material['type'])
                     
                 query += """
-                    ORDER BY 
-                        lm.views_count DESC,
-                        likes_count DESC,
-                        RAND()
+                    ORDER BY lm.views_count DESC, lm.id DESC
                     LIMIT %s
                 """
                 params.append(remaining_count)
                 
                 cursor.execute(query, params)
-                additional_materials = cursor.fetchall()
-                
-                existing_ids_set = set(existing_ids)
-                filtered_additional_materials = []
-                for material in additional_materials:
-                    if material['id'] not in existing_ids_set:
-                        filtered_additional_materials.append(material)
-                        existing_ids_set.add(material['id'])
-                
-                related_materials.extend(filtered_additional_materials)
+                related_materials.extend(cursor.fetchall())
             
             formatted_materials = []
             for resource in related_materials:
@@ -730,8 +762,7 @@ class LearningResource:
         cursor = conn.cursor(dictionary=True)
         
         try:
-            cursor.execute("SELECT id FROM learning_categories WHERE id = %s", (category_id,))
-            if not cursor.fetchone():
+            if not ReferenceData.table('learning_categories').get(category_id):
                 return {
                     "success": False,
                     "error": "Invalid category"
@@ -799,6 +830,14 @@ class LearningResource:
             }
             
             conn.commit()
+            
+            ResourceVersions.bump('learning_categories', f'learning_material:{material_id}')
+            
+            try:
+                RelatedContent.refresh_item('learning', material_id)
+            except Exception as e:
+                print(f"Error updating related content: {str(e)}")
+            
             return {
                 "success": True,
                 "data": {
@@ -872,6 +911,14 @@ class LearningResource:
                 }
             
             conn.commit()
+            
+            ResourceVersions.bump('learning_categories', f'learning_material:{material_id}')
+            
+            try:
+                RelatedContent.remove_item('learning', material_id)
+            except Exception as e:
+                print(f"Error updating related content: {str(e)}")
+            
             return {
                 "success": True,
                 "message": "Material deleted successfully"
@@ -932,6 +979,13 @@ class LearningResource:
             
             conn.commit()
             
+            ResourceVersions.bump('learning_categories', f'learning_material:{material_id}')
+            
+            try:
+                RelatedContent.refresh_item('learning', material_id)
+            except Exception as e:
+                print(f"Error updating related content: {str(e)}")
+            
             updated_material = LearningResource.get_by_id(material_id)
             if not updated_material['success']:
                 return updated_material
@@ -953,74 +1007,28 @@ class LearningResource:
 
 class LearningComment:
     @staticmethod
-    def get_comments(material_id, page=1, per_page=10):
-        db = Database()
-        conn = db.get_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Helper function to get replies recursively for any comment
-        def get_comment_replies(comment_id):
-            cursor.execute("""
-                SELECT c.*, u.username
-                FROM learning_material_comments c
-                LEFT JOIN users u ON c.user_id = u.id
-                WHERE c.parent_id = %s
-                ORDER BY c.created_at ASC
-            """, (comment_id,))
-            
-            replies = cursor.fetchall()
-            
-            for reply in replies:
-                cursor.execute("""
-                    SELECT COUNT(*) as count
-                    FROM learning_material_comment_likes
-                    WHERE comment_id = %s
-                """, (reply['id'],))
-                reply['likes_count'] = cursor.fetchone()['count']
-                
-                nested_replies = get_comment_replies(reply['id'])
-                reply['replies'] = nested_replies
-            
-            return replies
-        
+    def get_comments(material_id, page=1, per_page=10, cursor=None, viewer_id=None):
+        # Get a page of comments with their full reply threads.
         try:
-            offset = (page - 1) * per_page
-            
-            cursor.execute("""
-                SELECT COUNT(*) as total
-                FROM learning_material_comments
-                WHERE material_id = %s AND parent_id IS NULL
-            """, (material_id,))
-            total = cursor.fetchone()['total']
-            
-            cursor.execute("""
-                SELECT c.*, u.username, u.avatar_url as user_avatar
-                FROM learning_material_comments c
-                LEFT JOIN users u ON c.user_id = u.id
-                WHERE c.material_id = %s AND c.parent_id IS NULL
-                ORDER BY c.created_at DESC
-                LIMIT %s OFFSET %s
-            """, (material_id, per_page, offset))
-            
-            comments = cursor.fetchall()
-            
-            for comment in comments:
-                cursor.execute("""
-                    SELECT COUNT(*) as count
-                    FROM learning_material_comment_likes
-                    WHERE comment_id = %s
-                """, (comment['id'],))
-                comment['likes_count'] = cursor.fetchone()['count']
-                
-                comment['replies'] = get_comment_replies(comment['id'])
+            total = CommentTree.count_roots('learning', material_id)
+            result = CommentTree.load(
+                'learning',
+                material_id,
+                limit=per_page,
+                cursor=cursor,
+                offset=(page - 1) * per_page,
+                viewer_id=viewer_id
+            )
             
             return {
                 "success": True,
                 "data": {
-                    "items": comments,
+                    "items": result['items'],
                     "total": total,
                     "pages": (total + per_page - 1) // per_page,
-                    "current_page": page
+                    "current_page": page,
+                    "has_more": result['has_more'],
+                    "next_cursor": result['next_cursor']
                 }
             }
             
@@ -1030,9 +1038,6 @@ class LearningComment:
                 "success": False,
                 "error": str(e)
             }
-        finally:
-            cursor.close()
-            conn.close()
     
     @staticmethod
     def create_comment(material_id, user_id, content, parent_id=None):
@@ -1073,6 +1078,7 @@ class LearningComment:
             comment['likes_count'] = 0
             
             conn.commit()
+            ResourceVersions.bump(f'learning_material:{material_id}')
             return {
                 "success": True,
                 "data": {
@@ -0,0 +1,166 @@
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from models.metrics import cache_counters
+
+# Seconds a lightweight total is reused for keyset pages and out-of-range offsets.
+TOTAL_CACHE_TTL = 30
+TOTAL_CACHE_SIZE = 512
+
+_total_cache: Dict[tuple, Tuple[float, int]] = {}
+_total_cache_lock = threading.Lock()
+_total_hits, _total_misses = cache_counters('list_totals')
+
+
+def encode_cursor(sort_value, row_id) -> Optional[str]:
+    # Build a keyset cursor from the sort value and id of the last row of a page.
+    if sort_value is None or row_id is None:
+        return None
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    return f"{sort_value}_{row_id}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    # Parse a cursor produced by encode_cursor for a datetime sort column.
+    if not cursor:
+        return None
+    try:
+        sort_value, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+class ListQuery:
+    # Filters of a paginated list, compiled once and shared by the page query and its
+    # total. from_clause holds the joins the select list needs; count_from is the
+    # narrower FROM used when the total has to be counted on its own, so it must
+    # cover every table the conditions reference.
+
+    def __init__(self, from_clause: str, count_from: str = None):
+        self.from_clause = from_clause
+        self.count_from = count_from or from_clause
+        self.conditions: List[str] = []
+        self.params: List[Any] = []
+
+    def where(self, condition: str, *params) -> 'ListQuery':
+        self.conditions.append(condition)
+        self.params.extend(params)
+        return self
+
+    @property
+    def where_clause(self) -> str:
+        return " WHERE " + " AND ".join(self.conditions) if self.conditions else ""
+
+    def count(self, cursor, cache: bool = True) -> int:
+        # Count matching rows on count_from, reusing a recent result when cache is set.
+        query = f"SELECT COUNT(*) as total FROM {self.count_from}{self.where_clause}"
+        key = (query, tuple(self.params))
+        now = time.monotonic()
+
+        if cache:
+            cached = _total_cache.get(key)
+            if cached and cached[0] > now:
+                _total_hits.inc()
+                return cached[1]
+            _total_misses.inc()
+
+        cursor.execute(query, self.params)
+        total = cursor.fetchone()['total']
+
+        if cache:
+            with _total_cache_lock:
+                if len(_total_cache) >= TOTAL_CACHE_SIZE:
+                    _total_cache.pop(next(iter(_total_cache)))
+                _total_cache[key] = (now + TOTAL_CACHE_TTL, total)
+        return total
+
+    def fetch_page(self, cursor, select_list: str, order_by: str, page: int = 1, per_page: int = 10,
+                   select_params: Sequence = (), group_by: str = None,
+                   cursor_columns: Tuple[str, str] = None) -> Dict[str, Any]:
+        # Offset page in one statement; the total comes from COUNT(*) OVER() evaluated
+        # after filtering and grouping, before LIMIT. Only a page past the end needs a
+        # separate count. With cursor_columns (sort_column, id_column), matching an
+        # order_by of "sort_column DESC, id_column DESC", a page that is not the last
+        # also returns next_cursor from its last row: list endpoints start with a plain
+        # page 1 request and pass that cursor on to fetch_after for the pages after it.
+        group_clause = f" GROUP BY {group_by}" if group_by else ""
+        sort_select = f"{cursor_columns[0]} as _sort_key," if cursor_columns else ""
+        cursor.execute(f"""
+            SELECT
+                {select_list},
+                {sort_select}
+                COUNT(*) OVER() as _total
+            FROM {self.from_clause}
+            {self.where_clause}{group_clause}
+            ORDER BY {order_by}
+            LIMIT %s OFFSET %s
+        """, list(select_params) + self.params + [per_page, (max(page, 1) - 1) * per_page])
+        rows = cursor.fetchall()
+
+        if rows:
+            total = rows[0]['_total']
+        elif page > 1:
+            total = self.count(cursor)
+        else:
+            total = 0
+
+        has_more = max(page, 1) * per_page < total
+        next_cursor = None
+        if cursor_columns and has_more and rows:
+            next_cursor = encode_cursor(rows[-1]['_sort_key'], rows[-1]['id'])
+        for row in rows:
+            del row['_total']
+            row.pop('_sort_key', None)
+
+        return {
+            'rows': rows,
+            'has_more': has_more,
+            'next_cursor': next_cursor,
+            'total': total
+        }
+
+    def fetch_after(self, cursor, select_list: str, sort_column: str, id_column: str, after: Optional[str],
+                    per_page: int = 10, select_params: Sequence = (), group_by: str = None,
+                    descending: bool = True, with_total: bool = True) -> Dict[str, Any]:
+        # Keyset page ordered by (sort_column, id_column): reads per_page rows past the
+        # cursor without scanning the skipped ones. The total is the cached count.
+        direction, comparison = ('DESC', '<') if descending else ('ASC', '>')
+        conditions = list(self.conditions)
+        params = list(self.params)
+
+        position = decode_cursor(after)
+        if position:
+            conditions.append(
+                f"({sort_column} {comparison} %s OR ({sort_column} = %s AND {id_column} {comparison} %s))"
+            )
+            params.extend([position[0], position[0], position[1]])
+
+        where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+        group_clause = f" GROUP BY {group_by}" if group_by else ""
+        cursor.execute(f"""
+            SELECT
+                {select_list},
+                {sort_column} as _sort_key
+            FROM {self.from_clause}
+            {where_clause}{group_clause}
+            ORDER BY {sort_column} {direction}, {id_column} {direction}
+            LIMIT %s
+        """, list(select_params) + params + [per_page + 1])
+        rows = cursor.fetchall()
+
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1]['_sort_key'], rows[-1]['id']) if has_more and rows else None
+        for row in rows:
+            del row['_sort_key']
+
+        return {
+            'rows': rows,
+            'has_more': has_more,
+            'next_cursor': next_cursor,
+            'total': self.count(cursor) if with_total else None
+        }
@@ -0,0 +1,179 @@
+import json
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from database.connection import Database
+
+
+def _streaks(login_dates: Iterable[date]) -> Dict:
+    # Derive the login state from a user's distinct login dates in ascending order.
+    last_date = None
+    current = best = 0
+    for login_date in login_dates:
+        if last_date is not None and login_date == last_date + timedelta(days=1):
+            current += 1
+        elif login_date != last_date:
+            current = 1
+        best = max(best, current)
+        last_date = login_date
+    return {'last_login_date': last_date, 'current_streak': current, 'best_streak': best}
+
+
+class LoginState:
+    # Per-user login counters kept up to date on each login, so streaks and counts
+    # never need a scan of user_logins. login_streak in user_stats is best_streak.
+
+    @staticmethod
+    def record(cursor, user_id: int) -> Dict:
+        # Count one login now, add its feed activities and return the new state. Runs
+        # on the caller's transaction, after the user_logins row has been inserted.
+        cursor.execute(
+            "SELECT user_id FROM user_login_state WHERE user_id = %s FOR UPDATE",
+            (user_id,)
+        )
+        if cursor.fetchone() is None:
+            # First login since the table was introduced: seed it from history,
+            # which already includes this login.
+            LoginState._backfill_user(cursor, user_id)
+        else:
+            # Assignments run left to right, so current_streak reads the previous
+            # last_login_date and best_streak reads the new current_streak.
+            cursor.execute("""
+                UPDATE user_login_state
+                SET current_streak = CASE
+                        WHEN last_login_date = CURDATE() THEN current_streak
+                        WHEN last_login_date = CURDATE() - INTERVAL 1 DAY THEN current_streak + 1
+                        ELSE 1
+                    END,
+                    best_streak = GREATEST(best_streak, current_streak),
+                    login_count = login_count + 1,
+                    streak_advanced = last_login_date IS NULL OR last_login_date < CURDATE(),
+                    last_login_date = CURDATE()
+                WHERE user_id = %s
+            """, (user_id,))
+
+        state = LoginState._fetch(cursor, user_id)
+        login_time = datetime.now().isoformat()
+        activities = [('login_count', {'login_time': login_time, 'count': state['login_count']})]
+        if state['streak_advanced']:
+            activities.append(('login_streak', {'login_time': login_time, 'days': state['current_streak']}))
+        cursor.executemany("""
+            INSERT INTO user_activities (user_id, activity_type, activity_data)
+            VALUES (%s, %s, %s)
+        """, [(user_id, activity_type, json.dumps(data)) for activity_type, data in activities])
+        return state
+
+    @staticmethod
+    def _fetch(cursor, user_id: int) -> Optional[Dict]:
+        cursor.execute("""
+            SELECT user_id, last_login_date, current_streak, best_streak, login_count, streak_advanced
+            FROM user_login_state
+            WHERE user_id = %s
+        """, (user_id,))
+        row = cursor.fetchone()
+        if row is not None and not isinstance(row, dict):
+            row = dict(zip([column[0] for column in cursor.description], row))
+        return row
+
+    @staticmethod
+    def get(user_id: int) -> Optional[Dict]:
+        db = Database()
+        conn = db.get_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            return LoginState._fetch(cursor, user_id)
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def _backfill_user(cursor, user_id: int):
+        cursor.execute("""
+            SELECT DATE(login_time) as login_date, COUNT(*) as logins
+            FROM user_logins
+            WHERE user_id = %s
+            GROUP BY login_date
+            ORDER BY login_date
+        """, (user_id,))
+        rows = cursor.fetchall()
+        if rows and not isinstance(rows[0], dict):
+            rows = [{'login_date': row[0], 'logins': row[1]} for row in rows]
+        LoginState._upsert(cursor, [(user_id, rows)])
+
+    @staticmethod
+    def _upsert(cursor, users: List):
+        values = []
+        for user_id, rows in users:
+            state = _streaks(row['login_date'] for row in rows)
+            values.append((
+                user_id, state['last_login_date'], state['current_streak'], state['best_streak'],
+                sum(row['logins'] for row in rows)
+            ))
+        if not values:
+            return
+        cursor.executemany("""
+            INSERT INTO user_login_state
+                (user_id, last_login_date, current_streak, best_streak, login_count, streak_advanced)
+            VALUES (%s, %s, %s, %s, %s, TRUE)
+            ON DUPLICATE KEY UPDATE
+                last_login_date = VALUES(last_login_date),
+                current_streak = VALUES(current_streak),
+                best_streak = VALUES(best_streak),
+                login_count = VALUES(login_count)
+        """, values)
+
+    @staticmethod
+    def backfill(batch_size: int = 500) -> int:
+        # Rebuild every user's login state from user_logins; returns users written.
+        # Reads one grouped row per user and day, in user order, so memory stays
+        # bounded by a single user's history plus one batch.
+        db = Database()
+        conn = db.get_connection()
+        if not conn:
+            raise Exception("Database connection failed")
+        read_cursor = conn.cursor(dictionary=True)
+        write_conn = db.get_connection()
+        write_cursor = write_conn.cursor()
+
+        try:
+            read_cursor.execute("""
+                SELECT user_id, DATE(login_time) as login_date, COUNT(*) as logins
+                FROM user_logins
+                GROUP BY user_id, login_date
+                ORDER BY user_id, login_date
+            """)
+
+            written = 0
+            batch = []
+            current_user, current_rows = None, []
+            for row in read_cursor:
+                if row['user_id'] != current_user:
+                    if current_user is not None:
+                        batch.append((current_user, current_rows))
+                    current_user, current_rows = row['user_id'], []
+                current_rows.append(row)
+
+                if len(batch) >= batch_size:
+                    LoginState._upsert(write_cursor, batch)
+                    write_conn.commit()
+                    written += len(batch)
+                    batch = []
+
+            if current_user is not None:
+                batch.append((current_user, current_rows))
+            LoginState._upsert(write_cursor, batch)
+            write_conn.commit()
+            return written + len(batch)
+        except Exception as e:
+            write_conn.rollback()
+            print(f"Error backfilling login state: {str(e)}")
+            raise e
+        finally:
+            read_cursor.close()
+            write_cursor.close()
+            conn.close()
+            write_conn.close()
+
+
+if __name__ == '__main__':
+    print(f"Backfilled login state for {LoginState.backfill()} users")
@@ -0,0 +1,444 @@
+import bisect
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from database import instrumentation
+
+# Prometheus text exposition without the client library. Children are looked up once
+# per label set and then updated with plain attribute arithmetic; under the GIL (and
+# eventlet's cooperative scheduling) that is safe enough for monitoring counters, so
+# the hot path takes no locks.
+#
+# Each process keeps its own registry. Servers with several workers (the launcher, and
+# asgi.py with ASGI_WORKERS > 1) aggregate them in the parent: every worker writes a
+# snapshot of its registry to METRICS_SNAPSHOT_DIR every METRICS_SNAPSHOT_INTERVAL
+# seconds (and once more when it drains), and the parent's MetricsAggregator sums the
+# snapshots into METRICS_FILE, which /metrics on any worker serves. Counts of workers
+# that have exited stay in the sum, so counters only grow for the server as a whole,
+# whichever worker answers the scrape.
+
+# Set by the parent for its workers; unset, /metrics serves this process's registry.
+METRICS_SNAPSHOT_DIR = os.getenv('METRICS_SNAPSHOT_DIR', '')
+METRICS_FILE = os.getenv('METRICS_FILE', '')
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv('METRICS_SNAPSHOT_INTERVAL', 5))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def labels(self, *values):
+        # Return the child for a label set; keep the result to skip the lookup next time.
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, child in list(self._children.items()):
+            lines.extend(child.samples(self.name, self.labelnames, key))
+        return lines
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def samples(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Callable[[], object] = None):
+        # function, if given, is called at scrape time. It returns a number, or a dict
+        # of label-value tuples to numbers for labelled gauges.
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], object]):
+        self.function = function
+
+    def _samples(self) -> List[str]:
+        if self.function is None:
+            return super()._samples()
+        try:
+            result = self.function()
+        except Exception:
+            return []
+        if isinstance(result, dict):
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(float(value))}"
+                    for key, value in result.items()]
+        return [f"{self.name} {_format_value(float(result))}"]
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labelnames, key):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = f'le="{_format_value(float(bound))}"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, le)} {cumulative}")
+        labels = _format_labels(labelnames, key)
+        lines.append(f"{name}_sum{labels} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+    def snapshot(self) -> List:
+        # [name, kind, documentation, [[series, value], ...]] for every metric.
+        result = []
+        for metric in self._metrics.values():
+            samples = []
+            for line in metric._samples():
+                series, _, value = line.rpartition(' ')
+                samples.append([series, float(value)])
+            result.append([metric.name, metric.kind, metric.documentation, samples])
+        return result
+
+
+REGISTRY = Registry()
+
+
+def _write_atomically(path: str, text: str):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+
+def write_snapshot():
+    # Publish this worker's registry for the parent to aggregate.
+    if not METRICS_SNAPSHOT_DIR:
+        return
+    try:
+        os.makedirs(METRICS_SNAPSHOT_DIR, exist_ok=True)
+        _write_atomically(os.path.join(METRICS_SNAPSHOT_DIR, f"{os.getpid()}.json"), json.dumps(REGISTRY.snapshot()))
+    except OSError as e:
+        print(f"Cannot write metrics snapshot: {str(e)}")
+
+
+def start_snapshots():
+    # In a worker of an aggregating server: write a snapshot every interval. A green
+    # thread once the worker is monkey-patched.
+    if not METRICS_SNAPSHOT_DIR:
+        return
+
+    def run():
+        while True:
+            write_snapshot()
+            time.sleep(METRICS_SNAPSHOT_INTERVAL)
+
+    threading.Thread(target=run, name='metrics-snapshots', daemon=True).start()
+
+
+def aggregated() -> Optional[str]:
+    # The parent's sum over all workers, or None outside an aggregating server.
+    if not METRICS_FILE:
+        return None
+    try:
+        with open(METRICS_FILE) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsAggregator:
+    # Runs in the parent of the workers. collect() sums the snapshots of live workers
+    # and the final counters and histograms of exited ones (their gauges are dropped)
+    # and writes the result as a Prometheus exposition to output_file.
+
+    def __init__(self, snapshot_dir: str, output_file: str):
+        self.snapshot_dir = snapshot_dir
+        self.output_file = output_file
+        self.kinds: Dict[str, Tuple[str, str]] = {}
+        self.retired: Dict[str, Dict[str, float]] = {}
+        os.makedirs(snapshot_dir, exist_ok=True)
+
+    def collect(self):
+        totals = {name: dict(samples) for name, samples in self.retired.items()}
+        for filename in os.listdir(self.snapshot_dir):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                pid = int(filename[:-len('.json')])
+                path = os.path.join(self.snapshot_dir, filename)
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (ValueError, OSError):
+                continue
+            alive = _alive(pid)
+            for name, kind, documentation, samples in snapshot:
+                self.kinds.setdefault(name, (kind, documentation))
+                if not alive and kind == 'gauge':
+                    continue
+                target = totals.setdefault(name, {})
+                retired = self.retired.setdefault(name, {}) if not alive else None
+                for series, value in samples:
+                    target[series] = target.get(series, 0.0) + value
+                    if retired is not None:
+                        retired[series] = retired.get(series, 0.0) + value
+            if not alive:
+                os.remove(path)
+
+        lines = []
+        for name, (kind, documentation) in self.kinds.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{series} {_format_value(value)}" for series, value in totals.get(name, {}).items())
+        try:
+            _write_atomically(self.output_file, '\n'.join(lines) + '\n')
+        except OSError as e:
+            print(f"Cannot write aggregated metrics: {str(e)}")
+
+    def close(self):
+        for filename in os.listdir(self.snapshot_dir):
+            try:
+                os.remove(os.path.join(self.snapshot_dir, filename))
+            except OSError:
+                pass
+        try:
+            os.rmdir(self.snapshot_dir)
+            os.remove(self.output_file)
+        except OSError:
+            pass
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by endpoint.',
+    ('blueprint', 'endpoint', 'method')
+)
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'HTTP responses by endpoint and status.',
+    ('blueprint', 'endpoint', 'method', 'status')
+)
+DB_CONNECTIONS_OPENED = Counter('db_connections_opened_total', 'MySQL connections opened.')
+DB_QUERY_SECONDS = Histogram('db_query_duration_seconds', 'SQL statement latency.', buckets=DB_BUCKETS)
+SOCKET_CONNECTIONS = Gauge('socketio_connections', 'Connected Socket.IO clients.')
+SOCKET_ROOMS = Gauge('socketio_rooms', 'Socket.IO rooms with at least one member.')
+SOCKET_EVENTS_RECEIVED = Counter('socketio_events_received_total', 'Socket.IO events handled by type.', ('event',))
+SOCKET_EVENTS_EMITTED = Counter('socketio_events_emitted_total', 'Socket.IO events emitted by type.', ('event',))
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups by cache and result (hit/miss).', ('cache', 'result'))
+BACKGROUND_QUEUE_DEPTH = Gauge('eventlet_hub_pending_timers', 'Green threads and timers waiting on the eventlet hub.')
+
+
+def cache_counters(cache: str):
+    # Pre-bound (hit, miss) counters for a cache.
+    return CACHE_REQUESTS.labels(cache, 'hit'), CACHE_REQUESTS.labels(cache, 'miss')
+
+
+def _hub_pending() -> int:
+    from eventlet import hubs
+    hub = hubs.get_hub()
+    return len(getattr(hub, 'timers', ())) + len(getattr(hub, 'next_timers', ()))
+
+
+BACKGROUND_QUEUE_DEPTH.set_function(_hub_pending)
+
+
+_received_counters = {}
+
+
+def _count_event(name: str):
+    counter = _received_counters.get(name)
+    if counter is None:
+        counter = _received_counters[name] = SOCKET_EVENTS_RECEIVED.labels(name)
+    counter.inc()
+
+
+instrumentation.query_listeners.append(DB_QUERY_SECONDS.labels().observe)
+instrumentation.connection_listeners.append(DB_CONNECTIONS_OPENED.labels().inc)
+instrumentation.event_listeners.append(_count_event)
+
+
+def init_app(app):
+    # Record latency and status for every request.
+    from flask import request
+
+    endpoints = {}
+
+    @app.before_request
+    def start_request_timer():
+        request.environ['metrics.started'] = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = request.environ.get('metrics.started')
+        if started is None:
+            return response
+
+        key = (request.blueprint or '', request.endpoint or 'unmatched', request.method)
+        children = endpoints.get(key)
+        if children is None:
+            children = endpoints[key] = (HTTP_REQUEST_SECONDS.labels(*key), {})
+        histogram, statuses = children
+
+        histogram.observe(time.perf_counter() - started)
+        counter = statuses.get(response.status_code)
+        if counter is None:
+            counter = statuses[response.status_code] = HTTP_REQUESTS.labels(*key, response.status_code)
+        counter.inc()
+        return response
+
+
+def init_socketio(socketio):
+    # Export connection and room gauges and count emitted events.
+    init_socket_server(socketio.server)
+
+
+def init_socket_server(server):
+    # init_socketio for a bare python-socketio server, such as the ASGI runtime's
+    # AsyncServer, whose emit() returns a coroutine that is passed through.
+
+    def connections():
+        return len(getattr(server.eio, 'sockets', ()))
+
+    def rooms():
+        total = 0
+        for namespace_rooms in server.manager.rooms.values():
+            # Skip the namespace-wide room and each client's private sid room.
+            total += sum(1 for room, members in namespace_rooms.items()
+                         if room is not None and members and not (len(members) == 1 and room in members))
+        return total
+
+    SOCKET_CONNECTIONS.set_function(connections)
+    SOCKET_ROOMS.set_function(rooms)
+
+    emit = server.emit
+    emitted = {}
+
+    def counted_emit(event, *args, **kwargs):
+        counter = emitted.get(event)
+        if counter is None:
+            counter = emitted[event] = SOCKET_EVENTS_EMITTED.labels(event)
+        counter.inc()
+        return emit(event, *args, **kwargs)
+
+    server.emit = counted_emit
@@ -1,33 +1,101 @@
 from database.connection import Database
+from database.query_layer import Statement, run_plan
+from database.async_connection import AsyncDatabase
+from models.list_query import ListQuery
+
+class NotificationQueries:
+    # Plans shared by Notification and AsyncNotification (see database/query_layer.py).
+
+    @staticmethod
+    def unread_count(user_id):
+        result = yield Statement(
+            """
+            SELECT COUNT(*) as unread_count 
+            FROM notifications 
+            WHERE user_id = %s AND is_read = FALSE
+            """,
+            (user_id,), fetch='one', prepare=True
+        )
+        return {'unread_count': result['unread_count'] if result else 0}
+
+    @staticmethod
+    def create(user_id, type, title, content, link=None):
+        result = yield Statement(
+            """
+            INSERT INTO notifications (
+                user_id, type, title, content, link, is_read, created_at
+            ) VALUES (%s, %s, %s, %s, %s, FALSE, NOW())
+            """,
+            (user_id, type, title, content, link), fetch=None
+        )
+        notification = yield Statement(
+            """
+            SELECT 
+                id,
+                user_id,
+                type,
+                title,
+                content,
+                link,
+                is_read,
+                created_at
+            FROM notifications 
+            WHERE id = %s
+            """,
+            (result['lastrowid'],), fetch='one'
+        )
+        if notification:
+            notification['data'] = {'link': notification['link']} if notification['link'] else None
+        return notification
+
+    @staticmethod
+    def mark_as_read(notification_id, user_id):
+        result = yield Statement(
+            """
+            UPDATE notifications 
+            SET is_read = TRUE
+            WHERE id = %s AND user_id = %s
+            """,
+            (notification_id, user_id), fetch=None
+        )
+        if result['rowcount'] == 0:
+            return {"error": "Notification not found"}
+        return {"message": "Notification marked as read"}
+
+    @staticmethod
+    def mark_all_as_read(user_id):
+        result = yield Statement(
+            """
+            UPDATE notifications 
+            SET is_read = TRUE
+            WHERE user_id = %s AND is_read = FALSE
+            """,
+            (user_id,), fetch=None
+        )
+        return {
+            "message": "All notifications marked as read",
+            "notifications_updated": result['rowcount']
+        }
 
 class Notification:
     @staticmethod
-    def get_all(user_id, page=1, limit=10):
+    def get_all(user_id, page=1, limit=10, cursor=None):
+        # cursor switches from page numbers to keyset pagination for deep pages: request
+        # page 1 without one, then pass each response's next_cursor back as cursor.
         try:
             db = Database()
             conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
+            db_cursor = conn.cursor(dictionary=True)
             
-            offset = (page - 1) * limit
+            select_list = "id, user_id, type, title, content, link, is_read, created_at"
+            list_query = ListQuery("notifications").where("user_id = %s", user_id)
             
-            query = """
-                SELECT 
-                    id,
-                    user_id,
-                    type,
-                    title,
-                    content,
-                    link,
-                    is_read,
-                    created_at
-                FROM notifications
-                WHERE user_id = %s
-                ORDER BY created_at DESC
-                LIMIT %s OFFSET %s
-            """
-            
-            cursor.execute(query, (user_id, limit, offset))
-            notifications = cursor.fetchall()
+            if cursor:
+                result = list_query.fetch_after(db_cursor, select_list, "created_at", "id", cursor, per_page=limit)
+            else:
+                result = list_query.fetch_page(db_cursor, select_list, "created_at DESC, id DESC",
+                                               page=page, per_page=limit, cursor_columns=("created_at", "id"))
+            notifications, total, next_cursor = result['rows'], result['total'], result['next_cursor']
             
             transformed_notifications = []
             for notification in notifications:
@@ -36,155 +104,51 @@ class Notification:
                     'data': {'link': notification['link']} if notification['link'] else None
                 })
             
-            cursor.execute(
-                "SELECT COUNT(*) as total FROM notifications WHERE user_id = %s",
-                (user_id,)
-            )
-            total = cursor.fetchone()['total']
-            
             return {
                 'notifications': transformed_notifications,
                 'page': page,
                 'total': total,
-                'total_pages': (total + limit - 1) // limit
+                'total_pages': (total + limit - 1) // limit,
+                'next_cursor': next_cursor
             }
         except Exception as e:
             print(f"Error in get_all: {str(e)}")
             raise e
         finally:
-            cursor.close()
+            db_cursor.close()
             conn.close()
 
     @staticmethod
     def get_unread_count(user_id):
         try:
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute(
-                """
-                SELECT COUNT(*) as unread_count 
-                FROM notifications 
-                WHERE user_id = %s AND is_read = FALSE
-                """,
-                (user_id,)
-            )
-            
-            result = cursor.fetchone()
-            return {'unread_count': result['unread_count'] if result else 0}
+            return run_plan(NotificationQueries.unread_count(user_id))
         except Exception as e:
             print(f"Error in get_unread_count: {str(e)}")
             return {'unread_count': 0}
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
 
     @staticmethod
     def create(user_id, type, title, content, link=None):
         try:
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = """
-                INSERT INTO notifications (
-                    user_id, type, title, content, link, is_read, created_at
-                ) VALUES (%s, %s, %s, %s, %s, FALSE, NOW())
-            """
-            
-            cursor.execute(query, (user_id, type, title, content, link))
-            conn.commit()
-            
-            notification_id = cursor.lastrowid
-            cursor.execute("""
-                SELECT 
-                    id,
-                    user_id,
-                    type,
-                    title,
-                    content,
-                    link,
-                    is_read,
-                    created_at
-                FROM notifications 
-                WHERE id = %s
-            """, (notification_id,))
-            notification = cursor.fetchone()
-            
-            if notification:
-                notification['data'] = {'link': notification['link']} if notification['link'] else None
-            
-            return notification
+            return run_plan(NotificationQueries.create(user_id, type, title, content, link), commit=True)
         except Exception as e:
-            conn.rollback()
             print(f"Error in create: {str(e)}")
             raise e
-        finally:
-            cursor.close()
-            conn.close()
 
     @staticmethod
     def mark_as_read(notification_id, user_id):
         try:
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                """
-                UPDATE notifications 
-                SET is_read = TRUE
-                WHERE id = %s AND user_id = %s
-                """,
-                (notification_id, user_id)
-            )
-            
-            if cursor.rowcount == 0:
-                return {"error": "Notification not found"}
-            
-            conn.commit()
-            return {"message": "Notification marked as read"}
+            return run_plan(NotificationQueries.mark_as_read(notification_id, user_id), commit=True)
         except Exception as e:
-            conn.rollback()
             print(f"Error in mark_as_read: {str(e)}")
             raise e
-        finally:
-            cursor.close()
-            conn.close()
 
     @staticmethod
     def mark_all_as_read(user_id):
         try:
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                """
-                UPDATE notifications 
-                SET is_read = TRUE
-                WHERE user_id = %s AND is_read = FALSE
-                """,
-                (user_id,)
-            )
-            
-            rows_affected = cursor.rowcount
-            
-            conn.commit()
-            return {
-                "message": "All notifications marked as read",
-                "notifications_updated": rows_affected
-            }
+            return run_plan(NotificationQueries.mark_all_as_read(user_id), commit=True)
         except Exception as e:
-            conn.rollback()
             print(f"Error in mark_all_as_read: {str(e)}")
             raise e
-        finally:
-            cursor.close()
-            conn.close()
 
     @staticmethod
     def delete_all(user_id):
@@ -203,4 +167,29 @@ class Notification:
             raise e
         finally:
             cursor.close()
-            conn.close() 
\ No newline at end of file
+            conn.close() 
+
+class AsyncNotification:
+    # Coroutine versions of the hot notification paths for the ASGI runtime.
+
+    @staticmethod
+    async def get_unread_count(user_id):
+        try:
+            return await AsyncDatabase.run_plan(NotificationQueries.unread_count(user_id))
+        except Exception as e:
+            print(f"Error in get_unread_count: {str(e)}")
+            return {'unread_count': 0}
+
+    @staticmethod
+    async def create(user_id, type, title, content, link=None):
+        return await AsyncDatabase.run_plan(
+            NotificationQueries.create(user_id, type, title, content, link), commit=True
+        )
+
+    @staticmethod
+    async def mark_as_read(notification_id, user_id):
+        return await AsyncDatabase.run_plan(NotificationQueries.mark_as_read(notification_id, user_id), commit=True)
+
+    @staticmethod
+    async def mark_all_as_read(user_id):
+        return await AsyncDatabase.run_plan(NotificationQueries.mark_all_as_read(user_id), commit=True)
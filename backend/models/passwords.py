@@ -0,0 +1,71 @@
+import os
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from database import cooperative
+from models.metrics import Gauge, Histogram
+
+# Hash parameters for new and rehashed passwords, in werkzeug's method syntax.
+# Stored hashes using anything else are upgraded on the next successful login.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+# Hashes running at once; further callers wait their turn without blocking the hub.
+PASSWORD_HASH_CONCURRENCY = int(os.getenv('PASSWORD_HASH_CONCURRENCY', 4))
+
+HASH_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+PASSWORD_HASH_WAITING = Gauge('password_hash_waiting', 'Password hash operations queued for a worker.')
+PASSWORD_HASH_RUNNING = Gauge('password_hash_running', 'Password hash operations in progress.')
+PASSWORD_HASH_WAIT_SECONDS = Histogram(
+    'password_hash_wait_seconds', 'Time password hash operations spent queued.', buckets=HASH_BUCKETS
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    'password_hash_duration_seconds', 'Password hash and verify time by operation.', ('operation',),
+    buckets=HASH_BUCKETS
+)
+
+_waiting = PASSWORD_HASH_WAITING.labels()
+_running = PASSWORD_HASH_RUNNING.labels()
+_wait_seconds = PASSWORD_HASH_WAIT_SECONDS.labels()
+_hash_seconds = PASSWORD_HASH_SECONDS.labels('hash')
+_verify_seconds = PASSWORD_HASH_SECONDS.labels('verify')
+
+
+class Passwords:
+    # Password hashing off the eventlet hub. hashlib's scrypt and PBKDF2 release the
+    # GIL, so running them on eventlet's native thread pool keeps websockets and other
+    # requests responsive during a login burst. Under the ASGI runtime the views run
+    # on plain threads, which hash directly.
+
+    _slots = cooperative.Semaphore(PASSWORD_HASH_CONCURRENCY)
+
+    @staticmethod
+    def _run(histogram, function, *args):
+        queued = time.perf_counter()
+        _waiting.inc()
+        Passwords._slots.acquire()
+        _waiting.dec()
+        started = time.perf_counter()
+        _wait_seconds.observe(started - queued)
+        _running.inc()
+        try:
+            return cooperative.run_off_hub(function, *args)
+        finally:
+            _running.dec()
+            histogram.observe(time.perf_counter() - started)
+            Passwords._slots.release()
+
+    @staticmethod
+    def hash(password: str) -> str:
+        return Passwords._run(_hash_seconds, generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+    @staticmethod
+    def verify(password_hash: str, password: str) -> bool:
+        if not password_hash:
+            return False
+        return Passwords._run(_verify_seconds, check_password_hash, password_hash, password)
+
+    @staticmethod
+    def needs_rehash(password_hash: str) -> bool:
+        # True when a hash was made with different parameters than PASSWORD_HASH_METHOD.
+        return bool(password_hash) and password_hash.split('$', 1)[0] != PASSWORD_HASH_METHOD
@@ -0,0 +1,480 @@
+import glob
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional
+
+from models.auth import get_current_user
+
+try:
+    import greenlet
+except ImportError:
+    greenlet = None
+
+try:
+    from eventlet import patcher
+    _real_threading = patcher.original('threading')
+except ImportError:
+    _real_threading = threading
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = float(os.getenv('PROFILER_SAMPLE_INTERVAL', 0.005))
+MAX_STACK_DEPTH = 64
+MAX_PROFILES = 20
+MAX_HEAP_SNAPSHOTS = 5
+MAX_WINDOW_SECONDS = 600
+TRACEMALLOC_FRAMES = 10
+# Workers are separate processes and an admin request can land on any of them, so
+# profiles, heap snapshots and the window / heap tracing switches live in a directory
+# shared by every worker on the host. Workers pick up switches within SYNC_INTERVAL.
+PROFILER_DIR = os.getenv(
+    'PROFILER_DIR',
+    os.path.join(tempfile.gettempdir(), f"green-buddy-profiler-{os.getenv('FLASK_PORT', 5000)}")
+)
+SYNC_INTERVAL = 1.0
+
+# Frames from these directories are kept but shortened to the file name.
+_BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_ID_PATTERN = re.compile(r'^[0-9.-]+$')
+_ids = (None, None)
+
+
+def _next_id() -> str:
+    # "<pid>-<n>": the counter is recreated in each forked worker, the pid keeps ids unique.
+    global _ids
+    pid, counter = _ids
+    if pid != os.getpid():
+        pid, counter = os.getpid(), itertools.count(1)
+        _ids = (pid, counter)
+    return f"{pid}-{next(counter)}"
+
+
+def _path(name: str) -> str:
+    return os.path.join(PROFILER_DIR, name)
+
+
+def _write_json(name: str, data: Dict):
+    os.makedirs(PROFILER_DIR, exist_ok=True)
+    temporary = f"{_path(name)}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary, _path(name))
+
+
+def _read_json(name: str) -> Optional[Dict]:
+    try:
+        with open(_path(name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _remove(name: str):
+    try:
+        os.remove(_path(name))
+    except OSError:
+        pass
+
+
+def _prune(pattern: str, keep: int):
+    # Drop the oldest files matching pattern beyond keep.
+    paths = sorted(glob.glob(_path(pattern)), key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+    for path in paths[:max(0, len(paths) - keep)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(_BACKEND_ROOT):
+        filename = os.path.relpath(filename, _BACKEND_ROOT)
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{frame.f_lineno})"
+
+
+def _collapse(frame) -> Optional[str]:
+    # Render a stack root-first as "a;b;c", keeping the innermost MAX_STACK_DEPTH frames.
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    if not labels:
+        return None
+    return ';'.join(reversed(labels))
+
+
+class Profile:
+    # Collapsed stacks (Brendan Gregg's flamegraph.pl / speedscope input) for one
+    # request or a sampling window. Stacks captured while the request greenlet was
+    # parked on the hub, i.e. waiting on I/O, get an "[off-cpu]" root frame.
+
+    def __init__(self, name: str, profile_id: str = None):
+        self.id = profile_id or _next_id()
+        self.name = name
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.requests = 0
+        self.stacks: Counter = Counter()
+        self.saved_at = 0.0
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def collapsed(self) -> str:
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + '\n'
+
+    def summary(self) -> Dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 1),
+            'requests': self.requests,
+            'samples': self.samples
+        }
+
+    def save(self):
+        self.saved_at = time.monotonic()
+        try:
+            _write_json(f"profile-{self.id}.json", {**self.summary(), 'stacks': dict(self.stacks)})
+            _prune('profile-*.json', MAX_PROFILES)
+        except OSError as e:
+            logger.warning(f"Cannot save profile {self.id}: {str(e)}")
+
+    @staticmethod
+    def load(profile_id: str) -> Optional['Profile']:
+        if not _ID_PATTERN.match(profile_id):
+            return None
+        data = _read_json(f"profile-{profile_id}.json")
+        if not data:
+            return None
+        profile = Profile(data['name'], data['id'])
+        profile.started_at = data['started_at']
+        profile.duration = data['duration_ms'] / 1000
+        profile.requests = data['requests']
+        profile.stacks = Counter(data['stacks'])
+        return profile
+
+
+class _Sampler:
+    # Samples one request from a real OS thread until stopped.
+
+    def __init__(self, profile: Profile):
+        self.profile = profile
+        self.thread_id = _real_threading.get_ident()
+        self.glet = greenlet.getcurrent() if greenlet else None
+        self.started = time.perf_counter()
+        self._stopped = _real_threading.Event()
+        self._thread = _real_threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        if self.glet is not None and self.glet.gr_frame is not None:
+            # The request greenlet is suspended: it is waiting on the hub.
+            stack = _collapse(self.glet.gr_frame)
+            if stack:
+                self.profile.stacks['[off-cpu];' + stack] += 1
+            return
+
+        frame = sys._current_frames().get(self.thread_id)
+        stack = _collapse(frame)
+        if stack:
+            self.profile.stacks[stack] += 1
+
+    def _run(self):
+        while not self._stopped.wait(SAMPLE_INTERVAL):
+            try:
+                self._sample()
+            except Exception as e:
+                logger.debug(f"Profiler sample failed: {str(e)}")
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join(1.0)
+        self.profile.duration += time.perf_counter() - self.started
+        self.profile.requests += 1
+
+
+class Profiler:
+    # Profiles are saved to PROFILER_DIR when a request finishes; a window writes
+    # one profile per worker ("<window id>.<pid>"), saved at most every SYNC_INTERVAL.
+
+    _window: Optional[Profile] = None
+    _window_id: Optional[str] = None
+    _window_until = 0.0
+    _window_rate = 1.0
+    _synced_at = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def sync(force: bool = False):
+        # Follow the window and heap tracing switches set through any worker.
+        now = time.monotonic()
+        if not force and now - Profiler._synced_at < SYNC_INTERVAL:
+            return
+        Profiler._synced_at = now
+        with Profiler._lock:
+            window = _read_json('window.json')
+            if window and window['until'] > time.time():
+                if Profiler._window_id != window['id']:
+                    Profiler._close_window()
+                    Profiler._window = Profile(window['name'], f"{window['id']}.{os.getpid()}")
+                    Profiler._window_id = window['id']
+                Profiler._window_until = window['until']
+                Profiler._window_rate = window['rate']
+            else:
+                Profiler._close_window()
+        HeapSnapshots.sync()
+
+    @staticmethod
+    def _close_window():
+        profile = Profiler._window
+        Profiler._window = None
+        Profiler._window_id = None
+        if profile is not None and profile.requests:
+            profile.save()
+
+    @staticmethod
+    def start_window(seconds: float, rate: float = 1.0) -> Dict:
+        # Profile a fraction of all requests, on every worker, for the next seconds.
+        seconds = max(1.0, min(float(seconds), MAX_WINDOW_SECONDS))
+        rate = max(0.0, min(float(rate), 1.0))
+        window = {
+            'id': _next_id(),
+            'name': f"window {int(seconds)}s @ {rate:g}",
+            'started_at': time.time(),
+            'until': time.time() + seconds,
+            'rate': rate
+        }
+        _write_json('window.json', window)
+        Profiler.sync(force=True)
+        return window
+
+    @staticmethod
+    def stop_window():
+        _remove('window.json')
+        Profiler.sync(force=True)
+
+    @staticmethod
+    def window_profile() -> Optional[Profile]:
+        # The active window profile, if this request is sampled into it.
+        Profiler.sync()
+        profile = Profiler._window
+        if profile is None:
+            return None
+        if time.time() > Profiler._window_until:
+            with Profiler._lock:
+                Profiler._close_window()
+            return None
+        if random.random() >= Profiler._window_rate:
+            return None
+        return profile
+
+    @staticmethod
+    def start_request(name: str, profile: Profile = None) -> _Sampler:
+        if profile is None:
+            profile = Profile(name)
+        return _Sampler(profile)
+
+    @staticmethod
+    def finish_request(sampler: _Sampler):
+        sampler.stop()
+        profile = sampler.profile
+        if profile is not Profiler._window or time.monotonic() - profile.saved_at >= SYNC_INTERVAL:
+            profile.save()
+
+    @staticmethod
+    def list() -> List[Dict]:
+        summaries = []
+        for path in glob.glob(_path('profile-*.json')):
+            data = _read_json(os.path.basename(path))
+            if data:
+                data.pop('stacks', None)
+                summaries.append(data)
+        return sorted(summaries, key=lambda summary: summary['started_at'], reverse=True)
+
+    @staticmethod
+    def get(profile_id: str) -> Optional[Profile]:
+        return Profile.load(profile_id)
+
+    @staticmethod
+    def status() -> Dict:
+        window = _read_json('window.json')
+        if window and window['until'] <= time.time():
+            window = None
+        return {
+            'window': window,
+            'window_remaining_s': max(0.0, round(window['until'] - time.time(), 1)) if window else 0,
+            'profiles': len(glob.glob(_path('profile-*.json'))),
+            'heap': HeapSnapshots.status()
+        }
+
+
+class HeapSnapshots:
+    # tracemalloc snapshots dumped to PROFILER_DIR for diffing growth between two points.
+    # Heaps are per process: both snapshots of a diff must come from the same worker,
+    # which is the pid prefix of their ids.
+
+    # Named containers that grow with traffic, reported by size with each snapshot.
+    watched: Dict[str, object] = {}
+
+    @staticmethod
+    def sync():
+        switch = _read_json('heap.json')
+        if switch and not tracemalloc.is_tracing():
+            tracemalloc.start(switch['frames'])
+        elif not switch and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @staticmethod
+    def start(frames: int = TRACEMALLOC_FRAMES):
+        _write_json('heap.json', {'frames': frames})
+        HeapSnapshots.sync()
+
+    @staticmethod
+    def stop():
+        _remove('heap.json')
+        HeapSnapshots.sync()
+        for path in glob.glob(_path('heap-*')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def watch(name: str, container):
+        HeapSnapshots.watched[name] = container
+
+    @staticmethod
+    def _watched_sizes() -> Dict[str, int]:
+        return {name: len(container) for name, container in HeapSnapshots.watched.items()}
+
+    @staticmethod
+    def _load(snapshot_id: str):
+        if not snapshot_id or not _ID_PATTERN.match(snapshot_id):
+            return None
+        meta = _read_json(f"heap-{snapshot_id}.json")
+        if not meta:
+            return None
+        try:
+            return meta, tracemalloc.Snapshot.load(_path(f"heap-{snapshot_id}.snapshot"))
+        except (OSError, EOFError, ValueError) as e:
+            logger.warning(f"Cannot load heap snapshot {snapshot_id}: {str(e)}")
+            return None
+
+    @staticmethod
+    def take(limit: int = 25) -> Dict:
+        HeapSnapshots.sync()
+        if not tracemalloc.is_tracing():
+            raise RuntimeError('tracemalloc is not running; start it first')
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        snapshot_id = _next_id()
+        watched = HeapSnapshots._watched_sizes()
+        os.makedirs(PROFILER_DIR, exist_ok=True)
+        snapshot.dump(_path(f"heap-{snapshot_id}.snapshot"))
+        _write_json(f"heap-{snapshot_id}.json", {'taken_at': time.time(), 'watched': watched})
+        pid = snapshot_id.split('-')[0]
+        _prune(f"heap-{pid}-*.json", MAX_HEAP_SNAPSHOTS)
+        _prune(f"heap-{pid}-*.snapshot", MAX_HEAP_SNAPSHOTS)
+
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            'id': snapshot_id,
+            'traced_bytes': current,
+            'peak_bytes': peak,
+            'watched': watched,
+            'top': [
+                {'location': str(stat.traceback[0]), 'size': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:limit]
+            ]
+        }
+
+    @staticmethod
+    def diff(from_id: str, to_id: str, limit: int = 25) -> Optional[Dict]:
+        if from_id and to_id and from_id.split('-')[0] != to_id.split('-')[0]:
+            raise ValueError('Snapshots were taken by different workers')
+        older = HeapSnapshots._load(from_id)
+        newer = HeapSnapshots._load(to_id)
+        if not older or not newer:
+            return None
+
+        stats = newer[1].compare_to(older[1], 'traceback')
+        return {
+            'from': from_id,
+            'to': to_id,
+            'seconds': round(newer[0]['taken_at'] - older[0]['taken_at'], 1),
+            'watched': {name: {'from': older[0]['watched'].get(name), 'to': size} for name, size in newer[0]['watched'].items()},
+            'top': [
+                {
+                    'size_diff': stat.size_diff,
+                    'count_diff': stat.count_diff,
+                    'size': stat.size,
+                    'traceback': [str(frame) for frame in stat.traceback]
+                }
+                for stat in stats[:limit]
+            ]
+        }
+
+    @staticmethod
+    def status() -> Dict:
+        snapshots = sorted(glob.glob(_path('heap-*.json')), key=os.path.getmtime)
+        return {
+            'tracing': os.path.exists(_path('heap.json')),
+            'snapshots': [os.path.basename(path)[len('heap-'):-len('.json')] for path in snapshots],
+            'watched': HeapSnapshots._watched_sizes()
+        }
+
+
+def _profile_header_allowed() -> bool:
+    # Per-request profiling is admin only; loads the user only when the header is set.
+    user = get_current_user()
+    return bool(user and (user.get('is_admin') or 'admin' in user.get('roles', [])))
+
+
+def init_app(app):
+    # Profile requests sent with "X-Profile: 1" by an admin, or sampled by an active window.
+    from flask import request
+
+    @app.before_request
+    def start_profiling():
+        profile = Profiler.window_profile()
+        if profile is None and request.headers.get('X-Profile') == '1' and _profile_header_allowed():
+            sampler = Profiler.start_request(f"{request.method} {request.full_path.rstrip('?')}")
+        elif profile is not None:
+            sampler = Profiler.start_request(request.path, profile)
+        else:
+            return
+        request.environ['profiler.sampler'] = sampler
+
+    @app.after_request
+    def finish_profiling(response):
+        sampler = request.environ.pop('profiler.sampler', None)
+        if sampler is not None:
+            Profiler.finish_request(sampler)
+            response.headers['X-Profile-Id'] = sampler.profile.id
+        return response
+
+    @app.teardown_request
+    def abandon_profiling(exc=None):
+        sampler = request.environ.pop('profiler.sampler', None)
+        if sampler is not None:
+            sampler.stop()
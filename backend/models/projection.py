@@ -0,0 +1,57 @@
+from typing import Dict, List, Optional, Tuple, Union
+
+# A field maps to one SQL expression, to several helper columns that are combined
+# after the fetch (e.g. GROUP_CONCAT pairs), or to None when the model computes it
+# in Python.
+FieldExpression = Union[str, Dict[str, str], None]
+
+
+class Projection:
+    # Compiles a `fields=` request parameter into the SELECT list of a list query.
+    # Unrequested columns are never read from MySQL.
+
+    def __init__(self, columns: Dict[str, FieldExpression], summary: Tuple[str, ...],
+                 required: Tuple[str, ...] = ('id',), summary_columns: Dict[str, str] = None):
+        self.columns = columns
+        self.summary = summary
+        self.required = required
+        # Cheaper expressions used only by the default summary, e.g. truncated text.
+        self.summary_columns = summary_columns or {}
+
+    def parse(self, fields: Optional[str]) -> Tuple[List[str], bool]:
+        # Resolve a fields parameter to (field names, is_summary).
+        # Accepts None/'summary', 'all', or a comma-separated list of field names.
+        if not fields or fields == 'summary':
+            names, is_summary = list(self.summary), True
+        elif fields in ('all', '*'):
+            names, is_summary = list(self.columns), False
+        else:
+            names = [name.strip() for name in fields.split(',') if name.strip()]
+            unknown = [name for name in names if name not in self.columns]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+            is_summary = False
+
+        for name in reversed(self.required):
+            if name not in names:
+                names.insert(0, name)
+        return names, is_summary
+
+    def select(self, fields: Optional[str]) -> Tuple[str, List[str]]:
+        # Return (SELECT list SQL, field names) for a fields parameter.
+        names, is_summary = self.parse(fields)
+
+        expressions = []
+        for name in names:
+            expression = self.columns[name]
+            if is_summary and name in self.summary_columns:
+                expression = self.summary_columns[name]
+
+            if expression is None:
+                continue
+            if isinstance(expression, dict):
+                expressions.extend(f"{sql} as {alias}" for alias, sql in expression.items())
+            else:
+                expressions.append(f"{expression} as {name}")
+
+        return ",\n                    ".join(expressions), names
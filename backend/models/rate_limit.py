@@ -0,0 +1,244 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from multiprocessing.managers import BaseManager
+from typing import Callable, Tuple
+
+from database import cooperative
+from models.metrics import Counter, Gauge
+
+# Keys held by a local store; the least recently used key is dropped beyond this.
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 50000))
+# "host:port" of a shared store started with `python -m models.rate_limit serve`,
+# so every worker process sees the same counters. The launcher and asgi.py start one
+# when they run several workers and it is unset; otherwise counters stay in-process.
+RATE_LIMIT_STORE = os.getenv('RATE_LIMIT_STORE', '')
+RATE_LIMIT_AUTHKEY = os.getenv('RATE_LIMIT_AUTHKEY', 'rate-limit').encode()
+# Proxies in front of this server that append the caller to X-Forwarded-For; the
+# frontend's Next.js API routes count as one. app.py then takes the client address
+# from that header. Left at 0, request.remote_addr is usually a proxy's, shared by
+# every user, so per-IP limits are skipped.
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 0))
+
+RATE_LIMIT_REJECTIONS = Counter(
+    'rate_limit_rejections_total', 'Requests rejected by a rate limit, by limit name.', ('limit',)
+)
+RATE_LIMIT_STORE_ERRORS = Counter(
+    'rate_limit_store_errors_total', 'Shared rate limit store calls that failed and fell back to local.'
+)
+
+
+class LocalStore:
+    # Sliding window counters: each key keeps the counts of the current and previous
+    # fixed windows, and the previous one is weighted by how much of it still overlaps
+    # the sliding window. That is O(1) memory per key. Keys are kept in least recently
+    # used order, so expired keys are dropped from the front as new hits arrive and
+    # the store never holds more than max_keys.
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> [window_start, count, previous_count, window]
+        self.entries: 'OrderedDict[str, list]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _current(entry, window: float, now: float) -> Tuple[list, float]:
+        # Return the entry rolled forward to now and the estimated number of hits
+        # inside the sliding window.
+        window_start = now - now % window
+        if entry is None or entry[0] < window_start - window:
+            entry = [window_start, 0, 0, window]
+        elif entry[0] < window_start:
+            entry = [window_start, 0, entry[1], window]
+        overlap = 1 - (now - window_start) / window
+        return entry, entry[2] * overlap + entry[1]
+
+    def _evict(self, now: float):
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if len(self.entries) <= self.max_keys and entry[0] + 2 * entry[3] > now:
+                break
+            del self.entries[key]
+
+    def hit(self, key: str, limit: int, window: float, cost: int = 1) -> Tuple[bool, int, float]:
+        # Count cost hits unless that would exceed limit.
+        # Returns (allowed, remaining, retry_after seconds).
+        now = time.time()
+        with self._lock:
+            entry, used = self._current(self.entries.get(key), window, now)
+            allowed = used + cost <= limit
+            if allowed:
+                entry[1] += cost
+                used += cost
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self._evict(now)
+        retry_after = 0.0 if allowed else entry[0] + window - now
+        return allowed, max(0, int(limit - used)), retry_after
+
+    def peek(self, key: str, limit: int, window: float) -> Tuple[bool, int, float]:
+        # Like hit() with nothing counted: is there room for one more hit?
+        now = time.time()
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return True, limit, 0.0
+            entry, used = self._current(entry, window, now)
+        allowed = used + 1 <= limit
+        return allowed, max(0, int(limit - used)), 0.0 if allowed else entry[0] + window - now
+
+    def reset(self, key: str):
+        with self._lock:
+            self.entries.pop(key, None)
+
+    def size(self) -> int:
+        return len(self.entries)
+
+
+class _StoreManager(BaseManager):
+    pass
+
+
+_StoreManager.register('store')
+
+
+class SharedStore:
+    # Client for a LocalStore served by another process. Calls are serialized over one
+    # connection; if the store is unreachable the local fallback keeps limiting
+    # per process rather than letting everything through.
+
+    def __init__(self, address: str, authkey: bytes = RATE_LIMIT_AUTHKEY):
+        host, port = address.rsplit(':', 1)
+        self.address = (host, int(port))
+        self.authkey = authkey
+        self.fallback = LocalStore()
+        self._store = None
+        # Held across the call to the store, so it must be green in a patched worker.
+        self._lock = cooperative.Lock()
+
+    def _call(self, method: str, *args):
+        with self._lock:
+            try:
+                if self._store is None:
+                    manager = _StoreManager(address=self.address, authkey=self.authkey)
+                    manager.connect()
+                    self._store = manager.store()
+                return getattr(self._store, method)(*args)
+            except Exception as e:
+                self._store = None
+                RATE_LIMIT_STORE_ERRORS.inc()
+                print(f"Rate limit store unavailable, using local counters: {str(e)}")
+        return getattr(self.fallback, method)(*args)
+
+    def hit(self, key: str, limit: int, window: float, cost: int = 1) -> Tuple[bool, int, float]:
+        return self._call('hit', key, limit, window, cost)
+
+    def peek(self, key: str, limit: int, window: float) -> Tuple[bool, int, float]:
+        return self._call('peek', key, limit, window)
+
+    def reset(self, key: str):
+        return self._call('reset', key)
+
+    def size(self) -> int:
+        return self._call('size')
+
+
+def create_store():
+    return SharedStore(RATE_LIMIT_STORE) if RATE_LIMIT_STORE else LocalStore()
+
+
+store = create_store()
+RATE_LIMIT_KEYS = Gauge('rate_limit_keys', 'Keys held by the local rate limit store.')
+if isinstance(store, LocalStore):
+    RATE_LIMIT_KEYS.set_function(store.size)
+
+
+class RateLimit:
+    # A named limit of `limit` hits per `window` seconds for each key.
+
+    def __init__(self, name: str, limit: int, window: float):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self._rejections = RATE_LIMIT_REJECTIONS.labels(name)
+
+    def _key(self, key) -> str:
+        return f"{self.name}:{key}"
+
+    def hit(self, key, cost: int = 1) -> Tuple[bool, int, float]:
+        allowed, remaining, retry_after = store.hit(self._key(key), self.limit, self.window, cost)
+        if not allowed:
+            self._rejections.inc()
+        return allowed, remaining, retry_after
+
+    def peek(self, key) -> Tuple[bool, int, float]:
+        allowed, remaining, retry_after = store.peek(self._key(key), self.limit, self.window)
+        if not allowed:
+            self._rejections.inc()
+        return allowed, remaining, retry_after
+
+    def reset(self, key):
+        store.reset(self._key(key))
+
+
+def client_ip() -> str:
+    from flask import request
+    return request.remote_addr or 'unknown'
+
+
+def rate_limited(limit: RateLimit, key_func: Callable[[], str] = client_ip):
+    # Decorator counting each call against limit before the view runs; over the limit
+    # it answers 429 with Retry-After, without touching the database.
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            allowed, _, retry_after = limit.hit(key_func())
+            if not allowed:
+                return too_many_requests(retry_after)
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+def rate_limited_by_ip(limit: RateLimit):
+    # rate_limited per client IP, applied only when TRUSTED_PROXY_HOPS says the client
+    # IP can be known.
+    if not TRUSTED_PROXY_HOPS:
+        return lambda f: f
+    return rate_limited(limit, client_ip)
+
+
+def too_many_requests(retry_after: float, message: str = None, **extra):
+    from flask import jsonify
+    seconds = max(1, int(retry_after + 0.999))
+    response = jsonify(dict({
+        'success': False,
+        'message': message or f'Too many requests. Please try again in {seconds} seconds.'
+    }, **extra))
+    response.status_code = 429
+    response.headers['Retry-After'] = str(seconds)
+    return response
+
+
+def serve(address: str):
+    # Run a shared store for RATE_LIMIT_STORE in this process until interrupted.
+    host, port = address.rsplit(':', 1)
+    shared = LocalStore()
+
+    class _StoreServer(BaseManager):
+        pass
+
+    _StoreServer.register('store', callable=lambda: shared)
+    manager = _StoreServer(address=(host, int(port)), authkey=RATE_LIMIT_AUTHKEY)
+    print(f"Rate limit store listening on {host}:{port}")
+    manager.get_server().serve_forever()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == 'serve':
+        serve(sys.argv[2] if len(sys.argv) > 2 else RATE_LIMIT_STORE or '127.0.0.1:7070')
+    else:
+        print("Usage: python -m models.rate_limit serve [host:port]")
@@ -0,0 +1,211 @@
+import copy
+import json
+import logging
+import time
+from types import MappingProxyType
+from typing import Any, Dict, List, Optional
+
+from database import cooperative
+from database.connection import Database
+from models.http_cache import ResourceVersions
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checksum checks for out-of-band changes to reference tables.
+CHECK_INTERVAL = 30
+
+# Small, rarely written tables served from memory. keys are the columns that can
+# be used to look a row up besides id; json_columns are decoded once at load.
+REFERENCE_TABLES = {
+    'event_categories': {
+        'query': "SELECT * FROM event_categories ORDER BY name",
+        'keys': ('name',)
+    },
+    'forum_categories': {
+        'query': "SELECT * FROM forum_categories ORDER BY name",
+        'keys': ('name',)
+    },
+    'learning_categories': {
+        'query': """
+            SELECT id, slug, title, description, icon_name, content_type, created_at
+            FROM learning_categories
+            ORDER BY title
+        """,
+        'keys': ('slug', 'title')
+    },
+    # Shared by blog posts and challenges.
+    'categories': {
+        'query': "SELECT * FROM categories ORDER BY name",
+        'keys': ('name',)
+    },
+    'achievement_types': {
+        'query': """
+            SELECT id, name, description, criteria, exp_reward, category, icon_name
+            FROM achievement_types
+            ORDER BY category, id
+        """,
+        'keys': ('name',),
+        'json_columns': ('criteria',)
+    }
+}
+
+
+# HTTP cache stamps whose payloads are built from reference tables.
+CACHED_RESOURCES = (
+    'event_categories',
+    'forum_categories',
+    'learning_categories',
+    'blog_categories',
+    'challenge_categories'
+)
+
+
+def _thaw(row) -> Dict[str, Any]:
+    # Return a caller-owned copy of a frozen row.
+    return {key: copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+            for key, value in row.items()}
+
+
+class ReferenceTable:
+    # Immutable view of one reference table indexed by id and lookup keys.
+
+    def __init__(self, name: str, rows: List[Dict], keys=()):
+        self.name = name
+        self._rows = tuple(MappingProxyType(row) for row in rows)
+        self._by_id = MappingProxyType({row['id']: row for row in self._rows})
+
+        by_key = {}
+        for column in keys:
+            for row in self._rows:
+                if row.get(column) is not None:
+                    by_key.setdefault(str(row[column]).strip().lower(), row)
+        self._by_key = MappingProxyType(by_key)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def all(self) -> List[Dict[str, Any]]:
+        return [_thaw(row) for row in self._rows]
+
+    def get(self, row_id) -> Optional[Dict[str, Any]]:
+        try:
+            row = self._by_id.get(int(row_id))
+        except (TypeError, ValueError):
+            return None
+        return _thaw(row) if row else None
+
+    def find(self, key) -> Optional[Dict[str, Any]]:
+        # Look a row up by any configured key column, case-insensitively.
+        if key is None:
+            return None
+        row = self._by_key.get(str(key).strip().lower())
+        return _thaw(row) if row else None
+
+    def id_for(self, key) -> Optional[int]:
+        row = self._by_key.get(str(key).strip().lower()) if key is not None else None
+        return row['id'] if row else None
+
+    def label(self, row_id, column: str = 'name') -> Optional[str]:
+        row = self._by_id.get(row_id)
+        return row.get(column) if row else None
+
+
+class ReferenceData:
+    # Process-wide snapshot of all reference tables. Readers take the current
+    # snapshot reference; reloads build a new one and swap it in a single
+    # assignment, so a request never sees a half-updated registry.
+
+    _snapshot = None
+    _checksums = None
+    _checked_at = 0.0
+    _lock = cooperative.Lock()
+
+    @staticmethod
+    def _checksum(cursor) -> tuple:
+        cursor.execute("CHECKSUM TABLE " + ", ".join(REFERENCE_TABLES))
+        return tuple((row['Table'], row['Checksum']) for row in cursor.fetchall())
+
+    @staticmethod
+    def load():
+        # Read every reference table and atomically replace the snapshot.
+        db = Database()
+        conn = db.get_connection()
+        if not conn:
+            raise Exception("Database connection failed")
+        cursor = conn.cursor(dictionary=True)
+
+        try:
+            checksums = ReferenceData._checksum(cursor)
+            tables = {}
+            for name, config in REFERENCE_TABLES.items():
+                try:
+                    cursor.execute(config['query'])
+                    rows = cursor.fetchall()
+                except Exception as e:
+                    logger.error(f"Error loading reference table {name}: {str(e)}")
+                    rows = []
+
+                for row in rows:
+                    for column in config.get('json_columns', ()):
+                        if isinstance(row.get(column), str):
+                            try:
+                                row[column] = json.loads(row[column])
+                            except json.JSONDecodeError:
+                                logger.warning(f"Invalid JSON in {name}.{column} for id {row['id']}")
+
+                tables[name] = ReferenceTable(name, rows, config.get('keys', ()))
+        finally:
+            cursor.close()
+            conn.close()
+
+        previous = ReferenceData._snapshot
+        ReferenceData._snapshot = MappingProxyType(tables)
+        ReferenceData._checksums = checksums
+        ReferenceData._checked_at = time.monotonic()
+
+        if previous is not None:
+            ResourceVersions.bump(*CACHED_RESOURCES)
+        return ReferenceData._snapshot
+
+    @staticmethod
+    def reload():
+        # Call after writing to a reference table.
+        with ReferenceData._lock:
+            return ReferenceData.load()
+
+    @staticmethod
+    def check():
+        # Reload if any reference table changed since the snapshot was taken.
+        # Only one thread checks at a time; others keep using the current snapshot.
+        if not ReferenceData._lock.acquire(blocking=False):
+            return
+        try:
+            ReferenceData._checked_at = time.monotonic()
+            db = Database()
+            conn = db.get_connection()
+            if not conn:
+                return
+            cursor = conn.cursor(dictionary=True)
+            try:
+                checksums = ReferenceData._checksum(cursor)
+            finally:
+                cursor.close()
+                conn.close()
+
+            if checksums != ReferenceData._checksums:
+                ReferenceData.load()
+        except Exception as e:
+            logger.error(f"Error checking reference data: {str(e)}")
+        finally:
+            ReferenceData._lock.release()
+
+    @staticmethod
+    def table(name: str) -> ReferenceTable:
+        snapshot = ReferenceData._snapshot
+        if snapshot is None:
+            with ReferenceData._lock:
+                snapshot = ReferenceData._snapshot or ReferenceData.load()
+        elif time.monotonic() - ReferenceData._checked_at > CHECK_INTERVAL:
+            ReferenceData.check()
+            snapshot = ReferenceData._snapshot
+        return snapshot[name]
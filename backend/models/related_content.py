@@ -0,0 +1,466 @@
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Any, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+from database import cooperative
+from database.connection import Database, run_in_transaction
+from models.jobs import Jobs
+
+logger = logging.getLogger(__name__)
+
+RELATED_TOP_K = 10
+# Seconds between scheduled full rebuilds of every source.
+RELATED_REBUILD_INTERVAL = int(os.getenv('RELATED_REBUILD_INTERVAL', 6 * 60 * 60))
+BLOCK_SIZE = 512
+MAX_VOCABULARY = 20000
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'for', 'from', 'how', 'in',
+    'into', 'is', 'it', 'its', 'of', 'on', 'or', 'our', 'that', 'the', 'their', 'this',
+    'to', 'was', 'we', 'what', 'when', 'why', 'with', 'you', 'your'
+}
+
+# Each source describes where its items live and which signals feed the similarity.
+# Feature blocks are L2-normalised separately and mixed by weight, so one dense
+# signal (e.g. a shared category) cannot drown out the text and tag overlap.
+RELATED_SOURCES = {
+    'learning': {
+        'items_query': """
+            SELECT id, title, excerpt, category_id, type
+            FROM learning_materials
+            WHERE status = 'published'
+        """,
+        'facets': ['category_id', 'type'],
+        'tags_query': None,
+        'item_tags_query': None,
+        'weights': {'text': 1.0, 'tags': 0.0, 'facets': 0.6}
+    },
+    'blog': {
+        'items_query': """
+            SELECT id, title, excerpt
+            FROM blog_posts
+            WHERE status = 'published'
+        """,
+        'facets': [],
+        'tags_query': "SELECT post_id as item_id, tag_id FROM blog_post_tags",
+        'item_tags_query': "SELECT post_id as item_id, tag_id FROM blog_post_tags WHERE post_id = %s",
+        'weights': {'text': 1.0, 'tags': 1.2, 'facets': 0.0}
+    },
+    'forum': {
+        'items_query': """
+            SELECT id, title, excerpt, category_id
+            FROM forum_discussions
+            WHERE status != 'deleted'
+        """,
+        'facets': ['category_id'],
+        'tags_query': None,
+        'item_tags_query': None,
+        'weights': {'text': 1.0, 'tags': 0.0, 'facets': 0.6}
+    }
+}
+
+
+def _tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [token for token in re.findall(r"[a-z0-9]{2,}", text.lower()) if token not in STOP_WORDS]
+
+
+def _normalize_rows(matrix: sp.csr_matrix) -> sp.csr_matrix:
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sp.csr_matrix(sp.diags(1.0 / norms) @ matrix)
+
+
+def _indicator_matrix(token_lists: List[List[str]], vocabulary: Dict[str, int]) -> sp.csr_matrix:
+    # Binary item x token matrix for categorical signals (tags, facet values).
+    rows, cols = [], []
+    for row, tokens in enumerate(token_lists):
+        for token in set(tokens):
+            col = vocabulary.get(token)
+            if col is not None:
+                rows.append(row)
+                cols.append(col)
+    data = np.ones(len(rows), dtype=np.float32)
+    return sp.csr_matrix((data, (rows, cols)), shape=(len(token_lists), max(len(vocabulary), 1)))
+
+
+class _RelatedModel:
+    # Fitted feature space for one source: vocabularies, IDF weights and the item matrix.
+
+    def __init__(self, source: str, items: List[Dict[str, Any]], tags: Dict[int, List[int]]):
+        self.source = source
+        self.config = RELATED_SOURCES[source]
+
+        documents = [_tokenize(f"{item.get('title') or ''} {item.get('excerpt') or ''}") for item in items]
+        document_frequency = Counter(term for tokens in documents for term in set(tokens))
+        terms = [term for term, _ in document_frequency.most_common(MAX_VOCABULARY)]
+        self.text_vocabulary = {term: col for col, term in enumerate(terms)}
+        n_documents = max(len(items), 1)
+        self.idf = np.array(
+            [math.log((1 + n_documents) / (1 + document_frequency[term])) + 1.0 for term in terms],
+            dtype=np.float32
+        )
+
+        categorical = [self._categorical_tokens(item, tags) for item in items]
+        self.tag_vocabulary = self._vocabulary(tokens for tokens, _ in categorical)
+        self.facet_vocabulary = self._vocabulary(tokens for _, tokens in categorical)
+
+        self.ids = [item['id'] for item in items]
+        self.row_of = {item_id: row for row, item_id in enumerate(self.ids)}
+        self.matrix = self._features(documents, categorical)
+        self.fitted_at = time.monotonic()
+
+    @staticmethod
+    def _vocabulary(token_lists) -> Dict[str, int]:
+        vocabulary = {}
+        for tokens in token_lists:
+            for token in tokens:
+                vocabulary.setdefault(token, len(vocabulary))
+        return vocabulary
+
+    def _categorical_tokens(self, item: Dict[str, Any], tags: Dict[int, List[int]]) -> Tuple[List[str], List[str]]:
+        tag_tokens = [f"tag:{tag_id}" for tag_id in tags.get(item['id'], [])]
+        facet_tokens = [
+            f"{facet}:{item[facet]}" for facet in self.config['facets'] if item.get(facet) is not None
+        ]
+        return tag_tokens, facet_tokens
+
+    def _text_matrix(self, documents: List[List[str]]) -> sp.csr_matrix:
+        rows, cols, data = [], [], []
+        for row, tokens in enumerate(documents):
+            for term, count in Counter(tokens).items():
+                col = self.text_vocabulary.get(term)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+                    data.append(1.0 + math.log(count))
+        tf = sp.csr_matrix(
+            (np.array(data, dtype=np.float32), (rows, cols)),
+            shape=(len(documents), max(len(self.text_vocabulary), 1))
+        )
+        if len(self.text_vocabulary):
+            tf = sp.csr_matrix(tf @ sp.diags(self.idf))
+        return tf
+
+    def _features(self, documents: List[List[str]], categorical: List[Tuple[List[str], List[str]]]) -> sp.csr_matrix:
+        weights = self.config['weights']
+        blocks = [weights['text'] * _normalize_rows(self._text_matrix(documents))]
+        if weights['tags']:
+            blocks.append(weights['tags'] * _normalize_rows(
+                _indicator_matrix([tokens for tokens, _ in categorical], self.tag_vocabulary)
+            ))
+        if weights['facets']:
+            blocks.append(weights['facets'] * _normalize_rows(
+                _indicator_matrix([tokens for _, tokens in categorical], self.facet_vocabulary)
+            ))
+        return _normalize_rows(sp.hstack(blocks, format='csr'))
+
+    def transform(self, item: Dict[str, Any], tags: Dict[int, List[int]]) -> sp.csr_matrix:
+        # Feature row of one item in the fitted space. Terms, tags and facet values the
+        # fit never saw are ignored until the next rebuild.
+        document = _tokenize(f"{item.get('title') or ''} {item.get('excerpt') or ''}")
+        return self._features([document], [self._categorical_tokens(item, tags)])
+
+    def update(self, item_id: int, vector: Optional[sp.csr_matrix]) -> Optional[int]:
+        # Replace or append an item's row; None empties the row of a deleted item.
+        # Returns the row, or None for an item the model never had.
+        row = self.row_of.get(item_id)
+        if vector is None:
+            if row is None:
+                return None
+            vector = sp.csr_matrix((1, self.matrix.shape[1]), dtype=self.matrix.dtype)
+        if row is None:
+            row = len(self.ids)
+            self.ids.append(item_id)
+            self.row_of[item_id] = row
+            self.matrix = sp.vstack([self.matrix, vector], format='csr')
+        else:
+            self.matrix = sp.vstack([self.matrix[:row], vector, self.matrix[row + 1:]], format='csr')
+        return row
+
+    def neighbours(self, rows: List[int], top_k: int) -> Dict[int, List[Tuple[int, float]]]:
+        # Top-k cosine neighbours for the given rows, computed block by block.
+        ids = np.array(self.ids)
+        result = {}
+        for start in range(0, len(rows), BLOCK_SIZE):
+            block = np.array(rows[start:start + BLOCK_SIZE])
+            scores = (self.matrix[block] @ self.matrix.T).toarray()
+            scores[np.arange(len(block)), block] = 0.0
+
+            k = min(top_k, scores.shape[1] - 1)
+            if k <= 0:
+                for row in block:
+                    result[int(ids[row])] = []
+                continue
+
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+            order = np.argsort(-candidate_scores, axis=1)
+            candidates = np.take_along_axis(candidates, order, axis=1)
+            candidate_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+            for i, row in enumerate(block):
+                positive = candidate_scores[i] > 0
+                result[int(ids[row])] = list(zip(
+                    ids[candidates[i][positive]].tolist(),
+                    candidate_scores[i][positive].astype(float).tolist()
+                ))
+        return result
+
+
+class RelatedContent:
+    # Item-to-item similarity index backing the "related" endpoints, kept only in the
+    # related_items table so every worker reads and updates the same index. Full
+    # rebuilds run as a scheduled job (and `python -m models.related_content`); writes
+    # queue an incremental refresh. Neither ever runs inside a request.
+
+    # Fitted model per source in this process, reused by refresh_now until it is
+    # RELATED_REBUILD_INTERVAL old. Refreshes in other workers do not reach it.
+    _models: Dict[str, _RelatedModel] = {}
+    _models_lock = cooperative.Lock()
+
+    @staticmethod
+    def create_table_if_not_exists():
+        # Create the related_items table if it doesn't exist.
+        db = Database()
+        conn = db.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS related_items (
+                    item_type VARCHAR(20) NOT NULL,
+                    item_id INT NOT NULL,
+                    position TINYINT NOT NULL,
+                    related_id INT NOT NULL,
+                    score FLOAT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (item_type, item_id, position),
+                    KEY related_lookup (item_type, related_id)
+                )
+            """)
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def _load_items(cursor, source: str) -> Tuple[List[Dict[str, Any]], Dict[int, List[int]]]:
+        config = RELATED_SOURCES[source]
+        cursor.execute(config['items_query'])
+        items = cursor.fetchall()
+
+        tags = {}
+        if config['tags_query'] and items:
+            cursor.execute(config['tags_query'])
+            for row in cursor.fetchall():
+                tags.setdefault(row['item_id'], []).append(row['tag_id'])
+        return items, tags
+
+    @staticmethod
+    def _store(cursor, source: str, neighbours: Dict[int, List[Tuple[int, float]]]):
+        item_ids = list(neighbours.keys())
+        for start in range(0, len(item_ids), BLOCK_SIZE):
+            chunk = item_ids[start:start + BLOCK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f"DELETE FROM related_items WHERE item_type = %s AND item_id IN ({placeholders})",
+                [source] + chunk
+            )
+            rows = [
+                (source, item_id, position, related_id, score)
+                for item_id in chunk
+                for position, (related_id, score) in enumerate(neighbours[item_id])
+            ]
+            if rows:
+                cursor.executemany("""
+                    INSERT INTO related_items (item_type, item_id, position, related_id, score)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, rows)
+
+    @staticmethod
+    def _neighbour_lists(cursor, source: str, item_ids) -> Dict[int, List[Tuple[int, float]]]:
+        # Stored neighbour lists of item_ids, locked until the transaction ends.
+        lists = {}
+        item_ids = list(item_ids)
+        for start in range(0, len(item_ids), BLOCK_SIZE):
+            chunk = item_ids[start:start + BLOCK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"""
+                SELECT item_id, related_id, score
+                FROM related_items
+                WHERE item_type = %s AND item_id IN ({placeholders})
+                ORDER BY item_id, position
+                FOR UPDATE
+            """, [source] + chunk)
+            for row in cursor.fetchall():
+                lists.setdefault(row['item_id'], []).append((row['related_id'], row['score']))
+        return lists
+
+    @staticmethod
+    def _items(source: str) -> Tuple[List[Dict[str, Any]], Dict[int, List[int]]]:
+        db = Database()
+        conn = db.get_connection()
+        if not conn:
+            raise Exception("Database connection failed")
+        cursor = conn.cursor(dictionary=True)
+        try:
+            return RelatedContent._load_items(cursor, source)
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def _item(source: str, item_id: int) -> Tuple[Optional[Dict[str, Any]], Dict[int, List[int]]]:
+        # The current row and tags of one item; None if it was deleted or unpublished.
+        config = RELATED_SOURCES[source]
+        db = Database()
+        conn = db.get_connection()
+        if not conn:
+            raise Exception("Database connection failed")
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(f"{config['items_query']} AND id = %s", (item_id,))
+            item = cursor.fetchone()
+            tags = {}
+            if config['item_tags_query'] and item:
+                cursor.execute(config['item_tags_query'], (item_id,))
+                tags[item_id] = [row['tag_id'] for row in cursor.fetchall()]
+            return item, tags
+        finally:
+            cursor.close()
+            conn.close()
+
+    @staticmethod
+    def _fitted_model(source: str) -> _RelatedModel:
+        # Call with _models_lock held.
+        model = RelatedContent._models.get(source)
+        if model is None or time.monotonic() - model.fitted_at > RELATED_REBUILD_INTERVAL:
+            items, tags = RelatedContent._items(source)
+            model = cooperative.run_off_hub(lambda: _RelatedModel(source, items, tags))
+            RelatedContent._models[source] = model
+        return model
+
+    @staticmethod
+    def rebuild(source: str, top_k: int = RELATED_TOP_K) -> int:
+        # Rebuild the whole neighbour table for a source. Returns the number of items indexed.
+        items, tags = RelatedContent._items(source)
+
+        def compute():
+            model = _RelatedModel(source, items, tags)
+            return model, model.neighbours(list(range(len(model.ids))), top_k)
+
+        # Fitting and scoring are CPU bound; run them off the hub.
+        model, neighbours = cooperative.run_off_hub(compute)
+        with RelatedContent._models_lock:
+            RelatedContent._models[source] = model
+
+        def write(cursor):
+            cursor.execute("DELETE FROM related_items WHERE item_type = %s", (source,))
+            RelatedContent._store(cursor, source, neighbours)
+
+        try:
+            run_in_transaction(write)
+        except Exception as e:
+            logger.error(f"Error rebuilding related index for {source}: {str(e)}")
+            raise e
+        return len(items)
+
+    @staticmethod
+    def rebuild_all(top_k: int = RELATED_TOP_K) -> Dict[str, int]:
+        # Rebuild every source; run on deploy and by the scheduler.
+        RelatedContent.create_table_if_not_exists()
+        return {source: RelatedContent.rebuild(source, top_k) for source in RELATED_SOURCES}
+
+    @staticmethod
+    def refresh_now(source: str, item_id: int, top_k: int = RELATED_TOP_K):
+        # Incrementally index a created, edited or deleted item: transform its current
+        # row with the fitted vocabulary, recompute its own neighbours, then merge its
+        # new score into the stored list of every item it now enters or previously
+        # belonged to. Lists it drops out of stay one short, and new terms count for
+        # nothing, until the next rebuild refits the model.
+        item, tags = RelatedContent._item(source, item_id)
+
+        with RelatedContent._models_lock:
+            model = RelatedContent._fitted_model(source)
+
+            def score():
+                row = model.update(item_id, model.transform(item, tags) if item else None)
+                if row is None:
+                    return {}, []
+                scores = (model.matrix @ model.matrix[row].T).toarray().ravel()
+                scores[row] = 0.0
+                others = {model.ids[other]: float(scores[other]) for other in np.flatnonzero(scores > 0)}
+                return others, model.neighbours([row], top_k)[item_id]
+
+            scores, own = cooperative.run_off_hub(score)
+
+        def write(cursor):
+            cursor.execute("""
+                SELECT item_id FROM related_items
+                WHERE item_type = %s AND related_id = %s
+            """, (source, item_id))
+            candidates = {row['item_id'] for row in cursor.fetchall()} | set(scores)
+            candidates.discard(item_id)
+            current = RelatedContent._neighbour_lists(cursor, source, candidates)
+
+            changed = {item_id: own}
+            for other_id in candidates:
+                before = current.get(other_id, [])
+                merged = [(related_id, score) for related_id, score in before if related_id != item_id]
+                if other_id in scores:
+                    merged.append((item_id, scores[other_id]))
+                merged = sorted(merged, key=lambda neighbour: neighbour[1], reverse=True)[:top_k]
+                if merged != before:
+                    changed[other_id] = merged
+            RelatedContent._store(cursor, source, changed)
+
+        run_in_transaction(write)
+
+    @staticmethod
+    def refresh_item(source: str, item_id: int, top_k: int = RELATED_TOP_K) -> bool:
+        # Queue refresh_now for an item that was just written.
+        Jobs.enqueue(RelatedContent.refresh_now, source, item_id, top_k)
+        return True
+
+    @staticmethod
+    def remove_item(source: str, item_id: int) -> bool:
+        # Drop a deleted item and repair the neighbour lists that referenced it.
+        return RelatedContent.refresh_item(source, item_id)
+
+    @staticmethod
+    def get_related_ids(source: str, item_id: int, limit: int = RELATED_TOP_K) -> List[int]:
+        # Read precomputed neighbours. An item has none until its refresh job or the
+        # next rebuild has run.
+        db = Database()
+        conn = db.get_connection()
+        cursor = conn.cursor(dictionary=True)
+
+        try:
+            cursor.execute("""
+                SELECT related_id
+                FROM related_items
+                WHERE item_type = %s AND item_id = %s
+                ORDER BY position
+                LIMIT %s
+            """, (source, item_id, limit))
+            return [row['related_id'] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+            conn.close()
+
+
+Jobs.every(RELATED_REBUILD_INTERVAL, RelatedContent.rebuild_all)
+
+
+if __name__ == '__main__':
+    for source_name, count in RelatedContent.rebuild_all().items():
+        print(f"Indexed {count} {source_name} items")
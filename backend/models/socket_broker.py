@@ -0,0 +1,340 @@
+import asyncio
+import hmac
+import json
+import os
+import queue
+import secrets
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import socketio
+
+from database import cooperative
+from models import json_provider
+from socketio import PubSubManager
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+# Lightweight pub/sub broker for Socket.IO fan-out between worker processes, used when
+# SOCKETIO_MESSAGE_QUEUE is a broker:// URL. Any other URL (redis://, amqp://, ...)
+# is handed to Flask-SocketIO's own message queue support instead.
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+# Messages buffered for one slow subscriber before it is disconnected to catch up.
+SUBSCRIBER_QUEUE_SIZE = 10000
+RECONNECT_DELAY = 1.0
+
+_header = struct.Struct('!I')
+
+
+def _frame(payload: bytes) -> bytes:
+    return _header.pack(len(payload)) + payload
+
+
+def _send_frame(sock, payload: bytes):
+    sock.sendall(_frame(payload))
+
+
+def _read_exact(sock, size: int) -> bytes:
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('broker connection closed')
+        data += chunk
+    return data
+
+
+def _read_frame(sock) -> bytes:
+    (size,) = _header.unpack(_read_exact(sock, _header.size))
+    return _read_exact(sock, size)
+
+
+def _address(url: str):
+    parsed = urlparse(url)
+    return parsed.hostname or '127.0.0.1', parsed.port or 7071
+
+
+def broker_token() -> str:
+    # Shared secret of the broker and its clients. There is no default: set
+    # SOCKETIO_BROKER_TOKEN, or let the launcher generate one for the broker it starts.
+    token = os.getenv('SOCKETIO_BROKER_TOKEN', '')
+    if not token:
+        raise RuntimeError("A broker:// SOCKETIO_MESSAGE_QUEUE needs SOCKETIO_BROKER_TOKEN")
+    return token
+
+
+def _proof(token: str, nonce: bytes) -> str:
+    # Clients answer the broker's nonce with an HMAC, so the token never crosses the wire.
+    return hmac.new(token.encode(), nonce, 'sha256').hexdigest()
+
+
+def _hello(nonce: bytes, channel: str, role: str) -> bytes:
+    return json.dumps({'proof': _proof(broker_token(), nonce), 'channel': channel, 'role': role}).encode()
+
+
+def _connect(url: str, channel: str, role: str):
+    sock = socket.create_connection(_address(url), timeout=10)
+    try:
+        _send_frame(sock, _hello(_read_frame(sock), channel, role))
+    except BaseException:
+        sock.close()
+        raise
+    sock.settimeout(None)
+    return sock
+
+
+class BrokerManager(PubSubManager):
+    # python-socketio client manager backed by the broker below, in the same way as
+    # its RedisManager: every emit is published as JSON, and each worker (including
+    # the one that published) delivers it to its own connected clients.
+    name = 'broker'
+
+    def __init__(self, url: str = 'broker://127.0.0.1:7071', channel: str = 'socketio',
+                 write_only: bool = False, logger=None, json=None):
+        self.url = url
+        self._publisher = None
+        self._publish_lock = cooperative.Lock()
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+
+    def initialize(self):
+        # The listener does blocking socket reads in a background task; on an
+        # unpatched eventlet hub they would stall every green thread.
+        if not self.write_only and getattr(self.server, 'async_mode', None) == 'eventlet' \
+                and not cooperative.patcher.is_monkey_patched('socket'):
+            raise RuntimeError("The Socket.IO broker client needs a monkey-patched eventlet process "
+                               "(see database/cooperative.py patch())")
+        super().initialize()
+
+    def _publish(self, data):
+        payload = self.json.dumps(data).encode()
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = _connect(self.url, self.channel, 'publish')
+                    _send_frame(self._publisher, payload)
+                    return
+                except OSError as e:
+                    if self._publisher is not None:
+                        self._publisher.close()
+                    self._publisher = None
+                    if attempt:
+                        self._get_logger().error(f"Cannot publish to Socket.IO broker: {str(e)}")
+
+    def _listen(self):
+        while True:
+            try:
+                sock = _connect(self.url, self.channel, 'subscribe')
+                try:
+                    while True:
+                        yield _read_frame(sock)
+                finally:
+                    sock.close()
+            except (OSError, ConnectionError) as e:
+                self._get_logger().error(f"Socket.IO broker connection lost, retrying: {str(e)}")
+                time.sleep(RECONNECT_DELAY)
+
+
+class AsyncBrokerManager(AsyncPubSubManager):
+    # BrokerManager for the asyncio runtime (asgi.py), over asyncio streams. Speaks
+    # the same protocol, so ASGI and eventlet workers can share one broker.
+    name = 'broker'
+
+    def __init__(self, url: str = 'broker://127.0.0.1:7071', channel: str = 'socketio',
+                 write_only: bool = False, logger=None, json=None):
+        self.url = url
+        self._publisher = None
+        self._publish_lock = None
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+
+    async def _open(self, role: str):
+        host, port = _address(self.url)
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), 10)
+        try:
+            (size,) = _header.unpack(await asyncio.wait_for(reader.readexactly(_header.size), 10))
+            nonce = await asyncio.wait_for(reader.readexactly(size), 10)
+            writer.write(_frame(_hello(nonce, self.channel, role)))
+            await writer.drain()
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def _publish(self, data):
+        payload = _frame(self.json.dumps(data).encode())
+        if self._publish_lock is None:
+            self._publish_lock = asyncio.Lock()
+        async with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = (await self._open('publish'))[1]
+                    self._publisher.write(payload)
+                    await self._publisher.drain()
+                    return
+                except (OSError, asyncio.TimeoutError) as e:
+                    if self._publisher is not None:
+                        self._publisher.close()
+                    self._publisher = None
+                    if attempt:
+                        self._get_logger().error(f"Cannot publish to Socket.IO broker: {str(e)}")
+
+    async def _listen(self):
+        while True:
+            try:
+                reader, writer = await self._open('subscribe')
+                try:
+                    while True:
+                        (size,) = _header.unpack(await reader.readexactly(_header.size))
+                        yield await reader.readexactly(size)
+                finally:
+                    writer.close()
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                self._get_logger().error(f"Socket.IO broker connection lost, retrying: {str(e)}")
+                await asyncio.sleep(RECONNECT_DELAY)
+
+
+def generate_token():
+    # For launchers starting their own broker: a random token for it and their workers.
+    os.environ.setdefault('SOCKETIO_BROKER_TOKEN', secrets.token_hex(32))
+
+
+def client_manager(write_only: bool = False):
+    # The manager for SOCKETIO_MESSAGE_QUEUE, or None without one. Payloads are
+    # encoded like HTTP responses, so emits can carry datetimes and Decimals.
+    url = SOCKETIO_MESSAGE_QUEUE
+    if not url:
+        return None
+    if url.startswith('broker://'):
+        broker_token()
+        return BrokerManager(url, write_only=write_only, json=json_provider)
+    # The channel Flask-SocketIO used when it built these managers from message_queue.
+    if url.startswith(('redis://', 'rediss://')):
+        return socketio.RedisManager(url, channel='flask-socketio', write_only=write_only, json=json_provider)
+    if url.startswith('kafka://'):
+        return socketio.KafkaManager(url, channel='flask-socketio', write_only=write_only, json=json_provider)
+    if url.startswith('zmq'):
+        return socketio.ZmqManager(url, channel='flask-socketio', write_only=write_only, json=json_provider)
+    return socketio.KombuManager(url, channel='flask-socketio', write_only=write_only, json=json_provider)
+
+
+def async_client_manager():
+    # The AsyncServer's manager for SOCKETIO_MESSAGE_QUEUE, or None without one.
+    url = SOCKETIO_MESSAGE_QUEUE
+    if not url:
+        return None
+    if url.startswith('broker://'):
+        broker_token()
+        return AsyncBrokerManager(url, json=json_provider)
+    if url.startswith(('redis://', 'rediss://')):
+        return socketio.AsyncRedisManager(url, json=json_provider)
+    if url.startswith('amqp://'):
+        return socketio.AsyncAioPikaManager(url, json=json_provider)
+    raise ValueError(f"SOCKETIO_MESSAGE_QUEUE {url} has no asyncio client manager")
+
+
+class _Subscriber:
+    def __init__(self, sock):
+        self.sock = sock
+        self.outbox = queue.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def _write(self):
+        try:
+            while True:
+                payload = self.outbox.get()
+                if payload is None:
+                    break
+                _send_frame(self.sock, payload)
+        except OSError:
+            pass
+        finally:
+            self.sock.close()
+
+    def offer(self, payload: bytes) -> bool:
+        try:
+            self.outbox.put_nowait(payload)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        try:
+            self.outbox.put_nowait(None)
+        except queue.Full:
+            self.sock.close()
+
+
+class _BrokerHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        nonce = secrets.token_bytes(16)
+        try:
+            self.request.settimeout(10)
+            _send_frame(self.request, nonce)
+            hello = json.loads(_read_frame(self.request))
+            self.request.settimeout(None)
+        except (OSError, ConnectionError, ValueError):
+            return
+        if not isinstance(hello, dict) or not hmac.compare_digest(str(hello.get('proof', '')), _proof(server.token, nonce)):
+            return
+        channel = hello.get('channel', 'socketio')
+
+        if hello.get('role') == 'subscribe':
+            subscriber = _Subscriber(self.request)
+            with server.lock:
+                server.subscribers.setdefault(channel, set()).add(subscriber)
+            try:
+                # Only reads to notice the subscriber going away.
+                while self.request.recv(1):
+                    pass
+            except OSError:
+                pass
+            finally:
+                with server.lock:
+                    server.subscribers.get(channel, set()).discard(subscriber)
+                subscriber.close()
+            return
+
+        try:
+            while True:
+                payload = _read_frame(self.request)
+                with server.lock:
+                    subscribers = list(server.subscribers.get(channel, ()))
+                for subscriber in subscribers:
+                    if not subscriber.offer(payload):
+                        with server.lock:
+                            server.subscribers.get(channel, set()).discard(subscriber)
+                        subscriber.close()
+        except (OSError, ConnectionError):
+            pass
+
+
+class BrokerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, token: str = None):
+        self.token = token or broker_token()
+        super().__init__(address, _BrokerHandler)
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+
+def serve(url: str):
+    host, port = _address(url)
+    server = BrokerServer((host, port))
+    print(f"Socket.IO broker listening on {host}:{port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == 'serve':
+        serve(sys.argv[2] if len(sys.argv) > 2 else SOCKETIO_MESSAGE_QUEUE or 'broker://127.0.0.1:7071')
+    else:
+        print("Usage: python -m models.socket_broker serve [broker://host:port]")
@@ -1,9 +1,10 @@
 from flask import json
 from requests import request
 from models.user_stats import UserStats
+from models.login_state import LoginState
 from database.connection import Database
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from models.passwords import Passwords
+from models.exp_ledger import ExpLedger
 
 class User:
     @staticmethod
@@ -63,7 +64,7 @@ class User:
             if cursor.fetchone():
                 raise ValueError("Username already taken")
             
-            password_hash = generate_password_hash(password)
+            password_hash = Passwords.hash(password)
             
             query = """
                 INSERT INTO users (
@@ -132,10 +133,10 @@ class User:
             
             cursor.execute("SELECT password_hash FROM users WHERE id = %s", (user_id,))
             user = cursor.fetchone()
-            if not user or not check_password_hash(user['password_hash'], current_password):
+            if not user or not Passwords.verify(user['password_hash'], current_password):
                 raise ValueError("Current password is incorrect")
             
-            password_hash = generate_password_hash(new_password)
+            password_hash = Passwords.hash(new_password)
             cursor.execute(
                 "UPDATE users SET password_hash = %s WHERE id = %s",
                 (password_hash, user_id)
@@ -153,29 +154,16 @@ class User:
 
     @staticmethod
     def verify_password(user, password):
-        return check_password_hash(user['password_hash'], password)
+        return Passwords.verify(user['password_hash'], password)
 
     @staticmethod
     def add_exp(user_id, points):
         try:
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "UPDATE users SET exp = exp + %s WHERE id = %s",
-                (points, user_id)
-            )
-            
-            conn.commit()
-            return {"message": f"Added {points} experience points"}
+            awarded = ExpLedger.award(user_id, points, 'manual', capped=False)
+            return {"message": f"Added {awarded['exp_gained']} experience points"}
         except Exception as e:
-            conn.rollback()
             print(f"Error in add_exp: {str(e)}")
             raise e
-        finally:
-            cursor.close()
-            conn.close()
 
     @staticmethod
     def get_leaderboard(limit=10):
@@ -279,8 +267,8 @@ class User:
                     'email': user_data['email'],
                     'exp': user_data['exp'] or 0,
                     'level': user_data['level'] or 1,
-                    'created_at': user_data['created_at'].isoformat() if user_data['created_at'] else None,
-                    'last_login': user_data['last_login'].isoformat() if user_data['last_login'] else None,
+                    'created_at': user_data['created_at'],
+                    'last_login': user_data['last_login'],
                     'roles': roles,
                     'avatar_url': user_data['avatar_url'],
                     'bio': user_data['bio']
@@ -484,7 +472,7 @@ class User:
                     'followed_id': row['followed_id'],
                     'username': row['username'],
                     'avatar_url': row['avatar_url'],
-                    'followed_since': row['created_at'].isoformat() if row['created_at'] else None
+                    'followed_since': row['created_at']
                 })
             
             return {
@@ -509,7 +497,7 @@ class User:
         try:
             db = Database()
             conn = db.get_connection()
-            cursor = conn.cursor()
+            cursor = conn.cursor(dictionary=True)
             
             ip_address = request.remote_addr if 'request' in globals() else '127.0.0.1'
             
@@ -517,27 +505,12 @@ class User:
                 INSERT INTO user_logins (user_id, login_time, ip_address)
                 VALUES (%s, NOW(), %s)
             """, (user_id, ip_address))
+            login_state = LoginState.record(cursor, user_id)
             
             conn.commit()
             
             try:
-                from models.user_stats import UserStats
-                
-                UserStats.update_stat_and_achievements(
-                    user_id,
-                    'login_count',
-                    {
-                        'login_time': datetime.now()
-                    }
-                )
-                
-                UserStats.update_stat_and_achievements(
-                    user_id,
-                    'login_streak',
-                    {
-                        'login_time': datetime.now()
-                    }
-                )
+                UserStats.update_login_stats(user_id, login_state)
                 
                 print(f"Successfully updated login stats for user {user_id}")
             except Exception as e:
@@ -1,13 +1,7 @@
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from database.connection import Database
+from models import json_provider
 import json
-from decimal import Decimal
-
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
 
 class UserStats:
     # Model for managing user statistics in a centralized table.
@@ -97,7 +91,7 @@ class UserStats:
             conn = db.get_connection()
             cursor = conn.cursor()
             
-            stats_json = json.dumps(stats, cls=DecimalEncoder)
+            stats_json = json_provider.dumps(stats)
             
             cursor.execute("""
                 INSERT INTO user_stats (user_id, stats_data, last_updated)
@@ -237,7 +231,7 @@ class UserStats:
                     """, (user_id,)),
                     
                     'unique_event_locations': ("""
-                        SELECT COUNT(DISTINCT e.location) as count
+                        SELECT COUNT(DISTINCT COALESCE(e.location_normalized, e.location)) as count
                         FROM event_participants ep
                         JOIN events e ON ep.event_id = e.id
                         WHERE ep.user_id = %s
@@ -279,8 +273,8 @@ class UserStats:
                     
                     # Platform engagement stats
                     'login_count': ("""
-                        SELECT COUNT(*) as count
-                        FROM user_logins WHERE user_id = %s
+                        SELECT login_count as count
+                        FROM user_login_state WHERE user_id = %s
                     """, (user_id,)),
                     
                     'account_age': ("""
@@ -289,24 +283,8 @@ class UserStats:
                     """, (user_id,)),
                     
                     'login_streak': ("""
-                        SELECT MAX(streak) as count FROM (
-                            SELECT 
-                                COUNT(*) as streak
-                            FROM (
-                                SELECT 
-                                    login_date,
-                                    @row_num := @row_num + 1 as row_num,
-                                    DATE_SUB(login_date, INTERVAL @row_num DAY) as grp
-                                FROM (
-                                    SELECT DISTINCT DATE(login_time) as login_date
-                                    FROM user_logins
-                                    WHERE user_id = %s
-                                    ORDER BY login_date
-                                ) as dates
-                                JOIN (SELECT @row_num := 0) as r
-                            ) as t
-                            GROUP BY grp
-                        ) as streaks
+                        SELECT best_streak as count
+                        FROM user_login_state WHERE user_id = %s
                     """, (user_id,)),
                     'followers_count': ("""
                         SELECT COUNT(*) as count
@@ -405,6 +383,40 @@ class UserStats:
             cursor.close()
             conn.close()
 
+    @staticmethod
+    def update_login_stats(user_id: int, login_state: Dict) -> List[Dict]:
+        # Write login_count and login_streak from a login state in one statement and
+        # award only the login achievements, instead of refreshing every stat.
+        values = {
+            'login_count': login_state['login_count'],
+            'login_streak': login_state['best_streak']
+        }
+        db = Database()
+        try:
+            conn = db.get_connection()
+            cursor = conn.cursor()
+            
+            stats = UserStats.create_default_stats()
+            stats.update(values)
+            cursor.execute("""
+                INSERT INTO user_stats (user_id, stats_data, last_updated)
+                VALUES (%s, %s, NOW())
+                ON DUPLICATE KEY UPDATE
+                    stats_data = JSON_SET(stats_data, '$.login_count', %s, '$.login_streak', %s),
+                    last_updated = NOW()
+            """, (user_id, json_provider.dumps(stats), values['login_count'], values['login_streak']))
+            
+            conn.commit()
+        except Exception as e:
+            print(f"Error updating login stats: {e}")
+            return []
+        finally:
+            cursor.close()
+            conn.close()
+        
+        from models.achievement import achievements
+        return achievements.check_stat_achievements(user_id, values)
+
     @staticmethod
     def update_stat_and_achievements(user_id: int, stat_name: str, activity_data: Dict) -> bool:
         # Compact function to update a stat, check achievements, and add activity in one call.
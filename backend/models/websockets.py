@@ -1,10 +1,13 @@
 import os
 from flask import request
-from flask_socketio import SocketIO, join_room, leave_room, emit
+from flask_socketio import SocketIO, join_room, leave_room, emit, rooms
 import eventlet
-from models.chat import Chat, ChatMessage
+from models.chat import Chat
 from models.auth import verify_token
-from database.connection import Database
+from database.instrumentation import instrument_event
+from models import metrics
+from models import socket_broker
+from models import json_provider
 import jwt
 import logging
 from datetime import datetime
@@ -13,38 +16,68 @@ logger = logging.getLogger(__name__)
 
 socketio_instance = None
 
+# Emitter used by processes that run no Socket.IO server, such as background jobs.
+external_emitter = None
+
+# Set by the ASGI runtime (models/async_websockets.py): emit(event, data, room) from
+# any thread through its AsyncServer.
+async_emitter = None
+
 async_mode = 'eventlet'
+# Per-packet Socket.IO/Engine.IO logging; the launcher turns it off by default.
+SOCKETIO_LOGGER = os.getenv('SOCKETIO_LOGGER', '1').lower() in ('1', 'true', 't')
+
+def user_room(user_id):
+    # Every connection joins its user's room, so any worker can reach all of a user's sockets.
+    return f"user_{user_id}"
+
+def chat_room_ids():
+    # Chat rooms the current connection has joined, from the server's room membership.
+    return [int(room[5:]) for room in rooms() if room.startswith('room_') and room[5:].isdigit()]
+
+def socket_user():
+    # The user stored on the current connection's session, or None before connect.
+    return socketio_instance.server.get_session(request.sid).get('user')
+
+def authenticate_socket(token):
+    # Authenticate user from token; shared with the ASGI runtime's handlers.
+    try:
+        if token.startswith('Bearer '):
+            token = token[7:]
+        
+        decoded = verify_token(token)
+        if not decoded:
+            return None
+        
+        if 'user_id' in decoded and 'id' not in decoded:
+            decoded['id'] = decoded['user_id']
+        
+        return decoded
+    except Exception as e:
+        logger.error(f"Error in socket authentication: {str(e)}")
+        return None
 
 def create_socketio(app):
-    # Create and configure Socket.IO for the application.
+    # Create and configure Socket.IO for the application. With SOCKETIO_MESSAGE_QUEUE
+    # set, emits fan out through a message queue to every worker process. Packets are
+    # encoded by the app's JSON provider, so events carry rows the same way as responses.
     global socketio_instance
+    options = {}
+    manager = socket_broker.client_manager()
+    if manager is not None:
+        options['client_manager'] = manager
     socketio = SocketIO(app, 
                        cors_allowed_origins="*",
                        async_mode=async_mode,  
-                       logger=True,
-                       engineio_logger=True)
-    socketio.user_data = {}  # Store user data (user_id -> {username, rooms})
+                       logger=SOCKETIO_LOGGER,
+                       engineio_logger=SOCKETIO_LOGGER,
+                       json=json_provider,
+                       **options)
     socketio_instance = socketio
-
-    def authenticate_socket(token):
-        # Authenticate user from token.
-        try:
-            if token.startswith('Bearer '):
-                token = token[7:]
-            
-            decoded = verify_token(token)
-            if not decoded:
-                return None
-            
-            if 'user_id' in decoded and 'id' not in decoded:
-                decoded['id'] = decoded['user_id']
-            
-            return decoded
-        except Exception as e:
-            logger.error(f"Error in socket authentication: {str(e)}")
-            return None
+    metrics.init_socketio(socketio)
 
     @socketio.on('connect')
+    @instrument_event('connect')
     def handle_connect():
         # Handle client connection.
         try:
@@ -58,11 +91,11 @@ def create_socketio(app):
                 logger.error("Invalid token for socket connection")
                 return False
             
-            socketio.user_data[request.sid] = {
+            socketio.server.save_session(request.sid, {'user': {
                 'user_id': user['id'],
-                'username': user.get('username', 'Unknown'),
-                'rooms': set()  
-            }
+                'username': user.get('username', 'Unknown')
+            }})
+            join_room(user_room(user['id']))
             
             return True
         except Exception as e:
@@ -70,23 +103,23 @@ def create_socketio(app):
             return False
 
     @socketio.on('disconnect')
+    @instrument_event('disconnect')
     def handle_disconnect():
         # Handle client disconnection.
         try:
-            if request.sid in socketio.user_data:
-                user = socketio.user_data[request.sid]
-                for room_id in list(user['rooms']):  
+            user = socket_user()
+            if user:
+                for room_id in chat_room_ids():  
                     leave_room(f"room_{room_id}")
                     emit('user_left', {
                         'username': user['username'],
                         'room_id': room_id
                     }, room=f"room_{room_id}")
-                
-                del socketio.user_data[request.sid]
         except Exception as e:
             logger.error(f"Disconnection error: {str(e)}")
 
     @socketio.on('join_chat')
+    @instrument_event('join_chat')
     def handle_join_chat(data):
         # Handle user joining a chat room.
         try:
@@ -110,66 +143,13 @@ def create_socketio(app):
                 emit('error', {'message': 'Invalid user data'})
                 return
             
-            db = Database()
-            conn = db.get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            cursor.execute("""
-                SELECT r.*, 
-                       CASE WHEN p.user_id IS NOT NULL THEN 1 ELSE 0 END as is_member
-                FROM chat_rooms r
-                LEFT JOIN chat_room_participants p 
-                    ON r.id = p.room_id AND p.user_id = %s
-                WHERE r.id = %s AND (r.type = 'public' OR p.user_id IS NOT NULL)
-            """, (user_id, room_id))
-            
-            room = cursor.fetchone()
-            if not room:
+            joined = Chat.join_chat(room_id, user_id)
+            if not joined:
                 logger.error(f"Room {room_id} not found or access denied for user {user_id}")
                 emit('error', {'message': 'Room not found or access denied'})
-                cursor.close()
-                conn.close()
                 return
             
-            formatted_room = {
-                'id': room['id'],
-                'name': room['name'],
-                'description': room['description'],
-                'type': room['type'],
-                'created_at': room['created_at'].isoformat() if room['created_at'] else None,
-                'is_member': room['is_member']
-            }
-            
             join_room(f"room_{room_id}")
-            if request.sid in socketio.user_data:
-                socketio.user_data[request.sid]['rooms'].add(room_id)
-            
-            cursor.execute("""
-                SELECT u.id, u.username, p.role, p.joined_at
-                FROM chat_room_participants p
-                JOIN users u ON p.user_id = u.id
-                WHERE p.room_id = %s
-            """, (room_id,))
-            
-            participants = cursor.fetchall()
-            
-            formatted_participants = [{
-                'id': p['id'],
-                'username': p['username'],
-                'role': p['role'],
-                'joined_at': p['joined_at'].isoformat() if p['joined_at'] else None
-            } for p in participants]
-            
-            if not room['is_member']:
-                cursor.execute("""
-                    INSERT IGNORE INTO chat_room_participants 
-                    (room_id, user_id, role, last_read_at)
-                    VALUES (%s, %s, 'member', CURRENT_TIMESTAMP)
-                """, (room_id, user_id))
-                conn.commit()
-            
-            cursor.close()
-            conn.close()
             
             emit('user_joined', {
                 'username': user.get('username'),
@@ -178,8 +158,8 @@ def create_socketio(app):
             
             emit('joined_chat', {
                 'success': True,
-                'room': formatted_room,
-                'participants': formatted_participants
+                'room': joined['room'],
+                'participants': joined['participants']
             })
             
         except Exception as e:
@@ -187,17 +167,17 @@ def create_socketio(app):
             emit('error', {'message': str(e)})
 
     @socketio.on('leave_chat')
+    @instrument_event('leave_chat')
     def handle_leave_chat(data):
         # Handle user leaving a chat room.
         try:
             room_id = data.get('room_id')
-            if not room_id or request.sid not in socketio.user_data:
+            user = socket_user()
+            if not room_id or not user:
                 return
             
-            user = socketio.user_data[request.sid]
-            if room_id in user['rooms']:
+            if f"room_{room_id}" in rooms():
                 leave_room(f"room_{room_id}")
-                user['rooms'].remove(room_id)
                 
                 emit('user_left', {
                     'username': user['username'],
@@ -210,10 +190,12 @@ def create_socketio(app):
             emit('error', {'message': str(e)})
 
     @socketio.on('send_message')
+    @instrument_event('send_message')
     def handle_send_message(data):
         # Handle sending a chat message.
         try:
-            if request.sid not in socketio.user_data:
+            user = socket_user()
+            if not user:
                 emit('error', {'message': 'Not authenticated'})
                 return
             
@@ -224,29 +206,16 @@ def create_socketio(app):
                 emit('error', {'message': 'Missing room_id or content'})
                 return
             
-            user = socketio.user_data[request.sid]
-            
-            if room_id not in user['rooms']:
+            if f"room_{room_id}" not in rooms():
                 emit('error', {'message': 'Not a member of this room'})
                 return
             
-            if not Chat.is_participant(room_id, user['user_id']):
-                room = Chat.get_room_by_id(room_id)
-                if not room or room['type'] != 'public':
-                    emit('error', {'message': 'Cannot send messages to this room'})
-                    return
-                
-                success = Chat.join_room(room_id, user['user_id'])
-                if not success:
-                    emit('error', {'message': 'Failed to join room'})
-                    return
-            
-            message = ChatMessage.create(
-                room_id=room_id,
-                sender_id=user['user_id'],
-                content=content
-            )
+            result = Chat.send_message(room_id, user['user_id'], content)
+            if result is None:
+                emit('error', {'message': 'Cannot send messages to this room'})
+                return
             
+            message = result['message']
             if not message:
                 emit('error', {'message': 'Failed to create message'})
                 return
@@ -263,37 +232,38 @@ def create_socketio(app):
 
     return socketio
 
-def send_achievement_notification(user_id, achievement_data):
-    # Send a real-time notification to a user when they earn an achievement.
-
-    global socketio_instance
-    if not socketio_instance:
+def emit_event(event, data, room=None):
+    # Emit from any process: through this worker's server, or through the message
+    # queue when no server runs here (e.g. a background job).
+    global external_emitter
+    if async_emitter is not None:
+        async_emitter(event, data, room)
+        return True
+    if socketio_instance:
+        socketio_instance.emit(event, data, room=room)
+        return True
+    
+    if external_emitter is None:
+        external_emitter = socket_broker.client_manager(write_only=True)
+    if external_emitter is None:
         logger.error("SocketIO instance not initialized")
         return False
     
+    external_emitter.emit(event, data, namespace='/', room=room)
+    return True
+
+def send_achievement_notification(user_id, achievement_data):
+    # Send a real-time notification to a user when they earn an achievement.
     try:
-        user_sids = [
-            sid for sid, data in socketio_instance.user_data.items() 
-            if data.get('user_id') == user_id
-        ]
-        
-        if not user_sids:
-            logger.info(f"User {user_id} not connected, can't send achievement notification")
-            return False
-        
         notification_data = {
             'type': 'achievement_earned',
             'title': 'Achievement Unlocked!',
             'message': f"You've earned the '{achievement_data['name']}' achievement and {achievement_data['exp_reward']} XP!",
             'achievement': achievement_data,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now()
         }
         
-        for sid in user_sids:
-            socketio_instance.emit('new_notification', notification_data, room=sid)
-        
-        return True
+        return emit_event('new_notification', notification_data, room=user_room(user_id))
     except Exception as e:
         logger.error(f"Error sending achievement notification: {str(e)}")
         return False
-
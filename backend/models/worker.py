@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Optional
+
+# Where the launcher's master process publishes the status of all workers.
+WORKER_STATUS_FILE = os.getenv(
+    'WORKER_STATUS_FILE',
+    os.path.join(tempfile.gettempdir(), f"green-buddy-workers-{os.getenv('FLASK_PORT', 5000)}.json")
+)
+
+
+class Worker:
+    # State of this server process. The launcher fills it in after forking; a plain
+    # `python app.py` process is worker 0 of 1 with no master.
+
+    index = 0
+    count = 1
+    pid = os.getpid()
+    started_at = time.time()
+    draining = False
+    pool = None
+    socketio = None
+
+    @staticmethod
+    def forked(index: int, count: int, pool=None, socketio=None):
+        Worker.index = index
+        Worker.count = count
+        Worker.pid = os.getpid()
+        Worker.started_at = time.time()
+        Worker.draining = False
+        Worker.pool = pool
+        Worker.socketio = socketio
+
+    @staticmethod
+    def connections() -> int:
+        # Open HTTP and websocket connections on this worker.
+        pool = Worker.pool
+        return pool.running() if pool is not None else 0
+
+    @staticmethod
+    def sockets() -> int:
+        socketio = Worker.socketio
+        if socketio is None or socketio.server is None:
+            return 0
+        return len(getattr(socketio.server.eio, 'sockets', ()))
+
+    @staticmethod
+    def status() -> Dict:
+        return {
+            'index': Worker.index,
+            'pid': Worker.pid,
+            'uptime_s': round(time.time() - Worker.started_at, 1),
+            'draining': Worker.draining,
+            'connections': Worker.connections(),
+            'websockets': Worker.sockets(),
+            'rss_bytes': _rss_bytes()
+        }
+
+    @staticmethod
+    def cluster_status() -> Optional[Dict]:
+        # The master's last published status of every worker, if there is a master.
+        try:
+            with open(WORKER_STATUS_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open(f"/proc/{os.getpid()}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
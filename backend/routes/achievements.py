@@ -4,6 +4,7 @@ from routes.auth import token_required
 from models.user import User
 from database.connection import Database
 from models.user_stats import UserStats
+from models.http_cache import conditional
 
 achievements_routes = Blueprint('achievements', __name__)
 
@@ -30,6 +31,7 @@ def get_user_achievements(current_user, user_id):
         }), 500
 
 @achievements_routes.route('/', methods=['GET'])
+@conditional('achievement_types', 'user_achievements:{user_id}', per_user=True)
 @token_required
 def get_achievements(current_user):
     # Get all achievements and user's progress.
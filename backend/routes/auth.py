@@ -2,42 +2,36 @@ from flask import Blueprint, request, jsonify, make_response
 from models.user import User
 import re
 from email_validator import validate_email, EmailNotValidError
-from datetime import datetime, timedelta
-from functools import wraps
 from dotenv import load_dotenv
-from database.connection import Database
-from werkzeug.security import check_password_hash, generate_password_hash
+from models.passwords import Passwords
 from models.auth import generate_token, token_required, get_current_user, Auth
+from models.profiler import HeapSnapshots
+from models.jobs import Jobs
+from models.rate_limit import (
+    LocalStore, RateLimit, rate_limited, rate_limited_by_ip, too_many_requests, store as rate_limit_store
+)
 
 load_dotenv()
 
 auth_routes = Blueprint('auth_routes', __name__)
 
-login_attempts = {}
 MAX_ATTEMPTS = 5
 LOCKOUT_TIME = 15 * 60 
 
-def is_rate_limited(email):
-    # Check if the email is rate limited due to too many failed attempts.
-    if email in login_attempts:
-        attempts, timestamp = login_attempts[email]
-        if attempts >= MAX_ATTEMPTS:
-            if datetime.now().timestamp() - timestamp < LOCKOUT_TIME:
-                return True
-            login_attempts[email] = (0, datetime.now().timestamp())
-    return False
+# Failed logins per email, and all attempts per client IP and per route. Counted before
+# any database or password hash work. The per-IP limits only apply with
+# TRUSTED_PROXY_HOPS set, since login and register arrive through the Next.js server.
+LOGIN_EMAIL_FAILURES = RateLimit('login_email', MAX_ATTEMPTS, LOCKOUT_TIME)
+LOGIN_IP_LIMIT = RateLimit('login_ip', 20, 60)
+LOGIN_ROUTE_LIMIT = RateLimit('login', 300, 60)
+REGISTER_IP_LIMIT = RateLimit('register_ip', 10, 60 * 60)
+REGISTER_ROUTE_LIMIT = RateLimit('register', 100, 60)
 
-def record_login_attempt(email, success):
-    # Record a login attempt for rate limiting purposes.
-    current_time = datetime.now().timestamp()
-    if email in login_attempts:
-        attempts, _ = login_attempts[email]
-        if success:
-            login_attempts[email] = (0, current_time)
-        else:
-            login_attempts[email] = (attempts + 1, current_time)
-    else:
-        login_attempts[email] = (1 if not success else 0, current_time)
+if isinstance(rate_limit_store, LocalStore):
+    HeapSnapshots.watch('rate_limit_store', rate_limit_store.entries)
+
+def route_key():
+    return request.endpoint or 'unmatched'
 
 def validate_password(password):
     # Validate password strength
@@ -64,6 +58,8 @@ def validate_password(password):
     return True, ""
 
 @auth_routes.route('/login', methods=['POST'])
+@rate_limited(LOGIN_ROUTE_LIMIT, route_key)
+@rate_limited_by_ip(LOGIN_IP_LIMIT)
 def login():
     data = request.get_json()
     
@@ -74,6 +70,15 @@ def login():
             'field': 'email' if 'email' not in data else 'password'
         }), 400
 
+    email_key = str(data['email']).strip().lower()
+    allowed, _, retry_after = LOGIN_EMAIL_FAILURES.peek(email_key)
+    if not allowed:
+        return too_many_requests(
+            retry_after,
+            f'Too many failed attempts. Please try again in {max(1, int(retry_after / 60))} minutes.',
+            field='email'
+        )
+
     try:
         validate_email(data['email'])
     except EmailNotValidError as e:
@@ -83,21 +88,11 @@ def login():
             'field': 'email'
         }), 400
 
-    if is_rate_limited(data['email']):
-        remaining_time = LOCKOUT_TIME - (datetime.now().timestamp() - login_attempts[data['email']][1])
-        return jsonify({
-            'success': False,
-            'message': f'Too many failed attempts. Please try again in {int(remaining_time / 60)} minutes.',
-            'field': 'email'
-        }), 429
-
     try:
         user = Auth.login_user(data['email'])
 
-        if not user or not check_password_hash(user['password_hash'], data['password']):
-            record_login_attempt(data['email'], False)
-            attempts = login_attempts[data['email']][0]
-            remaining_attempts = MAX_ATTEMPTS - attempts
+        if not user or not Passwords.verify(user['password_hash'], data['password']):
+            _, remaining_attempts, _ = LOGIN_EMAIL_FAILURES.hit(email_key)
             
             message = 'Invalid email or password'
             if remaining_attempts > 0:
@@ -110,30 +105,23 @@ def login():
                 'remaining_attempts': remaining_attempts
             }), 401
 
-        record_login_attempt(data['email'], True)
+        LOGIN_EMAIL_FAILURES.reset(email_key)
+
+        if Passwords.needs_rehash(user['password_hash']):
+            try:
+                Auth.update_password_hash(user['id'], Passwords.hash(data['password']))
+            except Exception as e:
+                print(f"Error upgrading password hash: {str(e)}")
 
         Auth.update_last_login(user['id'])
         
         try:
-            Auth.record_login_in_db(user['id'], request.remote_addr)
+            login_state = Auth.record_login_in_db(user['id'], request.remote_addr)
             
-            from models.user_stats import UserStats
-            
-            UserStats.update_stat_and_achievements(
-                user['id'],
-                'login_count',
-                {
-                    'login_time': datetime.now()
-                }
-            )
-
-            UserStats.update_stat_and_achievements(
-                user['id'],
-                'login_streak',
-                {
-                    'login_time': datetime.now()
-                }
-            )
+            if login_state:
+                from models.user_stats import UserStats
+                
+                Jobs.enqueue(UserStats.update_login_stats, user['id'], login_state)
             
         except Exception as e:
             print(f"Error recording login stats: {str(e)}")
@@ -150,8 +138,8 @@ def login():
                 'username': user['username'],
                 'email': user['email'],
                 'roles': roles,
-                'created_at': user['created_at'].isoformat() if user['created_at'] else None,
-                'last_login': user['last_login'].isoformat() if user['last_login'] else None,
+                'created_at': user['created_at'],
+                'last_login': user['last_login'],
                 'avatar_url': user['avatar_url'],
                 'bio': user['bio']
             }
@@ -164,6 +152,8 @@ def login():
         }), 500
 
 @auth_routes.route('/register', methods=['POST'])
+@rate_limited(REGISTER_ROUTE_LIMIT, route_key)
+@rate_limited_by_ip(REGISTER_IP_LIMIT)
 def register():
     data = request.get_json()
     
@@ -216,7 +206,7 @@ def register():
                 'field': 'username'
             }), 400
             
-        password_hash = generate_password_hash(data['password'])
+        password_hash = Passwords.hash(data['password'])
         
         user_id = Auth.register_user(data['username'], normalized_email, password_hash)
         
@@ -234,7 +224,7 @@ def register():
                 'username': user['username'],
                 'email': user['email'],
                 'roles': roles,
-                'created_at': user['created_at'].isoformat() if user['created_at'] else None,
+                'created_at': user['created_at'],
                 'last_login': None
             }
         }), 201
@@ -0,0 +1,125 @@
+from flask import Blueprint, request, jsonify, current_app
+from models.auth import get_current_user, batch_user
+from database.connection import connection_scope
+import logging
+
+try:
+    import eventlet
+except ImportError:
+    eventlet = None
+
+batch_routes = Blueprint('batch', __name__)
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_REQUESTS = 20
+# Green threads per batch; each one holds its own database connection.
+MAX_PARALLEL = 4
+
+# Request headers a sub-request may set; everything else comes from the batch request.
+FORWARDED_ITEM_HEADERS = ('If-None-Match', 'If-Modified-Since')
+# Response headers copied into each result.
+RESULT_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control', 'X-Next-Cursor')
+
+
+def _parse_items(data):
+    # Validate the request body into [(id, path, headers)], raising ValueError.
+    if not isinstance(data, dict) or not isinstance(data.get('requests'), list):
+        raise ValueError('Body must be {"requests": [...]}')
+
+    entries = data['requests']
+    if not entries:
+        raise ValueError('requests must not be empty')
+    if len(entries) > MAX_BATCH_REQUESTS:
+        raise ValueError(f'At most {MAX_BATCH_REQUESTS} requests per batch')
+
+    items = []
+    for index, entry in enumerate(entries):
+        if isinstance(entry, str):
+            entry = {'path': entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get('path'), str):
+            raise ValueError(f'requests[{index}] must be a path or an object with a path')
+
+        path = entry['path']
+        if not path.startswith('/') or path.startswith('//') or path.startswith('/batch'):
+            raise ValueError(f'requests[{index}] has an invalid path')
+        if entry.get('method', 'GET').upper() != 'GET':
+            raise ValueError(f'requests[{index}]: only GET sub-requests are supported')
+
+        item_headers = entry.get('headers') or {}
+        headers = {name: str(item_headers[name]) for name in FORWARDED_ITEM_HEADERS if name in item_headers}
+        items.append((entry.get('id', index), path, headers))
+    return items
+
+
+def _dispatch(app, path, headers, environ_base):
+    # Run one GET sub-request through the full request pipeline.
+    with app.test_request_context(path, method='GET', headers=headers, environ_base=environ_base):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            logger.error(f"Batch sub-request {path} failed: {str(e)}", exc_info=True)
+            return 500, {'success': False, 'message': 'An unexpected error occurred'}, {}
+
+        if response.is_json:
+            body = response.get_json(silent=True)
+        elif response.status_code == 304:
+            body = None
+        else:
+            body = response.get_data(as_text=True)
+        result_headers = {name: response.headers[name] for name in RESULT_HEADERS if name in response.headers}
+        return response.status_code, body, result_headers
+
+
+def _run(app, items, results, user, shared_headers, environ_base):
+    # Run a share of the batch on one connection. Sets the authenticated user in
+    # this context, which is fresh when running on a green thread.
+    token = batch_user.set(user)
+    try:
+        with connection_scope():
+            for index, (item_id, path, item_headers) in items:
+                status, body, headers = _dispatch(app, path, {**shared_headers, **item_headers}, environ_base)
+                results[index] = {'id': item_id, 'status': status, 'headers': headers, 'body': body}
+    finally:
+        batch_user.reset(token)
+
+
+@batch_routes.route('/', methods=['POST'])
+def run_batch():
+    # Run several GET requests in one round trip.
+    # Body: {"requests": ["/users/stats", {"id": "tags", "path": "/blog/tags",
+    #        "headers": {"If-None-Match": "..."}}], "parallel": false}
+    # The caller is authenticated once and the sub-requests share its identity and a
+    # database connection; with parallel they are spread over a few green threads.
+    # Responses come back in request order, each with its own status.
+    data = request.get_json(silent=True)
+    try:
+        items = _parse_items(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    auth_header = request.headers.get('Authorization')
+    user = get_current_user() if auth_header else None
+    if auth_header and not user:
+        return jsonify({'success': False, 'message': 'Authentication required'}), 401
+
+    shared_headers = {'Authorization': auth_header} if auth_header else {}
+    accept_language = request.headers.get('Accept-Language')
+    if accept_language:
+        shared_headers['Accept-Language'] = accept_language
+    environ_base = {'REMOTE_ADDR': request.remote_addr}
+
+    app = current_app._get_current_object()
+    results = [None] * len(items)
+    indexed = list(enumerate(items))
+
+    workers = min(MAX_PARALLEL, len(items)) if data.get('parallel') else 1
+    if workers > 1 and eventlet is not None:
+        pool = eventlet.GreenPool(workers)
+        for worker in range(workers):
+            pool.spawn(_run, app, indexed[worker::workers], results, user, shared_headers, environ_base)
+        pool.waitall()
+    else:
+        _run(app, indexed, results, user, shared_headers, environ_base)
+
+    return jsonify({'success': True, 'responses': results}), 200
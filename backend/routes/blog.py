@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
-from models.blog import BlogPost
+from models.blog import BlogPost, BLOG_POST_LIST_FIELDS
 from models.auth import token_required, get_current_user, verify_token
+from models.http_cache import conditional
 
 blog_routes = Blueprint('blog', __name__)
 
@@ -13,6 +14,13 @@ def get_posts():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         tag = request.args.get('tag')  
+        fields = request.args.get('fields')
+        cursor = request.args.get('cursor')
+        
+        try:
+            BLOG_POST_LIST_FIELDS.parse(fields)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e), 'posts': []}), 400
         
         current_user_id = None
         auth_header = request.headers.get('Authorization')
@@ -30,7 +38,9 @@ def get_posts():
             tag=tag,
             page=page,
             per_page=per_page,
-            current_user_id=current_user_id
+            current_user_id=current_user_id,
+            fields=fields,
+            cursor=cursor
         )
         
         
@@ -42,10 +52,14 @@ def get_posts():
             'posts': result['posts'],
             'total': result['total'],
             'total_pages': result['total_pages'],
-            'current_page': page
+            'current_page': page,
+            'next_cursor': result['next_cursor']
         }
-                
-        return jsonify(response), 200
+        
+        response = jsonify(response)
+        if result['next_cursor']:
+            response.headers['X-Next-Cursor'] = result['next_cursor']
+        return response, 200
     except Exception as e:
         print(f"Error fetching posts: {str(e)}", exc_info=True)
         print(f"Error type: {type(e)}")
@@ -211,8 +225,27 @@ def get_related_posts(post_id):
 @blog_routes.route('/<int:post_id>/comments', methods=['GET'])
 def get_post_comments(post_id):
     try:
-        comments = BlogPost.get_comments(post_id)
-        return jsonify(comments), 200
+        # ?threaded=1 returns a page of root comments with nested replies and an
+        # X-Next-Cursor header; without it, every comment flat, linked by parent_id.
+        threaded = request.args.get('threaded', '').lower() in ('1', 'true')
+        limit = request.args.get('limit', 20, type=int)
+        cursor = request.args.get('cursor')
+        
+        current_user_id = None
+        auth_header = request.headers.get('Authorization')
+        if auth_header and auth_header.startswith('Bearer '):
+            token = auth_header.split(' ')[1]
+            payload = verify_token(token)
+            if payload and 'user_id' in payload:
+                current_user_id = payload['user_id']
+        
+        result = BlogPost.get_comments(post_id, limit=limit, cursor=cursor, current_user_id=current_user_id,
+                                       threaded=threaded)
+        
+        response = jsonify(result['items'])
+        if result['next_cursor']:
+            response.headers['X-Next-Cursor'] = result['next_cursor']
+        return response, 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -236,6 +269,7 @@ def add_comment(current_user, post_id):
         return jsonify({'error': str(e)}), 500
 
 @blog_routes.route('/categories', methods=['GET'])
+@conditional('blog_categories')
 def get_categories():
     try:
         categories = BlogPost.get_categories()
@@ -271,6 +305,7 @@ def increment_post_view(post_id):
         return jsonify({'error': str(e)}), 500
 
 @blog_routes.route('/tags', methods=['GET'])
+@conditional('blog_tags')
 def get_tags():
     try:
         tags = BlogPost.get_tags()
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from models.challenge import Challenge, ChallengeCategory, ChallengeDifficulty
 from models.auth import token_required, get_current_user
+from models.http_cache import conditional
 from database.connection import Database
 import json
 
@@ -103,6 +104,7 @@ def submit_challenge(current_user, challenge_id):
         return jsonify({'error': str(e)}), 500
 
 @challenges_routes.route('/categories', methods=['GET'])
+@conditional('challenge_categories')
 def get_categories():
     try:
         categories = Challenge.get_categories()
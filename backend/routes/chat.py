@@ -125,15 +125,6 @@ def get_all_unread_counts(current_user):
 def send_message(current_user, room_id):
     """Send a message to a chat room."""
     try:
-        if not Chat.is_participant(room_id, current_user['id']):
-            room = Chat.get_room_by_id(room_id)
-            if not room or room['type'] != 'public':
-                return jsonify({'error': 'Not a participant of this room'}), 403
-            
-            success = Chat.join_room(room_id, current_user['id'])
-            if not success:
-                return jsonify({'error': 'Failed to join room'}), 500
-        
         data = request.get_json()
         if not data or 'content' not in data:
             return jsonify({'error': 'Message content is required'}), 400
@@ -142,16 +133,18 @@ def send_message(current_user, room_id):
         if not content:
             return jsonify({'error': 'Message content cannot be empty'}), 400
         
-        message = ChatMessage.create(
+        result = Chat.send_message(
             room_id=room_id,
             sender_id=current_user['id'],
             content=content
         )
+        if result is None:
+            return jsonify({'error': 'Not a participant of this room'}), 403
         
-        if message:
+        if result['message']:
             return jsonify({
                 'success': True,
-                'message': message
+                'message': result['message']
             }), 201
         else:
             return jsonify({'error': 'Failed to create message'}), 500
@@ -159,4 +152,3 @@ def send_message(current_user, room_id):
     except Exception as e:
         print(f"Error in send_message: {str(e)}")
         return jsonify({'error': str(e)}), 500
-
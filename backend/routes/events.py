@@ -1,13 +1,17 @@
 from flask import Blueprint, request, jsonify
-from models.event import Event
+from models.event import Event, EVENT_LIST_FIELDS
+from models.geo import Gazetteer, parse_coordinates, DEFAULT_RADIUS_KM, MAX_RADIUS_KM
 from models.auth import token_required, get_current_user, verify_token
-from datetime import datetime
+from models.http_cache import conditional
+from datetime import datetime, timedelta
 import logging
 
 events_routes = Blueprint('events', __name__)
 
 logger = logging.getLogger(__name__)
 
+CALENDAR_MAX_DAYS = 366
+
 @events_routes.route('/', methods=['GET'])
 def get_events():
     try:
@@ -16,6 +20,24 @@ def get_events():
         search = request.args.get('search')
         location = request.args.get('location')
         start_date = request.args.get('start_date')
+        near = request.args.get('near')
+        radius = request.args.get('radius', DEFAULT_RADIUS_KM, type=float)
+        fields = request.args.get('fields')
+        
+        try:
+            EVENT_LIST_FIELDS.parse(fields)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if near:
+            # near=latitude,longitude or a place name known to the gazetteer
+            place = parse_coordinates(near) or Gazetteer.geocode(near)
+            if not place:
+                return jsonify({'error': 'Invalid near. Use near=latitude,longitude or a known place name'}), 400
+            near = place if isinstance(place, tuple) else (place['latitude'], place['longitude'])
+        
+        if not radius or radius <= 0 or radius > MAX_RADIUS_KM:
+            return jsonify({'error': f'radius must be between 0 and {MAX_RADIUS_KM} km'}), 400
         
         if start_date:
             try:
@@ -41,7 +63,10 @@ def get_events():
             search=search,
             location=location,
             start_date=start_date,
-            user_id=user_id
+            user_id=user_id,
+            near=near,
+            radius=radius,
+            fields=fields
         )
         
         return jsonify({
@@ -224,7 +249,91 @@ def unregister_from_event(current_user, event_id):
         logger.error(f"Error unregistering from event: {str(e)}")
         return jsonify({'error': 'Failed to unregister from event'}), 500
 
+def _optional_user_id():
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        try:
+            payload = verify_token(auth_header.split(' ')[1])
+            if payload and 'user_id' in payload:
+                return payload.get('user_id')
+        except Exception as e:
+            logger.error(f"Error decoding token: {str(e)}")
+    return None
+
+@events_routes.route('/calendar', methods=['GET'])
+def get_calendar():
+    try:
+        try:
+            date_from = datetime.strptime(request.args['from'], '%Y-%m-%d')
+            date_to = datetime.strptime(request.args['to'], '%Y-%m-%d') + timedelta(days=1)
+        except KeyError:
+            return jsonify({'error': 'from and to are required'}), 400
+        except ValueError:
+            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        
+        if date_to <= date_from:
+            return jsonify({'error': 'to must not be before from'}), 400
+        if (date_to - date_from).days > CALENDAR_MAX_DAYS:
+            return jsonify({'error': f'Date range cannot exceed {CALENDAR_MAX_DAYS} days'}), 400
+        
+        events = Event.get_calendar(
+            date_from,
+            date_to,
+            status=request.args.get('status', 'published'),
+            category=request.args.get('category'),
+            user_id=_optional_user_id()
+        )
+        
+        return jsonify({
+            'events': events,
+            'from': request.args['from'],
+            'to': request.args['to']
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e), 'events': []}), 500
+
+@events_routes.route('/calendar/month', methods=['GET'])
+def get_calendar_month():
+    try:
+        today = datetime.now()
+        year = request.args.get('year', today.year, type=int)
+        month = request.args.get('month', today.month, type=int)
+        
+        if not 1 <= month <= 12 or not 1 <= year <= 9998:
+            return jsonify({'error': 'Invalid year or month'}), 400
+        
+        days = Event.get_month_counts(
+            year,
+            month,
+            status=request.args.get('status', 'published'),
+            category=request.args.get('category')
+        )
+        
+        return jsonify({
+            'year': year,
+            'month': month,
+            'days': days
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@events_routes.route('/upcoming', methods=['GET'])
+def get_upcoming_events():
+    try:
+        limit = min(max(request.args.get('limit', 5, type=int), 1), 50)
+        
+        events = Event.get_upcoming(
+            limit=limit,
+            category=request.args.get('category'),
+            user_id=_optional_user_id()
+        )
+        
+        return jsonify({'events': events}), 200
+    except Exception as e:
+        return jsonify({'error': str(e), 'events': []}), 500
+
 @events_routes.route('/categories', methods=['GET'])
+@conditional('event_categories')
 def get_categories():
     try:
         categories = Event.get_categories()
@@ -261,7 +370,11 @@ def vote_for_event(current_user, event_id):
 @events_routes.route('/<int:event_id>/comments', methods=['GET'])
 def get_event_comments(event_id):
     try:
-        comments = Event.get_comments(event_id)
+        # ?threaded=1 pages root comments with nested replies; see the blog route.
+        threaded = request.args.get('threaded', '').lower() in ('1', 'true')
+        limit = request.args.get('limit', 20, type=int)
+        cursor = request.args.get('cursor')
+        comments = Event.get_comments(event_id, limit=limit, cursor=cursor, threaded=threaded)
         return jsonify(comments), 200
     except Exception as e:
         print(f"Error getting comments: {str(e)}")
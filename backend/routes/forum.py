@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from models.forum import Forum
 from models.auth import token_required, get_current_user
+from models.http_cache import conditional
 
 forum_routes = Blueprint('forum', __name__)
 
@@ -9,9 +10,13 @@ def get_discussions():
     try:
         page = request.args.get('page', 1, type=int)
         category = request.args.get('category')
+        cursor = request.args.get('cursor')
         
-        discussions = Forum.get_discussions(page=page, category=category)
-        return jsonify(discussions), 200
+        discussions = Forum.get_discussions(page=page, category=category, cursor=cursor)
+        response = jsonify(discussions)
+        if discussions['next_cursor']:
+            response.headers['X-Next-Cursor'] = discussions['next_cursor']
+        return response, 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -156,6 +161,7 @@ def unlike_reply(current_user, discussion_id, reply_id):
         return jsonify({'error': str(e)}), 500
 
 @forum_routes.route('/categories', methods=['GET'])
+@conditional('forum_categories')
 def get_categories():
     try:
         categories = Forum.get_categories()
@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from models.group import Group
+from models.group import Group, GROUP_LIST_FIELDS
 from models.auth import token_required, get_current_user
 from database.connection import Database
 import models.websockets as websockets
@@ -11,10 +11,17 @@ def get_groups():
     try:
         page = request.args.get('page', 1, type=int)
         search = request.args.get('search')
+        fields = request.args.get('fields')
+        
+        try:
+            GROUP_LIST_FIELDS.parse(fields)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         groups = Group.get_all(
             page=page,
-            search=search
+            search=search,
+            fields=fields
         )
         
         return jsonify(groups), 200
@@ -316,7 +323,7 @@ def send_chat_message(current_user, id):
                 'group_id': id,
                 'author_id': message['author_id'],
                 'author_name': message['author_name'],
-                'created_at': message['created_at'].isoformat() if message['created_at'] else None
+                'created_at': message['created_at']
             }
             websockets.socketio_instance.emit('group_chat_message', socket_message)
 
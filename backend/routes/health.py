@@ -0,0 +1,19 @@
+from flask import Blueprint, jsonify
+from database.replicas import replica_set
+from models.worker import Worker
+from routes.metrics import metrics_allowed
+
+health_routes = Blueprint('health', __name__)
+
+
+@health_routes.route('', methods=['GET'])
+def get_health():
+    # Liveness for load balancers: 503 once this worker is draining for a restart.
+    # Scrapers allowed to read /metrics also get this worker's and the cluster's status.
+    body = {'status': 'draining' if Worker.draining else 'ok'}
+    if metrics_allowed():
+        body['worker'] = Worker.status()
+        body['workers'] = Worker.cluster_status()
+        if replica_set.enabled:
+            body['db_replicas'] = replica_set.status()
+    return jsonify(body), 503 if Worker.draining else 200
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from models.learning import LearningResource, LearningComment
 from models.auth import token_required, get_current_user
+from models.http_cache import conditional
 from database.connection import Database
 from sqlalchemy import desc, func
 import re
@@ -14,11 +15,17 @@ def get_materials():
         category = request.args.get('category')
         type = request.args.get('type')
         search = request.args.get('search')
+        status = request.args.get('status')
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 50, type=int)
         
         result = LearningResource.get_all(
             category=category,
             type=type,
-            search=search
+            search=search,
+            status=status,
+            page=page,
+            per_page=per_page
         )
         
         if not result['success']:
@@ -30,6 +37,7 @@ def get_materials():
 
 
 @learning_routes.route('/<int:material_id>', methods=['GET'])
+@conditional('learning_material:{material_id}', per_user=True)
 def get_material(material_id):
     try:
         result = LearningResource.get_by_id(material_id)
@@ -41,6 +49,7 @@ def get_material(material_id):
         return jsonify({'error': str(e)}), 500
 
 @learning_routes.route('/categories', methods=['GET'])
+@conditional('learning_categories')
 def get_categories():
     try:
         content_type = request.args.get('content_type')
@@ -103,8 +112,12 @@ def get_comments(material_id):
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
+        cursor = request.args.get('cursor')
+        
+        current_user = get_current_user()
+        viewer_id = current_user['id'] if current_user else None
         
-        result = LearningComment.get_comments(material_id, page, per_page)
+        result = LearningComment.get_comments(material_id, page, per_page, cursor=cursor, viewer_id=viewer_id)
         if not result['success']:
             return jsonify({'error': result['error']}), 500
         return jsonify(result['data']), 200
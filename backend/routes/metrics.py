@@ -0,0 +1,28 @@
+from flask import Blueprint, request, jsonify, Response
+from models.metrics import REGISTRY, aggregated
+import ipaddress
+import os
+
+metrics_routes = Blueprint('metrics', __name__)
+
+# Scrapes are accepted from loopback, or from anywhere with this bearer token.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
+def metrics_allowed() -> bool:
+    auth_header = request.headers.get('Authorization', '')
+    if METRICS_TOKEN and auth_header == f'Bearer {METRICS_TOKEN}':
+        return True
+    try:
+        return ipaddress.ip_address(request.remote_addr or '').is_loopback
+    except ValueError:
+        return False
+
+
+@metrics_routes.route('', methods=['GET'])
+def get_metrics():
+    # Prometheus text exposition: the parent's sum over all workers when there is one
+    # (see models/metrics.py), else this process's metrics.
+    if not metrics_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    return Response(aggregated() or REGISTRY.render(), mimetype='text/plain; version=0.0.4')
@@ -10,15 +10,19 @@ def get_notifications(current_user):
     try:
         page = request.args.get('page', 1, type=int)
         limit = request.args.get('limit', 10, type=int)
+        cursor = request.args.get('cursor')
         
         result = Notification.get_all(
             user_id=current_user['id'],
             page=page,
-            limit=limit
+            limit=limit,
+            cursor=cursor
         )
         
         # Add CORS headers
         response = jsonify(result)
+        if result['next_cursor']:
+            response.headers['X-Next-Cursor'] = result['next_cursor']
         response.headers.add('Access-Control-Allow-Origin', '*')
         response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
         response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
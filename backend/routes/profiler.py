@@ -0,0 +1,75 @@
+from flask import Blueprint, request, jsonify, Response
+from models.auth import admin_required
+from models.profiler import Profiler, HeapSnapshots
+
+profiler_routes = Blueprint('profiler', __name__)
+
+@profiler_routes.route('/', methods=['GET'])
+@admin_required
+def get_status(current_user):
+    return jsonify(Profiler.status()), 200
+
+@profiler_routes.route('/profiles', methods=['GET'])
+@admin_required
+def list_profiles(current_user):
+    return jsonify({'profiles': Profiler.list()}), 200
+
+@profiler_routes.route('/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def get_profile(current_user, profile_id):
+    # Collapsed stacks, ready for flamegraph.pl or speedscope.
+    profile = Profiler.get(profile_id)
+    if not profile:
+        return jsonify({'error': 'Profile not found'}), 404
+    if request.args.get('format') == 'json':
+        return jsonify({**profile.summary(), 'stacks': dict(profile.stacks.most_common())}), 200
+    return Response(profile.collapsed(), mimetype='text/plain')
+
+@profiler_routes.route('/window', methods=['POST'])
+@admin_required
+def start_window(current_user):
+    # Sample requests for a time window: {"seconds": 60, "rate": 0.1}
+    data = request.get_json(silent=True) or {}
+    try:
+        window = Profiler.start_window(data.get('seconds', 60), data.get('rate', 1.0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'seconds and rate must be numbers'}), 400
+    return jsonify(window), 201
+
+@profiler_routes.route('/window', methods=['DELETE'])
+@admin_required
+def stop_window(current_user):
+    Profiler.stop_window()
+    return jsonify({'success': True}), 200
+
+@profiler_routes.route('/heap', methods=['POST'])
+@admin_required
+def start_heap_tracing(current_user):
+    HeapSnapshots.start()
+    return jsonify(HeapSnapshots.status()), 200
+
+@profiler_routes.route('/heap', methods=['DELETE'])
+@admin_required
+def stop_heap_tracing(current_user):
+    HeapSnapshots.stop()
+    return jsonify(HeapSnapshots.status()), 200
+
+@profiler_routes.route('/heap/snapshots', methods=['POST'])
+@admin_required
+def take_heap_snapshot(current_user):
+    try:
+        return jsonify(HeapSnapshots.take(request.args.get('limit', 25, type=int))), 201
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+
+@profiler_routes.route('/heap/diff', methods=['GET'])
+@admin_required
+def diff_heap_snapshots(current_user):
+    # Allocation growth between two snapshots of one worker: ?from=4211-1&to=4211-2
+    try:
+        result = HeapSnapshots.diff(request.args.get('from'), request.args.get('to'), request.args.get('limit', 25, type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    if not result:
+        return jsonify({'error': 'Snapshot not found'}), 404
+    return jsonify(result), 200
@@ -0,0 +1,33 @@
+import os
+
+from models import metrics
+
+
+def test_aggregator_sums_workers_and_keeps_exited_counters(tmp_path, monkeypatch):
+    snapshot_dir = str(tmp_path / 'snapshots')
+    output_file = str(tmp_path / 'metrics.prom')
+    monkeypatch.setattr(metrics, 'METRICS_SNAPSHOT_DIR', snapshot_dir)
+    aggregator = metrics.MetricsAggregator(snapshot_dir, output_file)
+    counter = metrics.Counter('aggregation_test_total', 'Test counter.', ('kind',))
+    gauge = metrics.Gauge('aggregation_test_gauge', 'Test gauge.')
+
+    # A worker that has already exited, and this process as a live one.
+    pid = os.fork()
+    if pid == 0:
+        counter.labels('a').inc(2)
+        gauge.set(5)
+        metrics.write_snapshot()
+        os._exit(0)
+    os.waitpid(pid, 0)
+    counter.labels('a').inc(3)
+    gauge.set(1)
+    metrics.write_snapshot()
+
+    for _ in range(2):
+        aggregator.collect()
+        with open(output_file) as f:
+            lines = [line for line in f.read().splitlines() if line.startswith('aggregation_test')]
+        assert lines == ['aggregation_test_total{kind="a"} 5', 'aggregation_test_gauge 1']
+
+    aggregator.close()
+    assert not os.path.exists(snapshot_dir)
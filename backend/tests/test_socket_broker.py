@@ -0,0 +1,65 @@
+import queue
+import threading
+
+import pytest
+import socketio
+
+from models import socket_broker
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    monkeypatch.setenv('SOCKETIO_BROKER_TOKEN', 'test-token')
+    server = socket_broker.BrokerServer(('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"broker://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _server(url):
+    manager = socket_broker.BrokerManager(url)
+    socketio.Server(async_mode='threading', client_manager=manager)
+    # The server does this on its first connection; start the listener now.
+    manager.initialize()
+    return manager
+
+
+def test_emit_reaches_other_manager(broker):
+    sender = _server(broker)
+    receiver = _server(broker)
+    received = queue.Queue()
+    receiver._handle_emit = received.put
+
+    # The subscriber connects in the background; publish until it is listening.
+    for _ in range(50):
+        sender.emit('new_message', {'content': 'hello'}, namespace='/', room='room_1')
+        try:
+            message = received.get(timeout=0.1)
+            break
+        except queue.Empty:
+            continue
+    else:
+        pytest.fail('message was not delivered through the broker')
+
+    assert message['method'] == 'emit'
+    assert message['event'] == 'new_message'
+    assert message['data'] == [{'content': 'hello'}]
+    assert message['room'] == 'room_1'
+
+
+def test_wrong_token_is_refused(broker, monkeypatch):
+    monkeypatch.setenv('SOCKETIO_BROKER_TOKEN', 'other-token')
+    sock = socket_broker._connect(broker, 'socketio', 'subscribe')
+    try:
+        sock.settimeout(2)
+        assert sock.recv(1) == b''
+    finally:
+        sock.close()
+
+
+def test_token_is_required(monkeypatch):
+    monkeypatch.delenv('SOCKETIO_BROKER_TOKEN', raising=False)
+    with pytest.raises(RuntimeError):
+        socket_broker.broker_token()
@@ -84,11 +84,15 @@ export async function POST(request: Request) {
     
         
     try {
+      // The backend limits attempts per client IP (TRUSTED_PROXY_HOPS), so pass on the
+      // address chain this server received, which ends with the caller's address.
+      const forwardedFor = request.headers.get('x-forwarded-for')
       const response = await fetch(`${process.env.NEXT_PUBLIC_BACKEND_URL}/auth/register`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'Accept': 'application/json'
+          'Accept': 'application/json',
+          ...(forwardedFor ? { 'X-Forwarded-For': forwardedFor } : {})
         },
         body: JSON.stringify(body),
         credentials: 'include'
@@ -8,6 +8,8 @@ export async function GET(request: Request) {
     const search = searchParams.get('search')
     const location = searchParams.get('location')
     const start_date = searchParams.get('start_date')
+    const near = searchParams.get('near')
+    const radius = searchParams.get('radius')
 
     const authHeader = request.headers.get('Authorization')
     
@@ -17,6 +19,8 @@ export async function GET(request: Request) {
     if (search) queryParams.append('search', search)
     if (location) queryParams.append('location', location)
     if (start_date) queryParams.append('start_date', start_date)
+    if (near) queryParams.append('near', near)
+    if (radius) queryParams.append('radius', radius)
 
     const queryString = queryParams.toString()
     const url = `${process.env.NEXT_PUBLIC_BACKEND_URL}/events${queryString ? `?${queryString}` : ''}`